@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Backfills the full ranked matchlists of many summoners into the match store and matchup index
+
+Run from src/:
+  python backfill.py summoners.txt                        # one region,summoner pair per line
+  python backfill.py --summoner na1 Doublelift --workers 4
+
+Matches are requested by a pool of threads under the shared rate limits at batch priority, then decoded
+and stored by a pool of processes. Progress is checkpointed after every matchlist page, running the same
+command again resumes an interrupted backfill, and already stored games are never requested again.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from rate_limiter import BATCH
+from riot_endpoints import Wrapper, MATCHLIST_PAGE
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def StoreMatch(region, body):
+  """
+  Decodes a raw MatchV4 match and adds it to the match store and matchup index, run in the decoder processes
+
+  Returns
+    gameId of the stored match
+  """
+  from match_decoder import DecodeMatch
+  from match_store import GetMatchStore
+  from matchup_index import GetMatchupIndex
+
+  match = DecodeMatch(body)
+  GetMatchStore().Put(region, match)
+  GetMatchupIndex().Add(region, match)
+  return match.game_id
+
+def ReadSummoners(path):
+  """
+  Returns
+    list of (region, summoner) from a file of region,summoner lines, blank lines and lines starting with # are skipped
+  """
+  summoners = []
+  with open(path, encoding='utf-8') as f:
+    for line in f:
+      line = line.strip()
+      if not line or line.startswith('#'):
+        continue
+      region, summoner = line.split(',', 1)
+      summoners.append((region.strip(), summoner.strip()))
+  return summoners
+
+
+class Backfill():
+  """
+  Resumable backfill of the full matchlists of a list of summoners
+
+  Counters 'backfill_games', 'backfill_skipped' and 'backfill_failures' are kept in metrics
+
+  Functions
+  ---------
+  Run()
+    Backfills every summoner not finished yet, returns the number of games stored
+  Progress()
+    Returns the games stored, the rate and the estimated time left
+  """
+  def __init__(self, summoners, checkpoint='backfill_checkpoint.json', workers=None, concurrency=8, max_games=None):
+    """
+    Arguments
+    ---------
+    summoners : list
+      (region, summoner) pairs
+    checkpoint : str
+      json file the progress of every summoner is kept in
+    workers : int
+      number of decoder processes, defaults to the number of cpus
+    concurrency : int
+      number of match details requested at the same time
+    max_games : int
+      most matchlist games backfilled per summoner, None for the whole matchlist
+
+    Attributes
+    -----------
+    self.state : dict
+      'region/summoner' -> {'begin_index', 'total', 'stored', 'done', 'status'}, saved to the checkpoint
+    """
+    self.summoners = summoners
+    self.checkpoint = checkpoint
+    self.workers = workers or os.cpu_count() or 1
+    self.concurrency = concurrency
+    self.max_games = max_games
+    self.state = {}
+    if os.path.exists(checkpoint):
+      with open(checkpoint) as f:
+        self.state = json.load(f)
+    self.lock = threading.Lock()
+    self.stored = 0
+    self.start = None
+
+  def _Key(self, region, summoner):
+    return f'{region}/{summoner}'
+
+  def _Save(self):
+    with self.lock:
+      state = json.dumps(self.state, indent=2)
+    tmp = self.checkpoint + '.tmp'
+    with open(tmp, 'w') as f:
+      f.write(state)
+    os.replace(tmp, self.checkpoint)
+
+  def _Fetch(self, info, decoders, game_id):
+    status, body = info.Request(f'/lol/match/v4/matches/{game_id}', 'match', decode=False)
+    if status != 200:
+      return status
+    decoders.submit(StoreMatch, info.region, body).result()
+    with self.lock:
+      self.stored += 1
+    metrics.Increment('backfill_games')
+    return status
+
+  def _Summoner(self, region, summoner, fetchers, decoders):
+    """
+    Backfills one summoner from its checkpointed matchlist page on
+
+    Returns
+      bool, True if its matchlist was read to the end
+    """
+    key = self._Key(region, summoner)
+    with self.lock:
+      state = self.state.setdefault(key, {'begin_index': 0, 'total': None, 'stored': 0, 'done': False, 'status': None})
+
+    info = Wrapper(region, summoner, None, None, concurrency=self.concurrency, priority=BATCH)
+    info.SummonerData()
+    if info.status != 200:
+      # unknown summoners and invalid regions will not succeed on a retry
+      with self.lock:
+        state.update(status=info.status, done=info.status in (400, 404))
+      return state['done']
+
+    while self.max_games is None or state['begin_index'] < self.max_games:
+      page = info.MatchList(state['begin_index'])
+      # MatchV4 answers 404 past the end of the matchlist
+      if info.status == 404:
+        break
+      if info.status != 200:
+        with self.lock:
+          state['status'] = info.status
+        return False
+
+      game_ids = [m['gameId'] for m in page['matches']]
+      if self.max_games is not None:
+        game_ids = game_ids[:self.max_games - state['begin_index']]
+      indexed = info.index.Indexed(region, game_ids)
+      metrics.Increment('backfill_skipped', len(indexed))
+
+      statuses = list(fetchers.map(lambda game_id: self._Fetch(info, decoders, game_id),
+                                   [game_id for game_id in game_ids if game_id not in indexed]))
+      failed = [status for status in statuses if status != 200]
+      if failed:
+        metrics.Increment('backfill_failures', len(failed))
+        with self.lock:
+          state['status'] = failed[0]
+        return False
+
+      with self.lock:
+        state['begin_index'] += len(game_ids)
+        state['stored'] += len(statuses)
+        state['total'] = page.get('totalGames', state['total'])
+        state['status'] = 200
+      self._Save()
+
+      if len(page['matches']) < MATCHLIST_PAGE:
+        break
+
+    with self.lock:
+      state['done'] = True
+      state['status'] = 200
+    return True
+
+  def Progress(self):
+    """
+    Returns
+      dict of games stored by this run, games per second, summoners done and the estimated games and seconds left
+    """
+    with self.lock:
+      elapsed = time.monotonic() - self.start if self.start else 0
+      rate = self.stored / elapsed if elapsed else 0
+      states = [self.state.get(self._Key(*pair)) for pair in self.summoners]
+      started = [s for s in states if s is not None and s['total'] is not None]
+      totals = [s['total'] if self.max_games is None else min(s['total'], self.max_games) for s in started]
+      done = sum(1 for s in states if s is not None and s['done'])
+      left = sum(max(0, total - s['begin_index']) for s, total in zip(started, totals) if not s['done'])
+      # summoners not started yet are assumed to have as many games as the average started one
+      unknown = sum(1 for s in states if s is None or (s['total'] is None and not s['done']))
+      if started:
+        left += unknown * sum(totals) / len(totals)
+    return {'stored': self.stored, 'rate': rate, 'done': done, 'summoners': len(self.summoners),
+            'left': int(left), 'eta': left / rate if rate else None}
+
+  def _Report(self, interval, stopped):
+    while not stopped.wait(interval):
+      progress = self.Progress()
+      eta = '?' if progress['eta'] is None else time.strftime('%H:%M:%S', time.gmtime(progress['eta']))
+      logger.info('%s games stored, %.1f games/s, %s/%s summoners done, ~%s games left, eta %s',
+                  progress['stored'], progress['rate'], progress['done'], progress['summoners'], progress['left'], eta)
+
+  def Run(self, report=10):
+    """
+    Arguments
+    ---------
+    report : float
+      seconds between two progress reports
+
+    Returns
+      int, number of games stored by this run
+    """
+    self.start = time.monotonic()
+    stopped = threading.Event()
+    reporter = threading.Thread(target=self._Report, args=(report, stopped), name='backfill-report', daemon=True)
+    reporter.start()
+
+    # decoder processes are spawned so none inherits the sqlite connections of this one
+    context = multiprocessing.get_context('spawn')
+    try:
+      with ThreadPoolExecutor(max_workers=self.concurrency) as fetchers, \
+           ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as decoders:
+        for region, summoner in self.summoners:
+          key = self._Key(region, summoner)
+          if self.state.get(key, {}).get('done'):
+            continue
+          if not self._Summoner(region, summoner, fetchers, decoders):
+            logger.warning('Backfill of %s stopped with status code %s, it resumes on the next run', key, self.state[key]['status'])
+          self._Save()
+    finally:
+      stopped.set()
+      self._Save()
+
+    progress = self.Progress()
+    logger.info('Backfill finished, %s games stored at %.1f games/s, %s/%s summoners done',
+                progress['stored'], progress['rate'], progress['done'], progress['summoners'])
+    return self.stored
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Backfill the full matchlists of many summoners into the match store')
+  parser.add_argument('summoners', nargs='?', help='file of region,summoner lines')
+  parser.add_argument('--summoner', nargs=2, action='append', default=[], metavar=('REGION', 'SUMMONER'),
+                      help='add a summoner to backfill')
+  parser.add_argument('--checkpoint', default='backfill_checkpoint.json', help='progress file, resumed from if it exists')
+  parser.add_argument('--workers', type=int, help='decoder processes, defaults to the number of cpus')
+  parser.add_argument('--concurrency', type=int, default=8, help='match details requested at the same time')
+  parser.add_argument('--max-games', type=int, help='most games backfilled per summoner')
+  parser.add_argument('--report', type=float, default=10, help='seconds between two progress reports')
+  args = parser.parse_args()
+
+  logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'), format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+  summoners = (ReadSummoners(args.summoners) if args.summoners else []) + [tuple(pair) for pair in args.summoner]
+  if not summoners:
+    parser.error('no summoners given')
+
+  Backfill(summoners, args.checkpoint, args.workers, args.concurrency, args.max_games).Run(args.report)
+
+if __name__ == '__main__':
+  main()
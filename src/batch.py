@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from rate_limiter import BATCH
+from riot_endpoints import Wrapper, MATCHLIST_PAGE
+from summoner_cache import NormalizeName
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Batch():
+  """
+  Breaks down many (region, summoner, champion, enemy_champion) queries at once, requesting each summoner,
+  matchlist and match only once however many queries need it
+
+  Counters 'batch_queries', 'batch_summoners', 'batch_matchlists' and 'batch_games' and the 'batch' timing are kept in metrics
+
+  Functions
+  ---------
+  Run()
+    Plans and runs the batch, returns the result of every query in order
+  """
+  def __init__(self, queries, concurrency=8, max_scan=50, priority=BATCH, **options):
+    """
+    Arguments
+    ---------
+    queries : list
+      (region, summoner, champion, enemy_champion) tuples
+    concurrency : int
+      number of match details requested at the same time for the whole batch
+    max_scan : int
+      maximum number of matchlist games scanned per query
+    priority : str
+      priority class of the requests, rate_limiter.BATCH unless an interactive caller waits on the result
+    options : dict
+      further Wrapper() keyword arguments applied to every query, eg begin_index or begin_time
+
+    Attributes
+    -----------
+    self.wrappers : list
+      one Wrapper per query, holding its summoner, matchlist and status
+    """
+    self.concurrency = max(1, int(concurrency))
+    self.max_scan = max_scan
+    self.wrappers = [Wrapper(region, summoner, champion, enemy_champion, concurrency=concurrency, max_scan=max_scan,
+                             priority=priority, **options)
+                     for region, summoner, champion, enemy_champion in queries]
+
+  def _Summoners(self):
+    """
+    Looks every distinct summoner up once, the other queries of a summoner are answered from the summoner cache
+    """
+    looked_up = {}
+    for info in self.wrappers:
+      key = (info.region, NormalizeName(info.summoner))
+      status = looked_up.get(key)
+      # failures other than unknown names are not cached, they are shared instead of retried
+      if status is None or status in (200, 404):
+        info.SummonerData()
+        if status is None:
+          looked_up[key] = info.status
+      else:
+        info.status = status
+    metrics.Increment('batch_summoners', len(looked_up))
+
+  def _GameIds(self, info):
+    """
+    Returns
+      the first max_scan gameIds of the matchlist of a query, newest first, None if a request failed
+    """
+    match_info = info.SyncMatchList() if info.incremental else info.MatchList(info.begin_index)
+    if info.status != 200:
+      return None
+
+    game_ids = [m['gameId'] for m in match_info['matches']]
+    begin_index = match_info.get('endIndex', info.begin_index + len(game_ids))
+    exhausted = match_info.get('exhausted', len(match_info['matches']) < MATCHLIST_PAGE)
+    while (len(game_ids) < self.max_scan and not exhausted
+           and (info.end_index is None or begin_index < info.end_index)):
+      match_info = info.MatchList(begin_index)
+      if info.status != 200:
+        return None
+      page = [m['gameId'] for m in match_info['matches']]
+      if info.incremental:
+        info.sync.Extend(info.sync_key, begin_index, page, len(page) < MATCHLIST_PAGE)
+      game_ids.extend(page)
+      begin_index += len(page)
+      exhausted = not page or len(page) < MATCHLIST_PAGE
+    return game_ids[:self.max_scan]
+
+  def _MatchLists(self):
+    """
+    Requests every distinct (region, account, champion) matchlist once
+
+    Returns
+      list of the gameIds each query still needs broken down, None for the failed queries
+    """
+    matchlists = {}
+    candidates = []
+    for info in self.wrappers:
+      if info.status != 200:
+        candidates.append(None)
+        continue
+
+      key = (info.region, info.account_id, info.champion_id)
+      if key not in matchlists:
+        matchlists[key] = (self._GameIds(info), info.status)
+      game_ids, status = matchlists[key]
+      info.status = status
+      if game_ids is None:
+        candidates.append(None)
+        continue
+
+      info.scanned = len(game_ids)
+      candidates.append(info.Candidates(game_ids))
+
+    metrics.Increment('batch_matchlists', len(matchlists))
+    return candidates
+
+  def Run(self):
+    """
+    Returns
+      list, for every query its dict of match details as MatchBreakdown() returns them, or its failed status code
+    """
+    metrics.Increment('batch_queries', len(self.wrappers))
+    with metrics.Timer('batch'):
+      self._Summoners()
+      candidates = self._MatchLists()
+
+      # the union of the games every query needs, each requested once per region
+      fetchers = OrderedDict()
+      for info, game_ids in zip(self.wrappers, candidates):
+        for game_id in game_ids or ():
+          fetchers.setdefault((info.region, game_id), info)
+      metrics.Increment('batch_games', len(fetchers))
+
+      with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+        futures = {key: executor.submit(info.MatchDetails, key[1]) for key, info in fetchers.items()}
+        matches = {key: future.result() for key, future in futures.items()}
+
+      results = []
+      for info, game_ids in zip(self.wrappers, candidates):
+        if game_ids is None:
+          results.append(info.status)
+          continue
+
+        match_dict = OrderedDict()
+        for game_id in game_ids:
+          status, match = matches[(info.region, game_id)]
+          if status != 200:
+            info.status = status
+            break
+          matchup = info.ParseMatch(match)
+          if matchup is not None:
+            match_dict.update(matchup.ToJson())
+        results.append(match_dict if info.status == 200 else info.status)
+
+    logger.info('Finished batch of %s queries, %s games broken down', len(self.wrappers), len(fetchers))
+    return results
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the per-match hot loop, run from src/
+
+  python benchmarks/bench_decoder.py [matches]
+
+Compares the previous MatchBreakdown loop (response.json() per field, throwaway dicts and str() lookups)
+with match_decoder.DecodeMatch() + Matchup.ToJson(), reporting CPU time and allocations per match.
+"""
+
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from match_decoder import DecodeMatch, Matchup, Loads
+from static_files.perks_dict import perks_dict
+from static_files.items_dict import items_dict
+from static_files.champions_dict import champions_inv
+from static_files.runes_dict import runes_dict
+from static_files.summoners_dict import summoners_dict
+
+CHAMPION_ID = 122
+ENEMY_CHAMPION_ID = 86
+
+def SyntheticMatch(game_id, rnd):
+  """
+  Builds a match body shaped like MatchV4, including the fields the decoder skips
+  """
+  pool = [c for c in champions_inv if isinstance(c, int) and c not in (CHAMPION_ID, ENEMY_CHAMPION_ID)]
+  picks = rnd.sample(pool, 10)
+  picks[0] = CHAMPION_ID
+  if game_id % 2:
+    picks[5] = ENEMY_CHAMPION_ID
+
+  items = [int(k) for k in items_dict]
+  runes = [int(k) for k in runes_dict]
+  participants = []
+  for i, champion_id in enumerate(picks):
+    stats = {f'item{n}': rnd.choice(items) for n in range(7)}
+    stats.update({f'perk{n}': rnd.choice(runes) for n in range(6)})
+    stats.update({f'perk{n}Var{v}': rnd.randint(0, 3000) for n in range(6) for v in range(1, 4)})
+    stats.update({f'statPerk{n}': rnd.choice(list(perks_dict)) for n in range(3)})
+    stats.update({'participantId': i + 1, 'win': i < 5, 'kills': rnd.randint(0, 20),
+                  'deaths': rnd.randint(0, 20), 'assists': rnd.randint(0, 20)})
+    stats.update({f'stat{n}': rnd.randint(0, 100000) for n in range(60)})
+    participants.append({
+      'participantId': i + 1, 'teamId': 100 if i < 5 else 200, 'championId': champion_id,
+      'spell1Id': 4, 'spell2Id': rnd.choice(list(summoners_dict)), 'stats': stats,
+      'timeline': {'participantId': i + 1, 'role': 'SOLO', 'lane': 'TOP',
+                   'creepsPerMinDeltas': {'0-10': 7.1, '10-20': 8.2}, 'xpPerMinDeltas': {'0-10': 400.5}},
+    })
+
+  identities = [{'participantId': i + 1, 'player': {
+    'platformId': 'NA1', 'accountId': f'account-{game_id}-{i}', 'summonerName': f'player{i}',
+    'summonerId': f'summoner-{i}', 'currentAccountId': f'account-{game_id}-{i}', 'profileIcon': 4000}} for i in range(10)]
+
+  return json.dumps({
+    'gameId': game_id, 'platformId': 'NA1', 'gameCreation': 1590000000000 + game_id, 'gameDuration': 1800,
+    'queueId': 420, 'mapId': 11, 'seasonId': 13, 'gameVersion': '10.10.322.4670', 'gameMode': 'CLASSIC',
+    'gameType': 'MATCHED_GAME', 'teams': [{'teamId': 100, 'win': 'Win', 'bans': []}, {'teamId': 200, 'win': 'Fail', 'bans': []}],
+    'participants': participants, 'participantIdentities': identities,
+  }).encode()
+
+def Before(body):
+  """
+  The MatchBreakdown loop before match_decoder, response.json() being a json.loads of the body
+  """
+  game_id = json.loads(body)['gameId']
+  date = json.loads(body)['gameCreation']/1000
+  gameVersion = json.loads(body)['gameVersion']
+
+  champion_dict = {}
+  data = json.loads(body)['participants']
+  usernames = json.loads(body)['participantIdentities']
+  for x in json.loads(body)['participants']:
+    champion_dict.update({x['championId']: [x['teamId'], x['participantId']]})
+
+  if CHAMPION_ID in champion_dict and ENEMY_CHAMPION_ID in champion_dict and champion_dict[CHAMPION_ID][0] != champion_dict[ENEMY_CHAMPION_ID][0]:
+    participants = {participant['championId']: participant for participant in data}
+    participants_identities = {participant['participantId']: participant['player']['summonerName'] for participant in usernames}
+    out = {'gameId': game_id, 'date': date, 'gameVersion': gameVersion}
+    for champion_id in (CHAMPION_ID, ENEMY_CHAMPION_ID):
+      d = participants[champion_id]['stats']
+      info = {
+        'username': participants_identities[participants[champion_id]['participantId']],
+        'teamId': participants[champion_id]['teamId'], 'win': d['win'], 'kills': d['kills'],
+        'deaths': d['deaths'], 'assists': d['assists'], 'championId': champion_id,
+        'spell1': summoners_dict.get(participants[champion_id]['spell1Id']),
+        'spell2': summoners_dict.get(participants[champion_id]['spell2Id']),
+      }
+      for n in range(7):
+        info[f'item{n}'] = items_dict.get(str(d[f'item{n}']))
+      for n in range(6):
+        info[f'perk{n}'] = runes_dict.get(str(d[f'perk{n}']))
+      for n in range(3):
+        info[f'statPerk{n}'] = perks_dict.get(d[f'statPerk{n}']) if f'statPerk{n}' in d else ""
+      out[champions_inv.get(champion_id)] = info
+    return {game_id: out}
+  return None
+
+def After(body):
+  match = DecodeMatch(body)
+  player = match.Find(CHAMPION_ID)
+  enemy = match.Find(ENEMY_CHAMPION_ID)
+  if player is not None and enemy is not None and player.team_id != enemy.team_id:
+    return Matchup(match, player, enemy).ToJson()
+  return None
+
+def Measure(fn, bodies):
+  start = time.process_time()
+  for body in bodies:
+    fn(body)
+  cpu = (time.process_time() - start) / len(bodies)
+
+  # peak memory allocated while handling a single match, averaged
+  peaks = 0
+  tracemalloc.start()
+  for body in bodies[:200]:
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    fn(body)
+    peaks += tracemalloc.get_traced_memory()[1] - base
+  tracemalloc.stop()
+  return cpu, peaks / min(len(bodies), 200)
+
+def main():
+  count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+  rnd = random.Random(0)
+  bodies = [SyntheticMatch(game_id, rnd) for game_id in range(count)]
+  print(f'{count} matches of {sum(map(len, bodies)) // count} bytes, json backend {Loads.__module__}')
+
+  for name, fn in (('before', Before), ('after', After)):
+    cpu, peak = Measure(fn, bodies)
+    print(f'{name:>7}: {cpu * 1e6:8.1f} us cpu/match, {peak / 1024:8.1f} KiB peak allocated/match')
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of Wrapper.MatchBreakdown() / RiotCall against benchmarks/fake_riot_api.py, run from src/
+
+  python benchmarks/bench_pipeline.py --levels 1,4,16 --queries 32 --latency 0.03 --app-limit 500:10,30000:600
+  python benchmarks/bench_pipeline.py --target riotcall
+
+For each concurrency level a cold pass (unseen summoners) and a warm pass (the same queries again) are run,
+reporting p50/p99 latency per query, match requests per second, rate limiter sleep, 429s and peak memory.
+Nothing is sent to Riot, the match store and caches live in a temporary directory.
+"""
+
+import argparse
+import importlib.util
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC)
+
+from benchmarks.fake_riot_api import Serve, World
+
+MATCHUPS = (('Darius', 'Garen'), ('Garen', 'Darius'), ('Fiora', 'Jax'), ('Riven', 'Renekton'), ('Sett', 'Darius'))
+
+def Percentile(values, percent):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
+
+def main():
+  parser = argparse.ArgumentParser(description='Offline benchmark of the Wrapper pipeline')
+  parser.add_argument('--target', choices=('wrapper', 'riotcall'), default='wrapper')
+  parser.add_argument('--levels', default='1,4,16', help='comma separated numbers of concurrent queries')
+  parser.add_argument('--queries', type=int, default=16, help='queries per pass')
+  parser.add_argument('--concurrency', type=int, default=8, help='Wrapper(concurrency=) of every query')
+  parser.add_argument('--max-scan', type=int, default=50)
+  parser.add_argument('--latency', type=float, default=0.03, help='mean seconds the fake api adds to a response')
+  parser.add_argument('--jitter', type=float, default=0.005)
+  parser.add_argument('--app-limit', default='500:10,30000:600', help='rate limit the fake api enforces')
+  parser.add_argument('--method-limit', default='2000:60')
+  parser.add_argument('--keys', type=int, default=1, help='number of api keys, the fake api limits each one separately')
+  args = parser.parse_args()
+
+  server, base = Serve(world=World(), latency=args.latency, jitter=args.jitter,
+                       app_limits=args.app_limit, method_limits=args.method_limit)
+  workdir = tempfile.mkdtemp(prefix='spoofhelper-bench-')
+  os.chdir(workdir)
+  os.environ.update({'RIOT_API_BASE': base, 'API_KEYS': ','.join(f'bench{i}' for i in range(args.keys)), 'MATCH_STORE': os.path.join(workdir, 'match_store.db')})
+
+  # imported only now so every cache is created inside workdir
+  from riot_endpoints import Wrapper
+  from scheduler import GetScheduler
+  scheduler = GetScheduler('na1')
+
+  if args.target == 'riotcall':
+    spec = importlib.util.spec_from_file_location('rest_server', os.path.join(SRC, 'rest-server.py'))
+    rest_server = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(rest_server)
+    client = rest_server.app.test_client()
+
+  def Query(name, champion, enemy_champion):
+    start = time.perf_counter()
+    if args.target == 'riotcall':
+      response = client.get(f'/na1/username={name}&champion={champion}&enemy_champion={enemy_champion}'
+                            f'?concurrency={args.concurrency}&max_scan={args.max_scan}')
+      ok = response.status_code == 200
+    else:
+      ok = not isinstance(Wrapper('na1', name, champion, enemy_champion, concurrency=args.concurrency,
+                                  max_scan=args.max_scan).MatchBreakdown(), int)
+    return time.perf_counter() - start, ok
+
+  print(f'target={args.target} queries/pass={args.queries} concurrency/query={args.concurrency} max_scan={args.max_scan} '
+        f'latency={args.latency}s app_limit={args.app_limit} keys={args.keys} workdir={workdir}')
+  print(f'{"level":>5} {"pass":>5} {"p50 s":>8} {"p99 s":>8} {"queries/s":>10} {"matches/s":>10} '
+        f'{"sleep s":>8} {"429s":>5} {"errors":>6} {"maxrss MiB":>10}')
+
+  for level in [int(level) for level in args.levels.split(',')]:
+    queries = [(f'bench {level} {i}',) + MATCHUPS[i % len(MATCHUPS)] for i in range(args.queries)]
+    for name in ('cold', 'warm'):
+      matches_before = server.requests.get('match', 0)
+      limited_before = server.rate_limited
+      waited_before = scheduler.waited
+      start = time.perf_counter()
+
+      with ThreadPoolExecutor(max_workers=level) as executor:
+        results = list(executor.map(lambda query: Query(*query), queries))
+
+      wall = time.perf_counter() - start
+      latencies = [latency for latency, _ in results]
+      errors = sum(1 for _, ok in results if not ok)
+      matches = server.requests.get('match', 0) - matches_before
+      rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+      print(f'{level:>5} {name:>5} {Percentile(latencies, 50):>8.3f} {Percentile(latencies, 99):>8.3f} '
+            f'{len(queries) / wall:>10.2f} {matches / wall:>10.1f} {scheduler.waited - waited_before:>8.2f} '
+            f'{server.rate_limited - limited_before:>5} {errors:>6} {rss:>10.1f}')
+
+  server.shutdown()
+
+if __name__ == '__main__':
+  main()
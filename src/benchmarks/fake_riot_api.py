@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the parts of Riot's api the Wrapper uses, SummonerV4 by-name, MatchV4 matchlists and matches
+
+Run from src/:
+  python benchmarks/fake_riot_api.py --port 8765 --latency 0.05 --app-limit 20:1,100:120
+  RIOT_API_BASE=http://127.0.0.1:8765/{region} python rest-server.py
+
+Every summoner name exists except names starting with 'unknown'. Summoners, matchlists and matches are
+synthetic and deterministic, or read from recorded responses with --fixtures DIR laid out as
+  DIR/summoners/<name>.json  DIR/matchlists/<accountId>.json  DIR/matches/<gameId>.json
+Rate limits are enforced per api key and region with Riot's fixed windows and headers, 429s carry Retry-After
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+# champions the synthetic games are drawn from, a small pool so most matchups show up often
+CHAMPION_POOL = (122, 86, 875, 24, 23, 39, 114, 58, 92, 516, 17, 266, 54, 36, 78, 420, 240, 126, 6, 14)
+GAMES_PER_ACCOUNT = 300
+FIRST_GAME = 1590000000000
+GAME_SPACING = 3600 * 1000
+
+def ParseLimits(value):
+  return [(int(count), int(seconds)) for count, seconds in (part.split(':') for part in value.split(',') if part)]
+
+
+class FixedWindows():
+  """
+  Riot style fixed windows, each starting with the first request after the previous one expired
+  """
+  def __init__(self, limits):
+    self.limits = limits
+    self.windows = {}
+    self.lock = threading.Lock()
+
+  def Hit(self, key):
+    """
+    Counts a request for key
+
+    Returns
+      counts header value, seconds to retry after or 0 if the request is allowed
+    """
+    now = time.monotonic()
+    retry_after = 0
+    with self.lock:
+      windows = self.windows.setdefault(key, {})
+      for limit, seconds in self.limits:
+        start, count = windows.get(seconds, (now, 0))
+        if now - start >= seconds:
+          start, count = now, 0
+        windows[seconds] = (start, count + 1)
+        if count + 1 > limit:
+          retry_after = max(retry_after, seconds - (now - start))
+      counts = ','.join(f'{windows[seconds][1]}:{seconds}' for _, seconds in self.limits)
+    return counts, retry_after
+
+
+class World():
+  """
+  Deterministic synthetic summoners, matchlists and matches, or recorded ones from a fixtures directory
+  """
+  def __init__(self, fixtures=None, games=GAMES_PER_ACCOUNT):
+    self.fixtures = fixtures
+    self.games = games
+
+  def Fixture(self, kind, name):
+    if self.fixtures is None:
+      return None
+    path = os.path.join(self.fixtures, kind, f'{name}.json')
+    if not os.path.exists(path):
+      return None
+    with open(path, 'rb') as f:
+      return f.read()
+
+  def Summoner(self, name):
+    body = self.Fixture('summoners', name)
+    if body is not None:
+      return json.loads(body)
+    if name.lower().startswith('unknown'):
+      return None
+    account = zlib.crc32(''.join(name.split()).casefold().encode()) % 100000
+    return {'id': f'summoner-{account}', 'accountId': f'account-{account}', 'puuid': f'puuid-{account}',
+            'name': name, 'profileIconId': 4000, 'revisionDate': FIRST_GAME, 'summonerLevel': 100}
+
+  def Champion(self, game_id):
+    """
+    Champion the owner of a synthetic game played in it
+    """
+    return CHAMPION_POOL[random.Random(game_id).randrange(len(CHAMPION_POOL))]
+
+  def Matchlist(self, account_id, champion=None, begin_index=0, end_index=None, begin_time=None):
+    body = self.Fixture('matchlists', account_id)
+    if body is not None:
+      matches = json.loads(body)['matches']
+    else:
+      account = int(account_id.rsplit('-', 1)[1])
+      # newest game first like Riot, gameIds encode the account they belong to
+      matches = [{'platformId': 'NA1', 'gameId': account * 100000 + i, 'champion': None, 'queue': 420, 'season': 13,
+                  'timestamp': FIRST_GAME + i * GAME_SPACING, 'role': 'SOLO', 'lane': 'TOP'}
+                 for i in range(self.games - 1, -1, -1)]
+      for match in matches:
+        match['champion'] = self.Champion(match['gameId'])
+
+    if champion is not None:
+      matches = [m for m in matches if m['champion'] == champion]
+    if begin_time is not None:
+      matches = [m for m in matches if m['timestamp'] >= begin_time]
+
+    total = len(matches)
+    end_index = min(end_index if end_index is not None else begin_index + 100, begin_index + 100)
+    matches = matches[begin_index:end_index]
+    return {'matches': matches, 'startIndex': begin_index, 'endIndex': begin_index + len(matches), 'totalGames': total}
+
+  def Match(self, game_id):
+    body = self.Fixture('matches', game_id)
+    if body is not None:
+      return body
+
+    # seeded apart from Champion(), whose stream would otherwise decide the first pick of the lineup and keep
+    # some champion pairs on the same team in every game
+    rnd = random.Random(f'{game_id}/match')
+    account = game_id // 100000
+    index = game_id % 100000
+    if index >= self.games:
+      return None
+
+    champion = self.Champion(game_id)
+    picks = [champion] + rnd.sample([c for c in CHAMPION_POOL if c != champion], 9)
+    participants = []
+    identities = []
+    for i, champion_id in enumerate(picks):
+      stats = {'participantId': i + 1, 'win': (i < 5) == (rnd.random() < 0.5), 'kills': rnd.randint(0, 15),
+               'deaths': rnd.randint(0, 15), 'assists': rnd.randint(0, 20)}
+      stats.update({f'item{n}': rnd.choice((0, 1001, 3047, 3071, 3078, 3742, 3065, 3748, 3053, 3340)) for n in range(7)})
+      stats.update({f'perk{n}': rnd.choice((8010, 8005, 8437, 8444, 9111, 9104, 8299, 8429, 8242, 8453)) for n in range(6)})
+      stats.update({f'statPerk{n}': rnd.choice((5005, 5008, 5002, 5003, 5001)) for n in range(3)})
+      stats.update({f'stat{n}': rnd.randint(0, 30000) for n in range(50)})
+      participants.append({'participantId': i + 1, 'teamId': 100 if i < 5 else 200, 'championId': champion_id,
+                           'spell1Id': 4, 'spell2Id': rnd.choice((12, 14, 6, 11, 3, 7, 21)), 'stats': stats,
+                           'timeline': {'participantId': i + 1, 'role': 'SOLO', 'lane': 'TOP'}})
+      account_id = f'account-{account}' if i == 0 else f'account-other-{game_id}-{i}'
+      identities.append({'participantId': i + 1, 'player': {'platformId': 'NA1', 'accountId': account_id,
+                         'summonerName': f'player {account}' if i == 0 else f'player {game_id}-{i}',
+                         'summonerId': f'summoner-{account_id}', 'profileIcon': 4000}})
+
+    return json.dumps({'gameId': game_id, 'platformId': 'NA1', 'gameCreation': FIRST_GAME + index * GAME_SPACING,
+                       'gameDuration': 1800, 'queueId': 420, 'mapId': 11, 'seasonId': 13, 'gameVersion': '10.10.322.4670',
+                       'gameMode': 'CLASSIC', 'gameType': 'MATCHED_GAME', 'teams': [], 'participants': participants,
+                       'participantIdentities': identities}).encode()
+
+
+ROUTES = (
+  ('summoner', re.compile(r'^/(?P<region>[^/]+)/lol/summoner/v4/summoners/by-name/(?P<name>[^/]+)$')),
+  ('matchlist', re.compile(r'^/(?P<region>[^/]+)/lol/match/v4/matchlists/by-account/(?P<account>[^/]+)$')),
+  ('match', re.compile(r'^/(?P<region>[^/]+)/lol/match/v4/matches/(?P<game_id>\d+)$')),
+)
+
+
+class FakeRiotApi(ThreadingHTTPServer):
+  """
+  Threaded http server answering /<region>/lol/... the way <region>.api.riotgames.com answers /lol/...
+
+  Attributes
+  -----------
+  self.requests : dict
+    method -> number of requests answered, including 429s
+  self.rate_limited : int
+    number of 429 responses sent
+  """
+  daemon_threads = True
+
+  def __init__(self, address, world=None, latency=0.0, jitter=0.0, app_limits='20:1,100:120', method_limits='2000:60'):
+    super().__init__(address, Handler)
+    self.world = world or World()
+    self.latency = latency
+    self.jitter = jitter
+    self.app_limits = app_limits
+    self.method_limits = method_limits
+    self.app = FixedWindows(ParseLimits(app_limits))
+    self.methods = FixedWindows(ParseLimits(method_limits))
+    self.requests = {}
+    self.rate_limited = 0
+    self.lock = threading.Lock()
+
+  def Count(self, method, limited):
+    with self.lock:
+      self.requests[method] = self.requests.get(method, 0) + 1
+      self.rate_limited += limited
+
+
+class Handler(BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+
+  def log_message(self, format, *args):
+    pass
+
+  def Send(self, status, body, headers):
+    self.send_response(status)
+    for key, value in headers.items():
+      self.send_header(key, value)
+    self.send_header('Content-Type', 'application/json;charset=utf-8')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def do_GET(self):
+    server = self.server
+    url = urlparse(self.path)
+    query = {k: v[0] for k, v in parse_qs(url.query).items()}
+    key = self.headers.get('X-Riot-Token') or query.get('api_key')
+
+    for method, pattern in ROUTES:
+      found = pattern.match(url.path)
+      if found:
+        break
+    else:
+      return self.Send(404, b'{"status":{"message":"Not found","status_code":404}}', {})
+
+    if server.latency or server.jitter:
+      time.sleep(max(0.0, random.gauss(server.latency, server.jitter)))
+
+    region = found.group('region')
+    app_counts, app_retry = server.app.Hit((key, region))
+    method_counts, method_retry = server.methods.Hit((key, region, method))
+    headers = {'X-App-Rate-Limit': server.app_limits, 'X-App-Rate-Limit-Count': app_counts,
+               'X-Method-Rate-Limit': server.method_limits, 'X-Method-Rate-Limit-Count': method_counts}
+
+    retry_after = max(app_retry, method_retry)
+    server.Count(method, retry_after > 0)
+    if retry_after:
+      headers['Retry-After'] = str(int(retry_after) + 1)
+      headers['X-Rate-Limit-Type'] = 'application' if app_retry else 'method'
+      return self.Send(429, b'{"status":{"message":"Rate limit exceeded","status_code":429}}', headers)
+
+    world = server.world
+    if method == 'summoner':
+      data = world.Summoner(unquote(found.group('name')))
+      body = None if data is None else json.dumps(data).encode()
+    elif method == 'matchlist':
+      params = {name: int(query[arg]) for arg, name in (('champion', 'champion'), ('beginIndex', 'begin_index'),
+                                                       ('endIndex', 'end_index'), ('beginTime', 'begin_time')) if arg in query}
+      body = json.dumps(world.Matchlist(unquote(found.group('account')), **params)).encode()
+    else:
+      body = world.Match(int(found.group('game_id')))
+
+    if body is None:
+      return self.Send(404, b'{"status":{"message":"Data not found","status_code":404}}', headers)
+    self.Send(200, body, headers)
+
+
+def Serve(port=0, **kwargs):
+  """
+  Starts a FakeRiotApi on a background thread
+
+  Returns
+    server, base url to use as RIOT_API_BASE
+  """
+  server = FakeRiotApi(('127.0.0.1', port), **kwargs)
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  return server, f'http://127.0.0.1:{server.server_address[1]}/{{region}}'
+
+def main():
+  parser = argparse.ArgumentParser(description='Offline stand-in for the Riot api endpoints used by the Wrapper')
+  parser.add_argument('--port', type=int, default=8765)
+  parser.add_argument('--latency', type=float, default=0.05, help='mean seconds added to every response')
+  parser.add_argument('--jitter', type=float, default=0.01, help='standard deviation of the added latency')
+  parser.add_argument('--app-limit', default='20:1,100:120', help='X-App-Rate-Limit to enforce')
+  parser.add_argument('--method-limit', default='2000:60', help='X-Method-Rate-Limit to enforce per endpoint')
+  parser.add_argument('--games', type=int, default=GAMES_PER_ACCOUNT, help='synthetic games per account')
+  parser.add_argument('--fixtures', help='directory of recorded responses')
+  args = parser.parse_args()
+
+  server = FakeRiotApi(('127.0.0.1', args.port), World(args.fixtures, args.games), args.latency, args.jitter,
+                       args.app_limit, args.method_limit)
+  print(f'Serving fake Riot api on http://127.0.0.1:{args.port}/{{region}}...')
+  server.serve_forever()
+
+if __name__ == '__main__':
+  main()
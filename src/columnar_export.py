@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Exports every participant of the stored matches to a columnar, memory-mappable directory
+
+Run from src/:
+  python columnar_export.py --output export/              # appends the matches stored since the last export
+  python columnar_export.py --output export/ --region na1
+
+Layout of the output directory
+  manifest.json      number of rows and dtype/width of every column, written last so a partial append is ignored
+  <column>.bin       fixed-width little endian integers, rows * width values, 0 for a missing value
+  <column>.strings   interned strings of region, game_version, username and account_id, one per line,
+                     the column holds the line number
+
+Reading it back, without parsing json:
+  export = ColumnarExport('export/')
+  wins = export['win'][export['champion_id'] == 122]
+  versions = export.Strings('game_version')
+"""
+
+import argparse
+import json
+import os
+import numpy as np
+from match_store import GetMatchStore
+
+FORMAT = 1
+
+# name, dtype, values per row
+COLUMNS = (
+  ('region', '<u1', 1),
+  ('game_id', '<i8', 1),
+  ('game_creation', '<i8', 1),
+  ('game_version', '<u2', 1),
+  ('participant_id', '<u1', 1),
+  ('team_id', '<u2', 1),
+  ('champion_id', '<u2', 1),
+  ('win', '<u1', 1),
+  ('kills', '<u2', 1),
+  ('deaths', '<u2', 1),
+  ('assists', '<u2', 1),
+  ('spells', '<u2', 2),
+  ('items', '<u4', 7),
+  ('perks', '<u2', 6),
+  ('stat_perks', '<u2', 3),
+  ('username', '<u4', 1),
+  ('account_id', '<u4', 1),
+)
+
+# columns holding line numbers into their <column>.strings table
+STRING_COLUMNS = ('region', 'game_version', 'username', 'account_id')
+
+
+def _ReadManifest(directory):
+  path = os.path.join(directory, 'manifest.json')
+  if not os.path.exists(path):
+    return {'format': FORMAT, 'rows': 0, 'games': 0,
+            'columns': {name: {'dtype': dtype, 'width': width} for name, dtype, width in COLUMNS},
+            'strings': {name: 0 for name in STRING_COLUMNS}}
+  with open(path) as f:
+    manifest = json.load(f)
+  if manifest.get('format') != FORMAT:
+    raise ValueError(f'{directory} holds export format {manifest.get("format")}, expected {FORMAT}')
+  return manifest
+
+def _ReadStrings(directory, name, count):
+  path = os.path.join(directory, f'{name}.strings')
+  if not count:
+    return []
+  with open(path, encoding='utf-8') as f:
+    strings = f.read().split('\n')[:count]
+  return strings
+
+
+class ColumnarExport():
+  """
+  Read only, memory-mapped view of an export directory
+
+  Functions
+  ---------
+  __getitem__()
+    Returns a column as a np.memmap of shape (rows,) or (rows, width)
+  Strings()
+    Returns the interned strings of a string column
+  """
+  def __init__(self, directory):
+    self.directory = directory
+    self.manifest = _ReadManifest(directory)
+    self.rows = self.manifest['rows']
+    self.columns = {}
+    self.strings = {}
+
+  def __len__(self):
+    return self.rows
+
+  def __getitem__(self, name):
+    column = self.columns.get(name)
+    if column is None:
+      spec = self.manifest['columns'][name]
+      shape = (self.rows,) if spec['width'] == 1 else (self.rows, spec['width'])
+      if not self.rows:
+        return np.zeros(shape, spec['dtype'])
+      column = self.columns[name] = np.memmap(os.path.join(self.directory, f'{name}.bin'), spec['dtype'], 'r', shape=shape)
+    return column
+
+  def Strings(self, name):
+    strings = self.strings.get(name)
+    if strings is None:
+      strings = self.strings[name] = _ReadStrings(self.directory, name, self.manifest['strings'][name])
+    return strings
+
+
+class ColumnarWriter():
+  """
+  Appends matches to an export directory, a match already exported is skipped
+
+  Functions
+  ---------
+  Append()
+    Buffers the participants of a batch of matches
+  Commit()
+    Writes the buffered rows and new strings, then the manifest
+  """
+  def __init__(self, directory):
+    os.makedirs(directory, exist_ok=True)
+    self.directory = directory
+    self.manifest = _ReadManifest(directory)
+    self.rows = []
+    self.games = 0
+    self.interned = {}
+    for name in STRING_COLUMNS:
+      strings = _ReadStrings(directory, name, self.manifest['strings'][name])
+      self.interned[name] = {s: i for i, s in enumerate(strings)}
+    self.new_strings = {name: [] for name in STRING_COLUMNS}
+    self._Truncate()
+    self.exported = self._Exported()
+
+  def _Truncate(self):
+    """
+    Drops whatever an interrupted append wrote past the rows and strings of the manifest
+    """
+    rows = self.manifest['rows']
+    for name, spec in self.manifest['columns'].items():
+      path = os.path.join(self.directory, f'{name}.bin')
+      size = rows * spec['width'] * np.dtype(spec['dtype']).itemsize
+      if os.path.exists(path) and os.path.getsize(path) != size:
+        with open(path, 'r+b') as f:
+          f.truncate(size)
+    for name in STRING_COLUMNS:
+      strings = list(self.interned[name])
+      with open(os.path.join(self.directory, f'{name}.strings'), 'w', encoding='utf-8') as f:
+        f.write(''.join(s + '\n' for s in strings))
+
+  def _Exported(self):
+    export = ColumnarExport(self.directory)
+    exported = set()
+    regions = export.Strings('region')
+    region_codes, game_ids = export['region'], export['game_id']
+    for code, region in enumerate(regions):
+      exported.update((region, int(game_id)) for game_id in np.unique(game_ids[region_codes == code]))
+    return exported
+
+  def _Intern(self, name, value):
+    value = '' if value is None else str(value).replace('\n', ' ')
+    table = self.interned[name]
+    code = table.get(value)
+    if code is None:
+      code = table[value] = len(table)
+      self.new_strings[name].append(value)
+    return code
+
+  def Append(self, region, match):
+    """
+    Returns
+      bool, False if the match was already exported
+    """
+    if (region, match.game_id) in self.exported:
+      return False
+    self.exported.add((region, match.game_id))
+    self.games += 1
+
+    region_code = self._Intern('region', region)
+    version = self._Intern('game_version', match.game_version)
+    for p in match.participants:
+      self.rows.append((
+        region_code, match.game_id, match.game_creation, version, p.participant_id, p.team_id, p.champion_id,
+        bool(p.win), p.kills, p.deaths, p.assists, (p.spell1, p.spell2),
+        [i or 0 for i in p.items], [i or 0 for i in p.perks], [i or 0 for i in p.stat_perks],
+        self._Intern('username', p.username), self._Intern('account_id', p.account_id)))
+    return True
+
+  def Commit(self):
+    """
+    Returns
+      int, number of rows written
+    """
+    rows = len(self.rows)
+    for index, (name, dtype, width) in enumerate(COLUMNS):
+      values = np.array([row[index] for row in self.rows], dtype).reshape((rows, width) if width > 1 else rows)
+      with open(os.path.join(self.directory, f'{name}.bin'), 'ab') as f:
+        f.write(values.tobytes())
+
+    for name, strings in self.new_strings.items():
+      with open(os.path.join(self.directory, f'{name}.strings'), 'a', encoding='utf-8') as f:
+        f.write(''.join(s + '\n' for s in strings))
+
+    self.manifest['rows'] += rows
+    self.manifest['games'] += self.games
+    self.manifest['strings'] = {name: len(self.interned[name]) for name in STRING_COLUMNS}
+    tmp = os.path.join(self.directory, 'manifest.json.tmp')
+    with open(tmp, 'w') as f:
+      json.dump(self.manifest, f, indent=2)
+    os.replace(tmp, os.path.join(self.directory, 'manifest.json'))
+
+    self.rows = []
+    self.games = 0
+    self.new_strings = {name: [] for name in STRING_COLUMNS}
+    return rows
+
+
+def Export(directory, region=None, batch=10000):
+  """
+  Appends every stored match not exported yet to directory
+
+  Arguments
+  ---------
+  directory : str
+    export directory, created if missing
+  region : str
+    only export the matches of this region, None exports every region
+  batch : int
+    matches buffered in memory before they are written
+
+  Returns
+    (games, rows) appended
+  """
+  writer = ColumnarWriter(directory)
+  games = rows = pending = 0
+  for match_region, match in GetMatchStore().Iter(region):
+    if writer.Append(match_region, match):
+      games += 1
+      pending += 1
+    if pending >= batch:
+      rows += writer.Commit()
+      pending = 0
+  rows += writer.Commit()
+  return games, rows
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Export the stored match participants to memory-mappable columns')
+  parser.add_argument('--output', required=True, help='export directory, matches already in it are skipped')
+  parser.add_argument('--region', help='only export the matches of this region')
+  args = parser.parse_args()
+
+  games, rows = Export(args.output, args.region)
+  print(f'Exported {games} games, {rows} rows to {args.output}...')
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+# connections kept alive per regional host, should be at least the Wrapper concurrency
+POOL_SIZE = 20
+TIMEOUT = 10
+
+# status codes worth retrying, anything else is returned to the caller as is
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def GetSession(hostname):
+  """
+  Returns the shared keep-alive session for a regional host, eg na1.api.riotgames.com
+
+  Each host gets its own bounded connection pool so a busy region can not starve the others
+  """
+  with _sessions_lock:
+    session = _sessions.get(hostname)
+    if session is None:
+      session = requests.Session()
+      adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, pool_block=True, max_retries=0)
+      session.mount('https://', adapter)
+      session.mount('http://', adapter)
+      session = _sessions[hostname] = session
+    return session
+
+def Backoff(attempt, retry_after=None, base=0.5, cap=30):
+  """
+  Seconds to wait before retrying, full jitter exponential backoff unless Riot sent Retry-After
+
+  Arguments
+  ---------
+  attempt : int
+    number of the failed attempt, starting at 0
+  retry_after : str
+    value of the Retry-After header if any
+  """
+  if retry_after is not None:
+    try:
+      return float(retry_after)
+    except ValueError:
+      pass
+  return random.uniform(0, min(cap, base * 2 ** attempt))
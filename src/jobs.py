@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+
+# states of a job, in order
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+
+
+class Job():
+  """
+  A call submitted to the JobManager, its result is kept until ttl seconds after it finished
+  """
+  __slots__ = ('job_id', 'state', 'result', 'error', 'submitted', 'started', 'finished', 'done', 'future')
+
+  def __init__(self):
+    self.job_id = uuid.uuid4().hex
+    self.state = QUEUED
+    self.result = None
+    self.error = None
+    self.submitted = time.time()
+    self.started = None
+    self.finished = None
+    self.done = threading.Event()
+    self.future = None
+
+  def ToJson(self):
+    """
+    Returns
+      dict describing the job, without its result
+    """
+    return {'jobId': self.job_id, 'state': self.state, 'submitted': self.submitted,
+            'started': self.started, 'finished': self.finished}
+
+
+class JobManager():
+  """
+  Runs long calls, eg Wrapper().MatchBreakdown(), on a bounded pool of threads so the web workers only
+  submit them and return a job id
+
+  Counters 'jobs_submitted', 'jobs_rejected', 'jobs_failed' and 'jobs_expired' and the 'job_queued' and
+  'job_run' timings are kept in metrics
+
+  Functions
+  ---------
+  Submit()
+    Queues a call and returns its Job, None when too many jobs are unfinished
+  Get()
+    Returns a job by id, None if unknown or expired
+  Wait()
+    Blocks until a job finished or the timeout passed
+  Cancel()
+    Cancels a job that has not started yet
+  """
+  def __init__(self, workers=4, ttl=600, max_pending=100):
+    """
+    Arguments
+    ---------
+    workers : int
+      number of jobs run at the same time
+    ttl : int
+      seconds a finished job and its result are kept
+    max_pending : int
+      maximum number of queued and running jobs, further submissions are rejected
+    """
+    self.ttl = ttl
+    self.max_pending = max_pending
+    self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+    self.jobs = {}
+    self.pending = 0
+    self.lock = threading.Lock()
+
+  def _Purge(self, now):
+    expired = [job_id for job_id, job in self.jobs.items() if job.finished is not None and now - job.finished > self.ttl]
+    for job_id in expired:
+      del self.jobs[job_id]
+    if expired:
+      metrics.Increment('jobs_expired', len(expired))
+
+  def _Run(self, job, fn, args, kwargs):
+    with self.lock:
+      if job.state != QUEUED:
+        return
+      job.state = RUNNING
+      job.started = time.time()
+    metrics.Observe('job_queued', job.started - job.submitted)
+
+    try:
+      with metrics.Timer('job_run'):
+        job.result = fn(*args, **kwargs)
+    except Exception as error:
+      job.error = error
+      metrics.Increment('jobs_failed')
+    finally:
+      self._Finish(job)
+
+  def _Finish(self, job):
+    with self.lock:
+      job.state = DONE
+      job.finished = time.time()
+      self.pending -= 1
+    job.done.set()
+
+  def Submit(self, fn, *args, **kwargs):
+    """
+    Arguments
+    ---------
+    fn : callable
+      called with args and kwargs on one of the job threads
+
+    Returns
+      Job, None if max_pending jobs are already unfinished
+    """
+    with self.lock:
+      self._Purge(time.time())
+      if self.pending >= self.max_pending:
+        metrics.Increment('jobs_rejected')
+        return None
+      job = Job()
+      self.jobs[job.job_id] = job
+      self.pending += 1
+
+    metrics.Increment('jobs_submitted')
+    job.future = self.executor.submit(self._Run, job, fn, args, kwargs)
+    return job
+
+  def Get(self, job_id):
+    with self.lock:
+      self._Purge(time.time())
+      return self.jobs.get(job_id)
+
+  def Wait(self, job_id, timeout):
+    """
+    Arguments
+    ---------
+    job_id : str
+      id returned by Submit()
+    timeout : float
+      most seconds to block for
+
+    Returns
+      Job, finished unless the timeout passed first, None if unknown or expired
+    """
+    job = self.Get(job_id)
+    if job is not None and timeout > 0:
+      job.done.wait(timeout)
+    return job
+
+  def Cancel(self, job_id):
+    """
+    Returns
+      bool, False if the job is unknown or already running
+    """
+    with self.lock:
+      job = self.jobs.get(job_id)
+      if job is None or job.state != QUEUED:
+        return False
+      # the worker skips jobs no longer queued, should it pick this one up anyway
+      job.state = DONE
+      job.finished = time.time()
+      self.pending -= 1
+      del self.jobs[job_id]
+    if job.future is not None:
+      job.future.cancel()
+    job.done.set()
+    return True
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def GetJobManager():
+  """
+  Returns the process wide JobManager, sized by the JOB_WORKERS, JOB_TTL and JOB_MAX_PENDING environment variables
+  """
+  global _manager
+  with _manager_lock:
+    if _manager is None:
+      _manager = JobManager(int(os.getenv('JOB_WORKERS', 4)), int(os.getenv('JOB_TTL', 600)),
+                            int(os.getenv('JOB_MAX_PENDING', 100)))
+    return _manager
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+try:
+  import orjson
+  Loads = orjson.loads
+except ImportError:
+  import json
+  Loads = json.loads
+
+from static_files.registry import registry
+
+ITEM_KEYS = ('item0', 'item1', 'item2', 'item3', 'item4', 'item5', 'item6')
+PERK_KEYS = ('perk0', 'perk1', 'perk2', 'perk3', 'perk4', 'perk5')
+STAT_PERK_KEYS = ('statPerk0', 'statPerk1', 'statPerk2')
+
+
+class Participant():
+  """
+  Compact record of one player of a match, holding only what a matchup breakdown needs
+  """
+  __slots__ = ('participant_id', 'team_id', 'champion_id', 'spell1', 'spell2',
+               'win', 'kills', 'deaths', 'assists', 'items', 'perks', 'stat_perks',
+               'username', 'account_id')
+
+  def __init__(self, participant_id, team_id, champion_id, spell1, spell2, win, kills, deaths, assists,
+               items, perks, stat_perks, username, account_id):
+    self.participant_id = participant_id
+    self.team_id = team_id
+    self.champion_id = champion_id
+    self.spell1 = spell1
+    self.spell2 = spell2
+    self.win = win
+    self.kills = kills
+    self.deaths = deaths
+    self.assists = assists
+    self.items = items
+    self.perks = perks
+    # statPerks did not exist in older patches, missing ones are None
+    self.stat_perks = stat_perks
+    self.username = username
+    self.account_id = account_id
+
+  def ToJson(self, static):
+    """
+    Arguments
+    ---------
+    static : StaticData
+      lookup tables of the patch the match was played on
+
+    Returns
+      dict in the shape RiotCall returns for each champion of a matchup
+    """
+    info = {
+      'username': self.username,
+      'teamId': self.team_id,
+      'win': self.win,
+      'kills': self.kills,
+      'deaths': self.deaths,
+      'assists': self.assists,
+      'championId': self.champion_id,
+      'spell1': static.Summoner(self.spell1),
+      'spell2': static.Summoner(self.spell2),
+    }
+    for key, item in zip(ITEM_KEYS, self.items):
+      info[key] = static.Item(item)
+    for key, perk in zip(PERK_KEYS, self.perks):
+      info[key] = static.Rune(perk)
+    for key, perk in zip(STAT_PERK_KEYS, self.stat_perks):
+      info[key] = "" if perk is None else static.StatPerk(perk)
+    return info
+
+
+class Match():
+  """
+  Compact record of a finished match
+
+  Functions
+  ---------
+  Find()
+    Returns the participant playing a champion or None
+  Slim()
+    Returns the positional list form kept by the match store
+  FromSlim()
+    Builds a Match from the positional list form
+  """
+  __slots__ = ('game_id', 'game_creation', 'game_version', 'participants')
+
+  def __init__(self, game_id, game_creation, game_version, participants):
+    self.game_id = game_id
+    self.game_creation = game_creation
+    self.game_version = game_version
+    self.participants = participants
+
+  def Find(self, champion_id):
+    for participant in self.participants:
+      if participant.champion_id == champion_id:
+        return participant
+    return None
+
+  def Slim(self):
+    """
+    Returns
+      list, [gameId, gameCreation, gameVersion, [participant, ...]] where a participant is
+      [participantId, teamId, championId, spell1Id, spell2Id, [win, kills, deaths, assists, *items, *perks, *statPerks], summonerName, accountId]
+    """
+    return [self.game_id, self.game_creation, self.game_version, [
+      [p.participant_id, p.team_id, p.champion_id, p.spell1, p.spell2,
+       [p.win, p.kills, p.deaths, p.assists, *p.items, *p.perks, *p.stat_perks],
+       p.username, p.account_id]
+      for p in self.participants]]
+
+  @classmethod
+  def FromSlim(cls, slim):
+    game_id, game_creation, game_version, participants = slim
+    return cls(game_id, game_creation, game_version, [
+      Participant(p[0], p[1], p[2], p[3], p[4], p[5][0], p[5][1], p[5][2], p[5][3],
+                  tuple(p[5][4:11]), tuple(p[5][11:17]), tuple(p[5][17:20]), p[6], p[7])
+      for p in participants])
+
+
+class Matchup():
+  """
+  A match where champion faced enemy champion, turned into RiotCall's json shape only by ToJson()
+  using the static data of the patch it was played on
+  """
+  __slots__ = ('match', 'player', 'enemy')
+
+  def __init__(self, match, player, enemy):
+    self.match = match
+    self.player = player
+    self.enemy = enemy
+
+  @property
+  def game_id(self):
+    return self.match.game_id
+
+  def ToJson(self):
+    """
+    Returns
+      dict of gameId -> match details
+    """
+    match = self.match
+    static = registry.ForVersion(match.game_version)
+    return {
+      match.game_id: {
+        'gameId': match.game_id,
+        'date': match.game_creation/1000,
+        'gameVersion': match.game_version,
+        static.ChampionName(self.player.champion_id): self.player.ToJson(static),
+        static.ChampionName(self.enemy.champion_id): self.enemy.ToJson(static),
+      }
+    }
+
+
+def DecodeMatch(body):
+  """
+  Decodes a MatchV4 match in a single pass over its participants
+
+  Arguments
+  ---------
+  body : bytes, str or dict
+    raw body of /lol/match/v4/matches/{gameId}, or its already parsed json
+
+  Returns
+    Match
+  """
+  data = body if isinstance(body, dict) else Loads(body)
+
+  identities = {}
+  for identity in data.get('participantIdentities', ()):
+    player = identity.get('player') or {}
+    identities[identity['participantId']] = (player.get('summonerName'), player.get('accountId'))
+
+  participants = []
+  for participant in data['participants']:
+    stats = participant['stats']
+    get = stats.get
+    participant_id = participant['participantId']
+    username, account_id = identities.get(participant_id, (None, None))
+    participants.append(Participant(
+      participant_id, participant['teamId'], participant['championId'],
+      participant['spell1Id'], participant['spell2Id'],
+      stats['win'], stats['kills'], stats['deaths'], stats['assists'],
+      (get('item0'), get('item1'), get('item2'), get('item3'), get('item4'), get('item5'), get('item6')),
+      (get('perk0'), get('perk1'), get('perk2'), get('perk3'), get('perk4'), get('perk5')),
+      (get('statPerk0'), get('statPerk1'), get('statPerk2')),
+      username, account_id))
+
+  return Match(data['gameId'], data['gameCreation'], data['gameVersion'], participants)
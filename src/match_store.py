@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from match_decoder import Match, Loads
+
+def Encode(match):
+  """
+  Encodes a Match as its positional list form, json and zlib compressed
+  """
+  return zlib.compress(json.dumps(match.Slim(), separators=(',', ':')).encode())
+
+def Decode(blob):
+  return Match.FromSlim(Loads(zlib.decompress(blob)))
+
+
+class MatchStore():
+  """
+  Permanent store of finished matches keyed by region and gameId, matches never change once played
+
+  Functions
+  ---------
+  Get()
+    Returns the stored Match for a gameId or None
+  GetMany()
+    Returns the stored Matches of many gameIds
+  Iter()
+    Yields every stored Match in (region, gameId) order
+  Put()
+    Stores the compact form of a Match, only the fields a matchup breakdown uses are kept
+  """
+  def __init__(self, path):
+    """
+    Arguments
+    ---------
+    path : str
+      sqlite file the matches are kept in
+    """
+    self.path = path
+    self.lock = threading.Lock()
+    self.db = sqlite3.connect(path, check_same_thread=False)
+    self.db.execute('PRAGMA journal_mode=WAL')
+    self.db.execute('CREATE TABLE IF NOT EXISTS matches ('
+                    'region TEXT NOT NULL, game_id INTEGER NOT NULL, data BLOB NOT NULL, '
+                    'PRIMARY KEY (region, game_id)) WITHOUT ROWID')
+    self.db.commit()
+
+  def Get(self, region, game_id):
+    """
+    Returns
+      Match, None if the match is not stored
+    """
+    with self.lock:
+      row = self.db.execute('SELECT data FROM matches WHERE region = ? AND game_id = ?', (region, game_id)).fetchone()
+    return None if row is None else Decode(row[0])
+
+  def GetMany(self, region, game_ids):
+    """
+    Returns
+      dict of gameId -> Match for the gameIds in game_ids that are stored
+    """
+    game_ids = list(game_ids)
+    rows = []
+    with self.lock:
+      # stay below sqlite's limit of host parameters per statement
+      for i in range(0, len(game_ids), 500):
+        chunk = game_ids[i:i + 500]
+        marks = ','.join('?' * len(chunk))
+        rows.extend(self.db.execute(f'SELECT game_id, data FROM matches WHERE region = ? AND game_id IN ({marks})',
+                                    [region] + chunk).fetchall())
+    return {game_id: Decode(blob) for game_id, blob in rows}
+
+  def Iter(self, region=None, batch=1000):
+    """
+    Reads the store in batches so other threads are not locked out while a long scan runs
+
+    Arguments
+    ---------
+    region : str
+      only yield the matches of this region, None yields every region
+    batch : int
+      number of matches read per query
+
+    Returns
+      generator of (region, Match)
+    """
+    last = ('', -1) if region is None else (region, -1)
+    while True:
+      query = 'SELECT region, game_id, data FROM matches WHERE (region, game_id) > (?, ?)'
+      params = list(last)
+      if region is not None:
+        query += ' AND region = ?'
+        params.append(region)
+      with self.lock:
+        rows = self.db.execute(query + ' ORDER BY region, game_id LIMIT ?', params + [batch]).fetchall()
+      for row_region, game_id, blob in rows:
+        yield row_region, Decode(blob)
+      if len(rows) < batch:
+        return
+      last = rows[-1][:2]
+
+  def Put(self, region, match):
+    blob = Encode(match)
+    with self.lock:
+      self.db.execute('INSERT OR REPLACE INTO matches (region, game_id, data) VALUES (?, ?, ?)', (region, match.game_id, blob))
+      self.db.commit()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def GetMatchStore():
+  """
+  Returns the process wide MatchStore, its file is set by the MATCH_STORE environment variable
+  """
+  global _store
+  with _store_lock:
+    if _store is None:
+      _store = MatchStore(os.getenv('MATCH_STORE', 'match_store.db'))
+    return _store
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import os
+import sqlite3
+import threading
+
+class MatchupIndex():
+  """
+  Inverted index of champion vs enemy champion pairs to the games they faced each other in
+
+  Every stored match adds one row per (participant, enemy participant) pair, so both plain
+  (champion, enemy champion) and (account, champion, enemy champion) lookups are answered
+  without reading or fetching the matches themselves.
+
+  Functions
+  ---------
+  Add()
+    Indexes the matchups of a decoded match
+  Indexed()
+    Returns which of the given gameIds are already indexed
+  Lookup()
+    Returns the gameIds and team sides where champion faced enemy champion
+  """
+  def __init__(self, path):
+    """
+    Arguments
+    ---------
+    path : str
+      sqlite file the index is kept in
+    """
+    self.path = path
+    self.lock = threading.Lock()
+    self.db = sqlite3.connect(path, check_same_thread=False)
+    self.db.execute('PRAGMA journal_mode=WAL')
+    self.db.executescript('''
+      CREATE TABLE IF NOT EXISTS indexed_games (
+        region TEXT NOT NULL, game_id INTEGER NOT NULL,
+        PRIMARY KEY (region, game_id)) WITHOUT ROWID;
+      CREATE TABLE IF NOT EXISTS matchups (
+        region TEXT NOT NULL, champion_id INTEGER NOT NULL, enemy_champion_id INTEGER NOT NULL,
+        game_id INTEGER NOT NULL, team_id INTEGER NOT NULL, account_id TEXT);
+      CREATE INDEX IF NOT EXISTS matchups_pair ON matchups (region, champion_id, enemy_champion_id);
+      CREATE INDEX IF NOT EXISTS matchups_account ON matchups (region, account_id, champion_id, enemy_champion_id);
+    ''')
+    self.db.commit()
+
+  def Add(self, region, match):
+    """
+    Arguments
+    ---------
+    region : str
+      region the match was played in
+    match : Match
+      decoded match
+    """
+    rows = []
+    for participant in match.participants:
+      for enemy in match.participants:
+        if participant.team_id != enemy.team_id:
+          rows.append((region, participant.champion_id, enemy.champion_id, match.game_id,
+                       participant.team_id, participant.account_id))
+
+    with self.lock:
+      cursor = self.db.execute('INSERT OR IGNORE INTO indexed_games (region, game_id) VALUES (?, ?)', (region, match.game_id))
+      # a game that was already indexed keeps its rows
+      if cursor.rowcount:
+        self.db.executemany('INSERT INTO matchups VALUES (?, ?, ?, ?, ?, ?)', rows)
+      self.db.commit()
+
+  def Indexed(self, region, game_ids):
+    """
+    Returns
+      set of the gameIds in game_ids that are already indexed
+    """
+    game_ids = list(game_ids)
+    indexed = set()
+    with self.lock:
+      # stay below sqlite's limit of host parameters per statement
+      for i in range(0, len(game_ids), 500):
+        chunk = game_ids[i:i + 500]
+        marks = ','.join('?' * len(chunk))
+        rows = self.db.execute(f'SELECT game_id FROM indexed_games WHERE region = ? AND game_id IN ({marks})', [region] + chunk)
+        indexed.update(row[0] for row in rows)
+    return indexed
+
+  def Lookup(self, region, champion_id, enemy_champion_id, account_id=None):
+    """
+    Arguments
+    ---------
+    region : str
+      region the games were played in
+    champion_id : int
+      champion played
+    enemy_champion_id : int
+      champion played against, on the opposite team
+    account_id : str
+      only return games where this account played champion_id
+
+    Returns
+      dict of gameId -> teamId of champion_id
+    """
+    query = 'SELECT game_id, team_id FROM matchups WHERE region = ? AND champion_id = ? AND enemy_champion_id = ?'
+    params = [region, champion_id, enemy_champion_id]
+    if account_id is not None:
+      query += ' AND account_id = ?'
+      params.append(account_id)
+
+    with self.lock:
+      return dict(self.db.execute(query, params).fetchall())
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def GetMatchupIndex():
+  """
+  Returns the process wide MatchupIndex, kept next to the match store in the MATCH_STORE file
+  """
+  global _index
+  with _index_lock:
+    if _index is None:
+      _index = MatchupIndex(os.getenv('MATCH_STORE', 'match_store.db'))
+    return _index
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+import bisect
+import threading
+import time
+from collections import defaultdict
+
+# upper bounds in seconds of the timing histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PREFIX = 'spoofhelper'
+
+_counters = defaultdict(int)
+_gauges = {}
+_timings = {}
+_lock = threading.Lock()
+
+def _Key(name, labels):
+  return (name, tuple(sorted(labels.items())))
+
+def Increment(name, value=1, **labels):
+  """
+  Adds value to the process wide counter name, eg Increment('match_store_hits') or Increment('requests', method='match')
+  """
+  key = _Key(name, labels)
+  with _lock:
+    _counters[key] += value
+
+def Gauge(name, value, **labels):
+  """
+  Sets the process wide gauge name to its current value, eg Gauge('scheduler_queued', 3, priority='batch')
+  """
+  key = _Key(name, labels)
+  with _lock:
+    _gauges[key] = value
+
+def Observe(name, seconds, **labels):
+  """
+  Records a duration in the timing histogram name
+  """
+  key = _Key(name, labels)
+  with _lock:
+    timing = _timings.get(key)
+    if timing is None:
+      # per bucket counts, the last one is +Inf, then sum and count
+      timing = _timings[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+    timing[0][bisect.bisect_left(BUCKETS, seconds)] += 1
+    timing[1] += seconds
+    timing[2] += 1
+
+
+class Timer():
+  """
+  Context manager observing the time spent in its block, eg with Timer('decode'): ...
+  """
+  __slots__ = ('name', 'labels', 'start')
+
+  def __init__(self, name, **labels):
+    self.name = name
+    self.labels = labels
+
+  def __enter__(self):
+    self.start = time.perf_counter()
+    return self
+
+  def __exit__(self, *exc):
+    Observe(self.name, time.perf_counter() - self.start, **self.labels)
+    return False
+
+
+def _Name(name, labels):
+  if not labels:
+    return name
+  return name + '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+def Snapshot():
+  """
+  Returns
+    dict of counter and gauge name -> value and timing name -> {'count', 'sum'} at the time of the call
+  """
+  with _lock:
+    snapshot = {_Name(name, labels): value for (name, labels), value in _counters.items()}
+    snapshot.update((_Name(name, labels), value) for (name, labels), value in _gauges.items())
+    for (name, labels), (_, total, count) in _timings.items():
+      snapshot[_Name(name + '_seconds', labels)] = {'count': count, 'sum': total}
+  return snapshot
+
+def Render():
+  """
+  Returns
+    str, every counter, gauge and timing in the Prometheus text exposition format
+  """
+  with _lock:
+    counters = sorted(_counters.items())
+    gauges = sorted(_gauges.items())
+    timings = sorted((key, ([*buckets], total, count)) for key, (buckets, total, count) in _timings.items())
+
+  lines = []
+  typed = set()
+  for (name, labels), value in counters:
+    metric = f'{PREFIX}_{name}_total'
+    if metric not in typed:
+      typed.add(metric)
+      lines.append(f'# TYPE {metric} counter')
+    lines.append(f'{_Name(metric, labels)} {value}')
+
+  for (name, labels), value in gauges:
+    metric = f'{PREFIX}_{name}'
+    if metric not in typed:
+      typed.add(metric)
+      lines.append(f'# TYPE {metric} gauge')
+    lines.append(f'{_Name(metric, labels)} {value}')
+
+  for (name, labels), (buckets, total, count) in timings:
+    metric = f'{PREFIX}_{name}_seconds'
+    if metric not in typed:
+      typed.add(metric)
+      lines.append(f'# TYPE {metric} histogram')
+    cumulative = 0
+    for bound, hits in zip(BUCKETS + ('+Inf',), buckets):
+      cumulative += hits
+      lines.append(f'{_Name(metric + "_bucket", labels + (("le", bound),))} {cumulative}')
+    lines.append(f'{_Name(metric + "_sum", labels)} {total}')
+    lines.append(f'{_Name(metric + "_count", labels)} {count}')
+
+  return '\n'.join(lines) + '\n'
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Background prefetch of the matches of watched summoners
+
+Every watched (region, summoner, champion) has its matchlist synced every interval seconds and the new games
+stored and indexed, using only the rate limit capacity interactive queries leave idle, so a later RiotCall for
+any enemy champion is answered from the match store.
+
+Run from src/ to prefetch without the rest server, eg next to a rest server with several workers:
+  python prefetch.py
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from rate_limiter import PREFETCH
+from riot_endpoints import Wrapper
+from summoner_cache import NormalizeName
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# seconds between two syncs of the same watched summoner
+DEFAULT_INTERVAL = 600
+# shortest interval accepted, a matchlist rarely changes faster than a game lasts
+MIN_INTERVAL = 60
+# most entries the watch list holds, each one costs a matchlist sync per interval for as long as it is watched
+DEFAULT_MAX_ENTRIES = 500
+# seconds between two checks of the watch list file for entries added or removed by another process
+WATCHLIST_POLL = 30
+
+
+class PrefetchScheduler():
+  """
+  Watch list of (region, summoner, champion) whose new matches are fetched in the background at PREFETCH priority
+
+  Counters 'prefetch_runs', 'prefetch_failures', 'prefetch_games_scanned' and 'prefetch_rejected' and the 'prefetch' timing are kept in metrics
+
+  Functions
+  ---------
+  Watch()
+    Adds a summoner and champion to the watch list, or changes its interval
+  Unwatch()
+    Removes a summoner and champion from the watch list
+  List()
+    Returns the watch list and the outcome of the last run of each entry
+  Reload()
+    Picks up the entries another process added to or removed from the watch list file
+  RunOnce()
+    Prefetches every entry that is due, returns the number of entries run
+  Start()
+    Starts the background thread running due entries
+  Stop()
+    Stops the background thread
+  """
+  def __init__(self, path=None, interval=DEFAULT_INTERVAL, max_scan=100, concurrency=2, max_entries=DEFAULT_MAX_ENTRIES):
+    """
+    Arguments
+    ---------
+    path : str
+      json file the watch list is kept in across restarts, None keeps it in memory only
+    interval : int
+      default seconds between two syncs of a watched summoner
+    max_scan : int
+      maximum number of matchlist games scanned per run, older games are reached over the following runs
+    concurrency : int
+      number of match details requested at the same time per run
+    max_entries : int
+      most entries watched at once, Watch() refuses new entries past it
+    """
+    self.path = path
+    self.interval = interval
+    self.max_scan = max_scan
+    self.concurrency = concurrency
+    self.max_entries = max_entries
+    self.entries = {}
+    self.lock = threading.Lock()
+    # held across writing the temporary file and replacing the watch list with it
+    self.save_lock = threading.Lock()
+    self.wake = threading.Event()
+    self.stopped = threading.Event()
+    self.thread = None
+    self.mtime = None
+    self.Reload()
+
+  def _Key(self, region, summoner, champion):
+    return (region, NormalizeName(summoner), champion.lower())
+
+  def _Mtime(self):
+    try:
+      return os.stat(self.path).st_mtime_ns
+    except OSError:
+      return None
+
+  def Reload(self):
+    """
+    Re-reads the watch list file if it changed since it was last read or written, entries still watched keep
+    their schedule and last run
+
+    Returns
+      bool, True if the file was read
+    """
+    if self.path is None:
+      return False
+    mtime = self._Mtime()
+    if mtime is None or mtime == self.mtime:
+      return False
+    with open(self.path) as f:
+      watch_list = json.load(f)
+    self.mtime = mtime
+
+    keys = set()
+    for entry in watch_list:
+      keys.add(self._Key(entry['region'], entry['summoner'], entry['champion']))
+      self.Watch(entry['region'], entry['summoner'], entry['champion'], entry.get('interval'), save=False)
+    with self.lock:
+      for key in [key for key in self.entries if key not in keys]:
+        del self.entries[key]
+    return True
+
+  def _Save(self):
+    if self.path is None:
+      return
+    with self.save_lock:
+      with self.lock:
+        watch_list = [{'region': e['region'], 'summoner': e['summoner'], 'champion': e['champion'], 'interval': e['interval']}
+                      for e in self.entries.values()]
+      tmp = self.path + '.tmp'
+      with open(tmp, 'w') as f:
+        json.dump(watch_list, f, indent=2)
+      os.replace(tmp, self.path)
+      self.mtime = self._Mtime()
+
+  def Watch(self, region, summoner, champion, interval=None, save=True):
+    """
+    Arguments
+    ---------
+    region : str
+      region where summoner exists
+    summoner : str
+      username of the watched player
+    champion : str
+      champion whose games are prefetched
+    interval : int
+      seconds between two syncs, defaults to self.interval and is at least MIN_INTERVAL
+
+    Returns
+      dict, the watch list entry, None if max_entries are already watched
+    """
+    interval = max(MIN_INTERVAL, int(interval or self.interval))
+    key = self._Key(region, summoner, champion)
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is None and len(self.entries) >= self.max_entries:
+        metrics.Increment('prefetch_rejected')
+        return None
+      if entry is None:
+        # new entries are due right away
+        entry = self.entries[key] = {'region': region, 'summoner': summoner, 'champion': champion, 'interval': interval,
+                                     'next_run': 0, 'last_run': None, 'last_status': None, 'scanned': 0}
+      else:
+        entry['next_run'] -= entry['interval'] - interval
+        entry['interval'] = interval
+
+    if save:
+      self._Save()
+    self.wake.set()
+    return dict(entry)
+
+  def Unwatch(self, region, summoner, champion):
+    """
+    Returns
+      bool, False if the entry was not watched
+    """
+    with self.lock:
+      entry = self.entries.pop(self._Key(region, summoner, champion), None)
+    if entry is None:
+      return False
+    self._Save()
+    return True
+
+  def List(self):
+    with self.lock:
+      return [dict(entry) for entry in self.entries.values()]
+
+  def _Run(self, entry):
+    info = Wrapper(entry['region'], entry['summoner'], entry['champion'], None,
+                   concurrency=self.concurrency, max_scan=self.max_scan, priority=PREFETCH)
+    try:
+      with metrics.Timer('prefetch'):
+        scanned = info.Ingest()
+      status = info.status
+    except Exception:
+      logger.exception('Prefetch of %s on %s failed', entry['summoner'], entry['champion'])
+      status = 500
+
+    metrics.Increment('prefetch_runs', status=status)
+    if status != 200:
+      metrics.Increment('prefetch_failures')
+      logger.info('Prefetch of %s on %s status code: %s', entry['summoner'], entry['champion'], status)
+      scanned = 0
+    else:
+      metrics.Increment('prefetch_games_scanned', scanned)
+      logger.debug('Prefetched %s games of %s on %s', scanned, entry['summoner'], entry['champion'])
+
+    with self.lock:
+      entry['last_run'] = time.time()
+      entry['last_status'] = status
+      entry['scanned'] = scanned
+
+  def RunOnce(self, now=None):
+    """
+    Arguments
+    ---------
+    now : float
+      epoch seconds entries are due at, defaults to the current time
+
+    Returns
+      int, number of entries run
+    """
+    now = time.time() if now is None else now
+    with self.lock:
+      due = [e for e in self.entries.values() if e['next_run'] <= now]
+      # rescheduled before running so a slow run is not started twice
+      for entry in due:
+        entry['next_run'] = now + entry['interval']
+
+    for entry in sorted(due, key=lambda e: e['next_run']):
+      if self.stopped.is_set():
+        break
+      self._Run(entry)
+    return len(due)
+
+  def _Loop(self):
+    while not self.stopped.is_set():
+      try:
+        self.Reload()
+      except (OSError, ValueError):
+        logger.exception('Could not reload the prefetch watch list %s', self.path)
+      self.RunOnce()
+      with self.lock:
+        next_run = min([e['next_run'] for e in self.entries.values()], default=time.time() + WATCHLIST_POLL)
+      timeout = min(max(0, next_run - time.time()), WATCHLIST_POLL)
+      self.wake.wait(timeout)
+      self.wake.clear()
+
+  def Start(self):
+    with self.lock:
+      if self.thread is not None and self.thread.is_alive():
+        return
+      self.stopped.clear()
+      self.thread = threading.Thread(target=self._Loop, name='prefetch', daemon=True)
+      self.thread.start()
+
+  def Stop(self, timeout=None):
+    self.stopped.set()
+    self.wake.set()
+    if self.thread is not None:
+      self.thread.join(timeout)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def GetPrefetchScheduler():
+  """
+  Returns the process wide PrefetchScheduler, its watch list is kept in the PREFETCH_WATCHLIST file and holds at most
+  PREFETCH_MAX_ENTRIES entries
+  """
+  global _scheduler
+  with _scheduler_lock:
+    if _scheduler is None:
+      _scheduler = PrefetchScheduler(os.getenv('PREFETCH_WATCHLIST', 'prefetch_watchlist.json'),
+                                     int(os.getenv('PREFETCH_INTERVAL', DEFAULT_INTERVAL)),
+                                     max_entries=int(os.getenv('PREFETCH_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)))
+    return _scheduler
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Prefetch the matches of watched summoners in the background')
+  parser.add_argument('--watch', nargs=3, action='append', default=[], metavar=('REGION', 'SUMMONER', 'CHAMPION'),
+                      help='add a summoner and champion to the watch list')
+  parser.add_argument('--once', action='store_true', help='run every entry once and exit')
+  args = parser.parse_args()
+
+  logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'), format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+  scheduler = GetPrefetchScheduler()
+  for region, summoner, champion in args.watch:
+    if scheduler.Watch(region, summoner, champion) is None:
+      logger.warning('Watch list is full, %s on %s is not watched', summoner, champion)
+
+  if args.once:
+    scheduler.RunOnce()
+    return
+
+  scheduler.Start()
+  try:
+    while scheduler.thread.is_alive():
+      scheduler.thread.join(1)
+  except KeyboardInterrupt:
+    scheduler.Stop()
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+from collections import deque
+
+# development key defaults per Riot's policy, (requests, seconds)
+DEFAULT_APP_LIMITS = ((20, 1), (100, 120))
+
+# priority classes of a request, see scheduler.RequestScheduler
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+PREFETCH = 'prefetch'
+
+
+def ParseRateLimitHeader(value):
+  """
+  Parses a Riot rate limit header such as '20:1,100:120' into pairs
+
+  Arguments
+  ---------
+  value : str
+    X-App-Rate-Limit / X-Method-Rate-Limit / *-Count header value
+
+  Returns
+    list of (int, int) tuples, first value is requests/count and second is window seconds
+  """
+  pairs = []
+  if not value:
+    return pairs
+
+  for part in value.split(','):
+    part = part.strip()
+    if ':' not in part:
+      continue
+    count, seconds = part.split(':', 1)
+    try:
+      pairs.append((int(count), int(seconds)))
+    except ValueError:
+      continue
+  return pairs
+
+
+class _Window():
+  """
+  A single rate limit window, eg 20 requests per 1 second
+
+  Every granted request is recorded as a timestamp. A request is only granted while fewer than limit
+  timestamps exist in the last seconds (+ margin), so it never exceeds Riot's fixed windows whatever
+  their alignment is.
+  """
+  def __init__(self, limit, seconds, margin):
+    self.limit = limit
+    self.seconds = seconds
+    self.margin = margin
+    self.stamps = deque()
+
+  def _Prune(self, now):
+    span = self.seconds + self.margin
+    while self.stamps and now - self.stamps[0] >= span:
+      self.stamps.popleft()
+
+  def Wait(self, now, share=1.0):
+    """
+    Returns seconds until this window has room for one more request, 0 if it has room now
+
+    Arguments
+    ---------
+    now : float
+      monotonic time
+    share : float
+      fraction of the limit the request may use, lower priorities leave headroom for interactive requests
+    """
+    self._Prune(now)
+    limit = max(1, int(self.limit * share))
+    if len(self.stamps) < limit:
+      return 0
+    return self.stamps[len(self.stamps) - limit] + self.seconds + self.margin - now
+
+  def Record(self, now):
+    self.stamps.append(now)
+
+  def Sync(self, count, now):
+    """
+    Catches the local log up to the count reported by Riot, eg when another process shares the key
+    """
+    self._Prune(now)
+    missing = count - len(self.stamps)
+    for _ in range(missing):
+      self.stamps.append(now)
+
+
+class RateLimiter():
+  """
+  Thread safe limiter modelling all of Riot's app and method rate limit windows for one api key + region
+
+  Functions
+  ---------
+  Acquire()
+    Blocks until a request for the method may be sent and reserves it, returns seconds waited
+  TryAcquire()
+    Reserves a request for the method if one may be sent now, else returns seconds until one may
+  Headroom()
+    Returns the free fraction of the fullest window a request for the method counts against
+  Update()
+    Synchronizes limits and counts with the headers of a response, handles Retry-After on 429s
+  """
+  def __init__(self, app_limits=DEFAULT_APP_LIMITS, margin=0.05):
+    """
+    Arguments
+    ---------
+    app_limits : iterable
+      (requests, seconds) pairs used until Riot reports the real X-App-Rate-Limit
+    margin : float
+      extra seconds added to each window to absorb clock and network jitter
+
+    Attributes
+    -----------
+    self.app : dict
+      seconds -> _Window for the application rate limit
+    self.methods : dict
+      method name -> {seconds -> _Window} for the method rate limits
+    self.blocked_until : float
+      monotonic time before which no request may be sent, set by Retry-After
+    self.waited : float
+      total seconds callers spent blocked in Acquire()
+    self.requests : int
+      number of requests reserved
+    """
+    self.margin = margin
+    self.requests = 0
+    self.app = {seconds: _Window(limit, seconds, margin) for limit, seconds in app_limits}
+    self.methods = {}
+    self.blocked_until = 0
+    self.waited = 0
+    self.lock = threading.Lock()
+
+  def _Windows(self, method):
+    windows = list(self.app.values())
+    if method is not None:
+      windows.extend(self.methods.get(method, {}).values())
+    return windows
+
+  def TryAcquire(self, method=None, share=1.0):
+    """
+    Arguments
+    ---------
+    method : str
+      name of the endpoint being called, eg 'match', so method limits are respected
+    share : float
+      fraction of each window the request may use, lower priorities leave headroom for higher ones
+
+    Returns
+      float, 0 if the request was reserved, else seconds until it may be
+    """
+    with self.lock:
+      now = time.monotonic()
+      wait = max([self.blocked_until - now] + [w.Wait(now, share) for w in self._Windows(method)])
+      if wait > 0:
+        return wait
+      for window in self._Windows(method):
+        window.Record(now)
+      self.requests += 1
+      return 0
+
+  def Acquire(self, method=None, share=1.0):
+    """
+    Arguments
+    ---------
+    method : str
+      name of the endpoint being called, eg 'match', so method limits are respected
+    share : float
+      fraction of each window the request may use
+
+    Returns
+      float, seconds spent waiting for the rate limit
+    """
+    waited = 0
+    while True:
+      wait = self.TryAcquire(method, share)
+      if wait <= 0:
+        with self.lock:
+          self.waited += waited
+        return waited
+      time.sleep(wait)
+      waited += wait
+
+  def Headroom(self, method=None):
+    """
+    Returns
+      float in [0, 1], free fraction of the fullest window a request for method counts against, 0 while blocked by Retry-After
+    """
+    with self.lock:
+      now = time.monotonic()
+      if self.blocked_until > now:
+        return 0.0
+      headroom = 1.0
+      for window in self._Windows(method):
+        window._Prune(now)
+        headroom = min(headroom, max(0, window.limit - len(window.stamps)) / window.limit)
+      return headroom
+
+  def Usage(self):
+    """
+    Returns
+      dict of 'app' and every method name -> {seconds: [requests in the window, limit]}
+    """
+    with self.lock:
+      now = time.monotonic()
+      usage = {}
+      for name, windows in [('app', self.app)] + sorted(self.methods.items()):
+        for window in windows.values():
+          window._Prune(now)
+        usage[name] = {seconds: [len(w.stamps), w.limit] for seconds, w in sorted(windows.items())}
+      return usage
+
+  def _Apply(self, windows, limits, counts, now):
+    limits = dict((seconds, limit) for limit, seconds in limits)
+    for seconds, limit in limits.items():
+      if seconds in windows:
+        windows[seconds].limit = limit
+      else:
+        windows[seconds] = _Window(limit, seconds, self.margin)
+
+    for seconds in [s for s in windows if limits and s not in limits]:
+      del windows[seconds]
+
+    for count, seconds in counts:
+      if seconds in windows:
+        windows[seconds].Sync(count, now)
+
+  def Update(self, headers, status=200, method=None):
+    """
+    Arguments
+    ---------
+    headers : dict
+      response headers from Riot's api
+    status : int
+      response status code
+    method : str
+      name of the endpoint that was called
+    """
+    with self.lock:
+      now = time.monotonic()
+      self._Apply(self.app,
+                  ParseRateLimitHeader(headers.get('X-App-Rate-Limit')),
+                  ParseRateLimitHeader(headers.get('X-App-Rate-Limit-Count')),
+                  now)
+
+      if method is not None and headers.get('X-Method-Rate-Limit'):
+        windows = self.methods.setdefault(method, {})
+        self._Apply(windows,
+                    ParseRateLimitHeader(headers.get('X-Method-Rate-Limit')),
+                    ParseRateLimitHeader(headers.get('X-Method-Rate-Limit-Count')),
+                    now)
+
+      if status == 429:
+        try:
+          retry_after = float(headers.get('Retry-After', 1))
+        except ValueError:
+          retry_after = 1
+        self.blocked_until = max(self.blocked_until, now + retry_after)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def GetLimiter(key, region):
+  """
+  Returns the process wide RateLimiter shared by every Wrapper using the same api key and region
+  """
+  with _limiters_lock:
+    limiter = _limiters.get((key, region))
+    if limiter is None:
+      limiter = _limiters[(key, region)] = RateLimiter()
+    return limiter
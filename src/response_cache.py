@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import metrics
+
+# seconds a response is kept per endpoint, 0 is not cached. Match details are kept by the match store instead
+TTLS = {'summoner': 86400, 'matchlist': 60, 'match': 0}
+
+
+def CacheKey(region, path, params=None):
+  """
+  Returns the cache key of a request, eg 'na1/lol/match/v4/matchlists/by-account/abc?beginIndex=0&champion=122'
+
+  The api key is sent as a header, it is never part of the key nor of anything stored
+  """
+  key = f'{region}{path}'
+  if params:
+    key += '?' + '&'.join(f'{name}={value}' for name, value in sorted(params.items()))
+  return key
+
+
+class ResponseCache():
+  """
+  Two tier cache of successful Riot api response bodies: a bounded in-process LRU in front of a sqlite file
+
+  Writes to the sqlite tier are queued and flushed in one transaction by a background thread, which also
+  deletes expired rows and the oldest rows over max_rows every compact_interval seconds.
+  Counters 'response_cache_hits' (per tier and method), 'response_cache_misses', 'response_cache_evictions'
+  and 'response_cache_compacted' are kept in metrics
+
+  Functions
+  ---------
+  Get()
+    Returns the cached body of a request or None
+  Put()
+    Caches the body of a successful response for the ttl of its method
+  Flush()
+    Writes the queued responses to the sqlite tier
+  Compact()
+    Deletes the expired and excess rows of the sqlite tier
+  Stats()
+    Returns the size and hit/miss/eviction counts of both tiers
+  """
+  def __init__(self, path, ttls=TTLS, size=5000, max_rows=200000, flush_interval=1.0, flush_size=200, compact_interval=600):
+    """
+    Arguments
+    ---------
+    path : str
+      sqlite file of the persistent tier, None keeps only the in-process tier
+    ttls : dict
+      method name, eg 'matchlist' -> seconds its responses are kept, methods missing or at 0 are not cached
+    size : int
+      maximum number of responses in the in-process tier, the least recently used is evicted first
+    max_rows : int
+      maximum number of responses in the sqlite tier, the ones expiring first are deleted on compaction
+    flush_interval : float
+      seconds between two flushes of the queued writes
+    flush_size : int
+      number of queued writes that triggers a flush right away
+    compact_interval : float
+      seconds between two compactions of the sqlite tier
+    """
+    self.ttls = dict(ttls)
+    self.size = size
+    self.max_rows = max_rows
+    self.flush_interval = flush_interval
+    self.flush_size = flush_size
+    self.compact_interval = compact_interval
+    self.entries = OrderedDict()
+    self.pending = {}
+    self.lock = threading.Lock()
+    self.db_lock = threading.Lock()
+    self.wake = threading.Event()
+    self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'compacted': 0}
+
+    self.db = None
+    if path is not None:
+      self.db = sqlite3.connect(path, check_same_thread=False)
+      self.db.execute('PRAGMA journal_mode=WAL')
+      self.db.execute('CREATE TABLE IF NOT EXISTS responses ('
+                      'key TEXT PRIMARY KEY, method TEXT NOT NULL, body BLOB NOT NULL, expires REAL NOT NULL)')
+      self.db.execute('CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)')
+      self.db.commit()
+      self.thread = threading.Thread(target=self._Loop, name='response-cache', daemon=True)
+      self.thread.start()
+      atexit.register(self.Flush)
+
+  def _Remember(self, key, body, expires):
+    evicted = 0
+    with self.lock:
+      self.entries[key] = (expires, body)
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.size:
+        self.entries.popitem(last=False)
+        evicted += 1
+      self.stats['evictions'] += evicted
+    if evicted:
+      metrics.Increment('response_cache_evictions', evicted)
+
+  def Get(self, method, key):
+    """
+    Arguments
+    ---------
+    method : str
+      name of the endpoint, eg 'matchlist'
+    key : str
+      CacheKey() of the request
+
+    Returns
+      bytes, body of the cached response, None if it is not cached or expired
+    """
+    if not self.ttls.get(method):
+      return None
+
+    now = time.time()
+    with self.lock:
+      entry = self.entries.get(key) or self.pending.get(key)
+      if entry is not None and entry[0] > now:
+        if key in self.entries:
+          self.entries.move_to_end(key)
+        self.stats['memory_hits'] += 1
+        hit = entry[1]
+      else:
+        hit = None
+    if hit is not None:
+      metrics.Increment('response_cache_hits', tier='memory', method=method)
+      return hit
+
+    row = None
+    if self.db is not None:
+      with self.db_lock:
+        row = self.db.execute('SELECT body, expires FROM responses WHERE key = ?', (key,)).fetchone()
+    if row is None or row[1] <= now:
+      with self.lock:
+        self.stats['misses'] += 1
+      metrics.Increment('response_cache_misses', method=method)
+      return None
+
+    body, expires = row
+    self._Remember(key, body, expires)
+    with self.lock:
+      self.stats['disk_hits'] += 1
+    metrics.Increment('response_cache_hits', tier='disk', method=method)
+    return body
+
+  def Put(self, method, key, body):
+    """
+    Arguments
+    ---------
+    method : str
+      name of the endpoint, its ttl decides how long body is kept
+    key : str
+      CacheKey() of the request
+    body : bytes
+      body of a successful response
+    """
+    ttl = self.ttls.get(method)
+    if not ttl:
+      return
+
+    expires = time.time() + ttl
+    self._Remember(key, body, expires)
+    if self.db is None:
+      return
+    with self.lock:
+      self.pending[key] = (expires, body, method)
+      flush = len(self.pending) >= self.flush_size
+    if flush:
+      self.wake.set()
+
+  def Flush(self):
+    """
+    Returns
+      int, number of responses written to the sqlite tier
+    """
+    with self.lock:
+      pending, self.pending = self.pending, {}
+    if not pending or self.db is None:
+      return 0
+    with self.db_lock:
+      self.db.executemany('INSERT OR REPLACE INTO responses (key, method, body, expires) VALUES (?, ?, ?, ?)',
+                          [(key, method, body, expires) for key, (expires, body, method) in pending.items()])
+      self.db.commit()
+    return len(pending)
+
+  def Compact(self):
+    """
+    Returns
+      int, number of rows deleted from the sqlite tier
+    """
+    if self.db is None:
+      return 0
+    with self.db_lock:
+      deleted = self.db.execute('DELETE FROM responses WHERE expires <= ?', (time.time(),)).rowcount
+      deleted += self.db.execute('DELETE FROM responses WHERE key IN '
+                                 '(SELECT key FROM responses ORDER BY expires DESC LIMIT -1 OFFSET ?)',
+                                 (self.max_rows,)).rowcount
+      self.db.commit()
+      self.db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    if deleted:
+      with self.lock:
+        self.stats['compacted'] += deleted
+      metrics.Increment('response_cache_compacted', deleted)
+    return deleted
+
+  def _Loop(self):
+    next_compaction = time.monotonic()
+    while True:
+      self.wake.wait(self.flush_interval)
+      self.wake.clear()
+      try:
+        self.Flush()
+        if time.monotonic() >= next_compaction:
+          self.Compact()
+          next_compaction = time.monotonic() + self.compact_interval
+      except sqlite3.Error:
+        # the queued writes are lost, the responses will simply be requested again
+        metrics.Increment('response_cache_errors')
+
+  def Stats(self):
+    """
+    Returns
+      dict of the entries in memory, rows on disk and queued writes, and the hit, miss, eviction and compaction counts
+    """
+    rows = 0
+    if self.db is not None:
+      with self.db_lock:
+        rows = self.db.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+    with self.lock:
+      return {'memory': len(self.entries), 'disk': rows, 'pending': len(self.pending), **self.stats}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def GetResponseCache():
+  """
+  Returns the process wide ResponseCache, its sqlite file is set by the RESPONSE_CACHE environment variable
+  """
+  global _cache
+  with _cache_lock:
+    if _cache is None:
+      _cache = ResponseCache(os.getenv('RESPONSE_CACHE', 'response_cache.db'))
+    return _cache
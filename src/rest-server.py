@@ -1,13 +1,158 @@
 #!/usr/bin/env python3
 
-from flask import Flask
+import json
+import logging
+import os
+from flask import Flask, Response, request, stream_with_context
 from flask_restful import Resource, Api
 from riot_endpoints import Wrapper
+from batch import Batch
+from stats import MatchupStats, GetStoredColumns, TOP
+from prefetch import GetPrefetchScheduler
+from jobs import GetJobManager, DONE
+from scheduler import Schedulers
+from response_cache import GetResponseCache
+from result_cache import GetResultCache, ETagMatches
+from singleflight import SingleFlight
+from summoner_cache import NormalizeName
+from static_files.status_codes import status_codes
+import metrics
+
+# LOG_LEVEL=DEBUG turns on the per request and per match tracing
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'), format='%(asctime)s %(levelname)s %(name)s: %(message)s')
 
 app = Flask(__name__)
 app.config['JSON_SORT_KEYS'] = False
 api = Api(app)
 
+MAX_CONCURRENCY = 20
+MAX_SCAN = 500
+# longest a job long-poll blocks for, in seconds
+MAX_JOB_WAIT = 30
+# most queries accepted by one batch
+MAX_BATCH = 50
+# stored games aggregated by MatchupStatsStored() by default and at most
+STATS_GAMES = 2000
+MAX_STATS_GAMES = 20000
+
+riotcall_flight = SingleFlight('riotcall')
+results = GetResultCache()
+jobs = GetJobManager()
+
+# the watch list is served here, the prefetching itself only runs in the process started by __main__ below
+prefetcher = GetPrefetchScheduler()
+
+def WrapperOptions():
+  """
+  Reads the optional Wrapper() arguments from the query string of the current request
+
+  Returns
+    dict of keyword arguments for Wrapper()
+  """
+  return {
+    'concurrency': min(request.args.get('concurrency', 8, type=int), MAX_CONCURRENCY),
+    'hits': request.args.get('hits', type=int),
+    'max_scan': min(request.args.get('max_scan', 50, type=int), MAX_SCAN),
+    'begin_index': request.args.get('beginIndex', 0, type=int),
+    'end_index': request.args.get('endIndex', type=int),
+    'begin_time': request.args.get('beginTime', type=int),
+  }
+
+def StatsOptions():
+  """
+  Reads the MatchupStats() filters from the query string of the current request
+
+  Returns
+    dict of keyword arguments for MatchupStats()
+  """
+  patches = [p for value in request.args.getlist('patch') for p in value.split(',') if p]
+  return {
+    'patches': patches or None,
+    'begin_time': request.args.get('beginTime', type=int),
+    'end_time': request.args.get('endTime', type=int),
+    'top': min(request.args.get('top', TOP, type=int), 50),
+  }
+
+def ErrorResponse(status):
+  """
+  Turns a status code returned by the Wrapper() into a json error response
+  """
+  return {'status': status, 'message': status_codes.get(status, 'Unknown error')}, status
+
+def QueryError(region, champion, enemy_champion):
+  """
+  Validates the region and champion names of a query before anything is requested
+
+  Returns
+    ErrorResponse() with 400 for an invalid region or 404 for an unknown champion, None if the query is valid
+  """
+  info = Wrapper(region, '', champion, enemy_champion)
+  if info.CheckValidRegion() == False:
+    return ErrorResponse(400)
+  if info.CheckValidChampions() == False:
+    return ErrorResponse(404)
+  return None
+
+def Breakdown(region, username, champion, enemy_champion, options):
+  """
+  Runs Wrapper().MatchBreakdown() for one query
+
+  Returns
+    dict of match details or the failed status code
+  """
+  info = Wrapper(region, username, champion, enemy_champion, **options)
+  return info.MatchBreakdown()
+
+def QueryKey(region, username, champion, enemy_champion, options):
+  """
+  Returns
+    hashable key identifying a query, the same for every spelling of the summoner and champion names
+  """
+  return (region, NormalizeName(username), champion.lower(), enemy_champion.lower(), tuple(sorted(options.items())))
+
+def SharedBreakdown(region, username, champion, enemy_champion, options):
+  """
+  Breakdown() shared by identical concurrent queries, whether they come from RiotCall() or a job
+  """
+  key = QueryKey(region, username, champion, enemy_champion, options)
+  with metrics.Timer('riotcall'):
+    return riotcall_flight.Do(key, Breakdown, region, username, champion, enemy_champion, options)
+
+@app.route('/metrics')
+def Metrics():
+  """
+  Query Parameters
+  ----------------
+  format : str
+    'prometheus' (default) for the Prometheus text format, 'json' for a json snapshot
+
+  Returns
+  -------
+    process wide counters and stage timings, eg SummonerV4/MatchV4 requests, rate limit waits, decode and cache hits
+  """
+  if request.args.get('format') == 'json':
+    return metrics.Snapshot()
+  return Response(metrics.Render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache')
+def CacheStats():
+  """
+  Returns
+  -------
+    size of the in-memory and on-disk tiers of the response cache and their hit, miss, eviction and compaction counts,
+    and under 'results' the entries and hit, miss, invalidation and eviction counts of the RiotCall() result cache
+  """
+  return {**GetResponseCache().Stats(), 'results': results.Stats()}
+
+@app.route('/scheduler')
+def SchedulerStats():
+  """
+  Returns
+  -------
+    per region, the requests waiting per priority class and the requests and rate limit usage of every api key
+  """
+  return {region: scheduler.Stats() for region, scheduler in Schedulers().items()}
+
 @app.route('/<region>/username=<username>&champion=<champion>&enemy_champion=<enemy_champion>')
 def RiotCall(region, username, champion, enemy_champion):
   """
@@ -22,16 +167,345 @@ def RiotCall(region, username, champion, enemy_champion):
   enemy_champion : str
     which champion the user is playing against
   
+  Query Parameters
+  ----------------
+  concurrency : int
+    number of match details fetched at the same time, defaults to 8 and is capped at MAX_CONCURRENCY
+  hits : int
+    stop once this many matchups were found
+  max_scan : int
+    maximum number of matchlist games to scan, defaults to 50 and is capped at MAX_SCAN
+  beginIndex, endIndex : int
+    range of the matchlist to scan, paged through 100 games at a time
+  beginTime : int
+    epoch milliseconds, only games played after it are scanned
+
+  Headers
+  -------
+  If-None-Match : str
+    entity tag of a result the client holds, answered with 304 if the query still finds the same games
+  Accept-Encoding : str
+    the result is gzip or deflate encoded when the client accepts it
+
   Attributes
-    info : object
-      creating object for Wrapper() class
+    options : dict
+      Wrapper() keyword arguments read from the query string
 
   Returns
   -------
-    info.MatchBreakdown(), a json response of the Wrapper()
+    Wrapper().MatchBreakdown() as json, shared by identical concurrent queries, or a json error with the failed status code.
+    The json is served from the result cache, with a strong ETag, until new matching games are found
   """
-  info = Wrapper(region, username, champion, enemy_champion)
-  return info.MatchBreakdown()
+  error = QueryError(region, champion, enemy_champion)
+  if error is not None:
+    return error
+
+  options = WrapperOptions()
+
+  # identical queries arriving together share one breakdown
+  match_dict = SharedBreakdown(region, username, champion, enemy_champion, options)
+  if isinstance(match_dict, int):
+    return ErrorResponse(match_dict)
+
+  entry = results.Put(QueryKey(region, username, champion, enemy_champion, options), match_dict)
+  encoding = results.Encoding(entry, request.headers.get('Accept-Encoding'))
+  headers = {'ETag': entry.ETag(encoding), 'Vary': 'Accept-Encoding', 'Cache-Control': 'no-cache'}
+
+  if ETagMatches(request.headers.get('If-None-Match'), entry.ETags()):
+    metrics.Increment('riotcall_not_modified')
+    return Response(status=304, headers=headers)
+
+  if encoding is not None:
+    headers['Content-Encoding'] = encoding
+  return Response(entry.Encoded(encoding), mimetype='application/json', headers=headers)
+
+@app.route('/<region>/username=<username>&champion=<champion>&enemy_champion=<enemy_champion>/stream')
+def RiotCallStream(region, username, champion, enemy_champion):
+  """
+  Streaming variant of RiotCall(), each match is sent as soon as it is decoded followed by a summary record
+
+  Arguments
+  ---------
+  same as RiotCall()
+
+  Query Parameters
+  ----------------
+  format : str
+    'ndjson' (default) for one json object per line, 'sse' for Server-Sent Events
+  concurrency, hits, max_scan, beginIndex, endIndex, beginTime
+    same as RiotCall()
+
+  Returns
+  -------
+    streamed response of {gameId: match details} records and a final {'summary': {...}} record
+  """
+  error = QueryError(region, champion, enemy_champion)
+  if error is not None:
+    return error
+
+  sse = request.args.get('format', 'ndjson') == 'sse'
+  info = Wrapper(region, username, champion, enemy_champion, **WrapperOptions())
+
+  # summoner and matchlist errors are still returned as a normal error response
+  match_info = info.MatchInfo()
+  if info.status != 200:
+    return ErrorResponse(match_info)
+
+  def Record(event, record):
+    if sse:
+      return f'event: {event}\ndata: {json.dumps(record)}\n\n'
+    return json.dumps(record) + '\n'
+
+  def Generate():
+    game_ids = []
+    for matchup in info.IterMatchBreakdown(match_info):
+      game_ids.append(matchup.game_id)
+      yield Record('match', matchup.ToJson())
+
+    summary = {'status': info.status, 'matches': len(game_ids), 'scanned': info.scanned, 'gameIds': game_ids}
+    if info.status != 200:
+      summary['message'] = status_codes.get(info.status, 'Unknown error')
+    yield Record('summary', {'summary': summary})
+
+  mimetype = 'text/event-stream' if sse else 'application/x-ndjson'
+  return Response(stream_with_context(Generate()), mimetype=mimetype, headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/<region>/username=<username>&champion=<champion>&enemy_champion=<enemy_champion>/stats')
+def RiotCallStats(region, username, champion, enemy_champion):
+  """
+  Aggregate variant of RiotCall(), the matchups found are summarized instead of returned one by one
+
+  Arguments
+  ---------
+  same as RiotCall()
+
+  Query Parameters
+  ----------------
+  concurrency, hits, max_scan, beginIndex, endIndex, beginTime
+    same as RiotCall()
+  patch : str
+    only count games of these patches, eg 10.10, comma separated or repeated
+  endTime : int
+    epoch milliseconds, only count games created before it
+  top : int
+    number of most frequent items, runes, stat perks and spells returned, defaults to TOP
+
+  Returns
+  -------
+    MatchupStats() of the matchups as json, or a json error with the failed status code
+  """
+  error = QueryError(region, champion, enemy_champion)
+  if error is not None:
+    return error
+
+  info = Wrapper(region, username, champion, enemy_champion, **WrapperOptions())
+  match_info = info.MatchInfo()
+  if info.status != 200:
+    return ErrorResponse(match_info)
+
+  matchups = list(info.IterMatchBreakdown(match_info))
+  if info.status != 200:
+    return ErrorResponse(info.status)
+
+  return {'champion': info.champion, 'enemyChampion': info.enemy_champion, 'scanned': info.scanned,
+          **MatchupStats(matchups, **StatsOptions())}
+
+@app.route('/<region>/champion=<champion>&enemy_champion=<enemy_champion>/stats')
+def MatchupStatsStored(region, champion, enemy_champion):
+  """
+  Summarizes every stored game of region where champion faced enemy_champion, whoever played them, without
+  requesting Riot's api
+
+  Arguments
+  ---------
+  region : str
+    valid region the games were played in
+  champion : str
+    champion the statistics are about
+  enemy_champion : str
+    champion played against
+
+  Query Parameters
+  ----------------
+  patch, beginTime, endTime, top
+    same as RiotCallStats()
+  limit : int
+    only the newest limit games are counted, defaults to STATS_GAMES and is capped at MAX_STATS_GAMES
+
+  Returns
+  -------
+    MatchupStats() of the stored matchups as json, or a json error with the failed status code.
+    The columns of a matchup are cached, later requests only decode the games stored since
+  """
+  error = QueryError(region, champion, enemy_champion)
+  if error is not None:
+    return error
+
+  info = Wrapper(region, '', champion, enemy_champion)
+
+  limit = min(request.args.get('limit', STATS_GAMES, type=int), MAX_STATS_GAMES)
+  columns = GetStoredColumns().Get(region, info.champion_id, info.enemy_champion_id, limit)
+  return {'champion': info.champion, 'enemyChampion': info.enemy_champion, **MatchupStats(columns, **StatsOptions())}
+
+@app.route('/batch', methods=['POST'])
+def BatchCall():
+  """
+  Breaks down many matchups at once, each summoner, matchlist and match they share is requested only once
+
+  Body
+  ----
+  json object {'queries': [{'region', 'username', 'champion', 'enemy_champion'}, ...]}, at most MAX_BATCH queries
+
+  Query Parameters
+  ----------------
+  concurrency, max_scan, beginIndex, endIndex, beginTime
+    same as RiotCall(), applied to every query
+
+  Returns
+  -------
+    {'results': [...]} in the order of the queries, each the query with its status and its matches or error message
+  """
+  body = request.get_json(silent=True) or {}
+  queries = body.get('queries')
+  fields = ('region', 'username', 'champion', 'enemy_champion')
+  if (not isinstance(queries, list) or not 0 < len(queries) <= MAX_BATCH
+      or not all(isinstance(q, dict) and all(isinstance(q.get(f), str) for f in fields) for q in queries)):
+    return ErrorResponse(400)
+
+  options = WrapperOptions()
+  # every query is scanned to max_scan so the shared matches are fetched together
+  del options['hits']
+  batch = Batch([tuple(q[f] for f in fields) for q in queries], **options)
+
+  results = []
+  for query, result in zip(queries, batch.Run()):
+    entry = {f: query[f] for f in fields}
+    if isinstance(result, int):
+      entry.update(status=result, message=status_codes.get(result, 'Unknown error'))
+    else:
+      entry.update(status=200, matches=result)
+    results.append(entry)
+  return {'results': results}
+
+@app.route('/jobs/<region>/username=<username>&champion=<champion>&enemy_champion=<enemy_champion>', methods=['POST'])
+def SubmitJob(region, username, champion, enemy_champion):
+  """
+  Asynchronous variant of RiotCall(), the breakdown runs on the job threads and the request returns right away
+
+  Arguments
+  ---------
+  same as RiotCall()
+
+  Query Parameters
+  ----------------
+  concurrency, hits, max_scan, beginIndex, endIndex, beginTime
+    same as RiotCall()
+
+  Returns
+  -------
+    202 with the job id and its location to poll, 400 or 404 for an invalid region or champion, 503 when too many jobs are unfinished
+  """
+  error = QueryError(region, champion, enemy_champion)
+  if error is not None:
+    return error
+
+  job = jobs.Submit(SharedBreakdown, region, username, champion, enemy_champion, WrapperOptions())
+  if job is None:
+    return ErrorResponse(503)
+
+  location = f'/jobs/{job.job_id}'
+  return {**job.ToJson(), 'location': location}, 202, {'Location': location}
+
+@app.route('/jobs/<job_id>', methods=['GET', 'DELETE'])
+def JobResult(job_id):
+  """
+  GET polls a job submitted by SubmitJob(), DELETE cancels it if it has not started yet
+
+  Arguments
+  ---------
+  job_id : str
+    id returned by SubmitJob()
+
+  Query Parameters
+  ----------------
+  wait : float
+    seconds to block for the job to finish, capped at MAX_JOB_WAIT, 0 (default) answers right away
+
+  Returns
+  -------
+    200 with the job and RiotCall()'s result once finished, 202 with the job while it is queued or running,
+    404 if the job is unknown or its result expired
+  """
+  if request.method == 'DELETE':
+    if not jobs.Cancel(job_id):
+      return ErrorResponse(409 if jobs.Get(job_id) is not None else 404)
+    return {'jobId': job_id, 'state': 'cancelled'}
+
+  wait = min(max(request.args.get('wait', 0, type=float), 0), MAX_JOB_WAIT)
+  job = jobs.Wait(job_id, wait)
+  if job is None:
+    return ErrorResponse(404)
+
+  if job.state != DONE:
+    return job.ToJson(), 202, {'Retry-After': '1'}
+
+  if job.error is not None:
+    return {**job.ToJson(), 'status': 500, 'message': status_codes.get(500, 'Unknown error')}, 500
+  if isinstance(job.result, int):
+    status, message = job.result, status_codes.get(job.result, 'Unknown error')
+    return {**job.ToJson(), 'status': status, 'message': message}, status
+  return {**job.ToJson(), 'status': 200, 'result': job.result}
+
+@app.route('/prefetch')
+def PrefetchList():
+  """
+  Returns
+  -------
+    the watch list of the prefetch scheduler, with the time, status and games scanned of the last run of each entry
+  """
+  return {'watching': prefetcher.List()}
+
+@app.route('/prefetch/<region>/username=<username>&champion=<champion>', methods=['PUT', 'DELETE'])
+def Prefetch(region, username, champion):
+  """
+  PUT adds username and champion to the watch list, their new matches are then fetched in the background
+  using only idle rate limit capacity. DELETE removes them
+
+  Arguments
+  ---------
+  region : str
+    valid region to look username up in
+  username : str
+    summoner league name of the watched user
+  champion : str
+    champion whose games are prefetched
+
+  Query Parameters
+  ----------------
+  interval : int
+    seconds between two syncs of the matchlist, PUT only
+
+  Returns
+  -------
+    the watch list entry, or a json error with the failed status code, 503 when the watch list is full
+  """
+  if request.method == 'DELETE':
+    if not prefetcher.Unwatch(region, username, champion):
+      return ErrorResponse(404)
+    return {'status': 200, 'region': region, 'summoner': username, 'champion': champion}
+
+  error = QueryError(region, champion, None)
+  if error is not None:
+    return error
+  entry = prefetcher.Watch(region, username, champion, request.args.get('interval', type=int))
+  if entry is None:
+    return ErrorResponse(503)
+  return entry
 
 if __name__ == '__main__':
+  # watched summoners are prefetched in the background unless PREFETCH=0. With the reloader only its child
+  # process serves, so the parent never starts a second prefetcher. Servers running several workers import
+  # this module instead and run one `python prefetch.py` next to them
+  if os.getenv('PREFETCH', '1') != '0' and os.getenv('WERKZEUG_RUN_MAIN') == 'true':
+    prefetcher.Start()
   app.run(debug=True)
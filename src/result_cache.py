@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import zlib
+from collections import OrderedDict
+import metrics
+
+# content codings served, in order of preference when a client accepts several equally
+ENCODINGS = ('gzip', 'deflate')
+
+# bodies smaller than this many bytes are sent uncompressed
+MIN_COMPRESS = 1024
+
+
+def AcceptedEncoding(accept_encoding, encodings=ENCODINGS):
+  """
+  Picks the content coding of a response from the Accept-Encoding header of its request
+
+  Arguments
+  ---------
+  accept_encoding : str
+    value of the Accept-Encoding header, eg 'gzip, deflate;q=0.5', None or '' if missing
+  encodings : tuple
+    codings that may be chosen, most preferred first
+
+  Returns
+    str, the accepted coding with the highest q value, None for an uncompressed response
+  """
+  accepted = {}
+  for part in (accept_encoding or '').split(','):
+    coding, _, params = part.strip().partition(';')
+    q = 1.0
+    params = params.strip()
+    if params.startswith('q='):
+      try:
+        q = float(params[2:])
+      except ValueError:
+        q = 0.0
+    accepted[coding.strip().lower()] = q
+
+  best, best_q = None, 0.0
+  for coding in encodings:
+    q = accepted.get(coding, accepted.get('*', 0.0))
+    if q > best_q:
+      best, best_q = coding, q
+  return best
+
+def ETagMatches(if_none_match, etags):
+  """
+  Arguments
+  ---------
+  if_none_match : str
+    value of the If-None-Match header, a comma separated list of entity tags or '*'
+  etags : iterable
+    quoted entity tags of the current result
+
+  Returns
+    bool, True if the client already holds the current result and may be answered 304
+  """
+  if not if_none_match:
+    return False
+  if if_none_match.strip() == '*':
+    return True
+  # If-None-Match uses the weak comparison
+  tags = {tag.strip()[2:] if tag.strip().startswith('W/') else tag.strip() for tag in if_none_match.split(',')}
+  return any(etag in tags for etag in etags)
+
+
+class CachedResult():
+  """
+  Serialized result of one query, with its encoded bodies built on first use
+
+  Attributes
+  ----------
+  game_ids : frozenset
+    gameIds included in the result, the entry stays valid as long as a rebuild finds the same ones
+  tag : str
+    hash of the sorted gameIds the entity tags are made of
+  body : bytes
+    result as json
+  """
+  def __init__(self, game_ids, body):
+    self.game_ids = frozenset(game_ids)
+    self.tag = hashlib.sha1(','.join(str(game_id) for game_id in sorted(self.game_ids)).encode()).hexdigest()
+    self.body = body
+    self.encoded = {None: body}
+    self.lock = threading.Lock()
+
+  def ETag(self, encoding=None):
+    """
+    Returns
+      quoted strong entity tag of the body in encoding, each content coding getting its own
+    """
+    return f'"{self.tag}-{encoding}"' if encoding else f'"{self.tag}"'
+
+  def ETags(self):
+    """
+    Returns
+      the entity tags of the body in every coding
+    """
+    return [self.ETag(encoding) for encoding in (None,) + ENCODINGS]
+
+  def Encoded(self, encoding):
+    """
+    Arguments
+    ---------
+    encoding : str
+      'gzip', 'deflate' or None
+
+    Returns
+      bytes, the body in encoding, compressed once and kept
+    """
+    with self.lock:
+      body = self.encoded.get(encoding)
+      if body is None:
+        with metrics.Timer('result_compress'):
+          # mtime is fixed so the same result always compresses to the same bytes, as a strong tag requires
+          body = gzip.compress(self.body, mtime=0) if encoding == 'gzip' else zlib.compress(self.body)
+        self.encoded[encoding] = body
+      return body
+
+
+class ResultCache():
+  """
+  Bounded LRU of the serialized results of RiotCall() per query
+
+  An entry is only replaced when a rebuilt result holds a different set of gameIds, so its json, compressed
+  bodies and entity tags are reused across requests until new matching games are found.
+  Counters 'result_cache_hits', 'result_cache_misses', 'result_cache_invalidations' and
+  'result_cache_evictions' are kept in metrics
+
+  Functions
+  ---------
+  Get()
+    Returns the entry of a query or None
+  Put()
+    Returns the entry of a query for a rebuilt result, serializing it only if its gameIds changed
+  Stats()
+    Returns the number of entries and their hit, miss, invalidation and eviction counts
+  """
+  def __init__(self, size=1000, min_compress=MIN_COMPRESS):
+    """
+    Arguments
+    ---------
+    size : int
+      maximum number of queries kept, the least recently used is evicted first
+    min_compress : int
+      bodies smaller than this many bytes are sent uncompressed
+    """
+    self.size = size
+    self.min_compress = min_compress
+    self.entries = OrderedDict()
+    self.lock = threading.Lock()
+    self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'evictions': 0}
+
+  def Get(self, key):
+    """
+    Arguments
+    ---------
+    key : tuple
+      key of the query, as built by the rest server
+
+    Returns
+      CachedResult or None
+    """
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is not None:
+        self.entries.move_to_end(key)
+      return entry
+
+  def Put(self, key, result):
+    """
+    Arguments
+    ---------
+    key : tuple
+      key of the query
+    result : dict
+      gameId -> match details, as Wrapper().MatchBreakdown() returns them
+
+    Returns
+      CachedResult of the query, the one already cached if result holds the same gameIds
+    """
+    game_ids = frozenset(result)
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is not None and entry.game_ids == game_ids:
+        self.entries.move_to_end(key)
+        self.stats['hits'] += 1
+        hit = True
+      else:
+        hit = False
+        self.stats['misses' if entry is None else 'invalidations'] += 1
+    if hit:
+      metrics.Increment('result_cache_hits')
+      return entry
+    metrics.Increment('result_cache_misses' if entry is None else 'result_cache_invalidations')
+
+    with metrics.Timer('result_serialize'):
+      entry = CachedResult(game_ids, json.dumps(result).encode())
+
+    evicted = 0
+    with self.lock:
+      self.entries[key] = entry
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.size:
+        self.entries.popitem(last=False)
+        evicted += 1
+      self.stats['evictions'] += evicted
+    if evicted:
+      metrics.Increment('result_cache_evictions', evicted)
+    return entry
+
+  def Encoding(self, entry, accept_encoding):
+    """
+    Returns
+      the content coding entry is sent in for a request with the Accept-Encoding header accept_encoding
+    """
+    if len(entry.body) < self.min_compress:
+      return None
+    return AcceptedEncoding(accept_encoding)
+
+  def Stats(self):
+    """
+    Returns
+      dict of the number of entries and the hit, miss, invalidation and eviction counts
+    """
+    with self.lock:
+      return {'entries': len(self.entries), **self.stats}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def GetResultCache():
+  """
+  Returns the process wide ResultCache, its size is set by the RESULT_CACHE_SIZE environment variable
+  """
+  global _cache
+  with _cache_lock:
+    if _cache is None:
+      _cache = ResultCache(int(os.getenv('RESULT_CACHE_SIZE', 1000)))
+    return _cache
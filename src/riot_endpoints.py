@@ -1,21 +1,39 @@
 #!/usr/bin/env python3
 
+import logging
 import os
 import requests
 import time
-from static_files.perks_dict import perks_dict
-from static_files.items_dict import items_dict
-from static_files.champions_dict import champions, champions_inv
+from static_files.registry import registry
 from static_files.status_codes import status_codes
-from static_files.runes_dict import runes_dict
-from static_files.summoners_dict import summoners_dict
 from dotenv import load_dotenv
-from collections import OrderedDict
-import requests_cache
-requests_cache.install_cache('wrapper_cache', backend='sqlite', expire_after=86400)
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from rate_limiter import INTERACTIVE, PREFETCH
+from scheduler import GetScheduler
+from match_decoder import DecodeMatch, Loads, Matchup
+from match_store import GetMatchStore
+from matchup_index import GetMatchupIndex
+from sync_state import GetSyncState
+from singleflight import SingleFlight
+import metrics
+from summoner_cache import summoner_cache, NormalizeName
+from http_session import GetSession, Backoff, RETRY_STATUS, TIMEOUT
+from response_cache import GetResponseCache, CacheKey
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# most games MatchV4 returns per matchlist request
+MATCHLIST_PAGE = 100
+
+# longest beginTime range MatchV4 accepts, in milliseconds, with a margin
+SYNC_WINDOW = (7 * 24 - 1) * 3600 * 1000
+
+summoner_flight = SingleFlight('summoner')
+match_flight = SingleFlight('match')
+
 class Wrapper():
   """
   Class containing wrapper functions to the Riot Api
@@ -24,14 +42,38 @@ class Wrapper():
   ---------
   CheckValidRegion()
     Validates that the region input into the url is valid per Riot's API. Prevents rerouting of API key to another url
+  CheckValidChampions()
+    Validates that the given champion names are known, so a misspelled name never becomes an unfiltered matchlist request
+  Request()
+    Sends a GET request through the response cache, request scheduler and pooled session of the region, retrying 429/5xx responses
   SummonerData()
-    Endpoint to SummonerV4 to retrieve summoner information and returns username, account_id, self.status, headers
+    Endpoint to SummonerV4 to retrieve summoner information and returns username, account_id, self.status
+  LookupSummoner()
+    Requests a summoner from SummonerV4 and stores it in the summoner cache
   MatchInfo()
     Endpoint to MatchV4 to retrieve a list of gameId's filtered by where champion exists
+  SyncMatchList()
+    Merges the stored matchlist with the games played since the newest stored one
+  MatchList()
+    Endpoint to MatchV4 to retrieve one page of the matchlist starting at a given index
+  MatchDetails()
+    Endpoint to MatchV4 to retrieve the details of a single gameId
+  FetchMatch()
+    Requests a single gameId from MatchV4 and stores and indexes it
+  Candidates()
+    Filters the matchlist gameId's through the matchup index so only unknown games and known matchups are broken down
+  ParseMatch()
+    Returns the Matchup of a decoded match where champion faced enemy_champion
+  IterMatchBreakdown()
+    Generator yielding the Matchup of each match where champion faced enemy_champion as soon as it is decoded
   MatchBreakDown()
     Iterates through the MatchInfo id's to check where champion and enemy_champion exist and returns a dict for the rest api to later be used for SpoofBot
+  Ingest()
+    Syncs the matchlist of champion and stores and indexes every game of it not stored yet
   """
-  def __init__(self, region, summoner, champion, enemy_champion):
+  def __init__(self, region, summoner, champion, enemy_champion, concurrency=8,
+               hits=None, max_scan=50, begin_index=0, end_index=None, begin_time=None, incremental=True,
+               priority=INTERACTIVE):
     """
     Arguments
     ---------
@@ -40,64 +82,98 @@ class Wrapper():
     summoner : str
       username/player desired to look up
     champion : str
-      champion the player played
+      champion the player played, None for the whole matchlist
     enemy_champion : str
-      champion the player played against
+      champion the player played against, None when only ingesting with Ingest()
+    concurrency : int
+      number of match details requested at the same time by MatchBreakdown()
+    hits : int
+      stop scanning once this many matchups were found, None scans up to max_scan
+    max_scan : int
+      maximum number of matchlist games to scan
+    begin_index : int
+      index in the matchlist of the first game to scan
+    end_index : int
+      index in the matchlist after the last game to scan, None for no limit
+    begin_time : int
+      epoch milliseconds, only games played after it are scanned
+    incremental : bool
+      reuse the stored matchlist of the summoner and champion, asking MatchV4 only for newer games.
+      Ignored when begin_index, end_index or begin_time are given
+    priority : str
+      priority class of the requests, rate_limiter.INTERACTIVE, rate_limiter.BATCH or rate_limiter.PREFETCH
     
     Attributes
     -----------
-    self.rate : int
-      unit messages for Riot's policy (20 requests per 1 second)
-    self.per : int
-      unit seconds for Riot's policy (20 requests per 1 second)
-    self.totalT : int
-      storing the total time that has passed since the request was made, this is checking 1 second
-    self.rate2 : int
-      unit messages for Riot's policy (100 requests per 100 seconds)
-    self.per2 : int
-      unit seconds for Riot's policy (100 requests per 100 second)
-    self.totalT2 : int
-       storing the total time that has passed since the request was made, this is checking for 120 seconds
-    self.wait : int
-      sleep timer to wait for next requests if condition met for rate limiter
+    self.scheduler : RequestScheduler
+      process wide scheduler of the region, shared by every Wrapper, spreading requests over the api keys.
+      Only looked up by the first request, so an invalid region never gets one
+    self.cache : ResponseCache
+      process wide cache of summoner and matchlist responses, in memory and on disk
+    self.wait : float
+      total seconds this wrapper spent waiting on the scheduler
+    self.store : MatchStore
+      permanent local store of finished matches, checked before requesting MatchV4
+    self.index : MatchupIndex
+      champion vs enemy champion index of the stored matches, used to skip games without the matchup
+    self.account_id : str
+      account id of the summoner, set by SummonerData()
+    self.sync : SyncState
+      stored matchlists per (region, account, champion, queue) for incremental queries
+    self.queue_id : int
+      queue the matchlist is filtered by, 420 ranked solo/duo
+    self.scanned : int
+      number of matchlist games scanned by the last IterMatchBreakdown()
     
-    self.key : str
-      riot api key
     self.regions : list
       valid regions per Riot's api docs
     self.hostname : string
       formatted string, region +  api.riotgames.com
+    self.base_url : string
+      url requests are sent to, https://{hostname} unless RIOT_API_BASE points somewhere else, eg benchmarks/fake_riot_api.py
     self.status : int
       keeping track of the status returned from the request, used to check for any errors
     self.status_codes : dict
       contains keys of status code ints with values of string for the type of status
     self.champion_id : int
-      getting champion id from the champion dict
+      getting champion id from the static data registry, names are matched ignoring case, spaces and punctuation
     self.enemy_champion_id : int
-      getting enemy champion id from the champion dict
+      getting enemy champion id from the static data registry
     """
-    self.rate = 20
-    self.per = 1
-    self.totalT = 0
-    
-    self.rate2 = 100
-    self.per2 = 120
-    self.totalT2 = 0
-    self.wait = 0
-
     self.region = region
     self.summoner = summoner
-    self.champion = champion.capitalize()
-    self.enemy_champion = enemy_champion.capitalize()
+    self.champion = champion.capitalize() if champion else None
+    self.enemy_champion = enemy_champion.capitalize() if enemy_champion else None
+    self.concurrency = max(1, int(concurrency))
+    self.hits = hits
+    self.max_scan = max_scan
+    self.begin_index = begin_index
+    self.end_index = end_index
+    self.begin_time = begin_time
+    self.priority = priority
+    self.queue_id = 420
 
-    self.key = os.getenv('API_KEY')
     self.regions = ['br1', 'eun1', 'euw1', 'jp1', 'kr', 'la1', 'la2', 'na1', 'oc1', 'ru', 'tr1'];
     self.hostname = f'{self.region}.api.riotgames.com'
+    self.base_url = os.getenv('RIOT_API_BASE', 'https://{region}.api.riotgames.com').format(region=self.region)
 
     self.status = 0 
     self.status_codes = status_codes
-    self.champion_id = champions.get(self.champion)
-    self.enemy_champion_id = champions.get(self.enemy_champion)
+    self.scheduler = None
+    self.cache = GetResponseCache()
+    self.store = GetMatchStore()
+    self.index = GetMatchupIndex()
+    self.sync = GetSyncState()
+    self.sync_key = None
+    self.account_id = None
+    self.scanned = 0
+    self.wait = 0
+    self.champion_id = registry.Latest().ChampionId(champion) if champion else None
+    self.enemy_champion_id = registry.Latest().ChampionId(enemy_champion) if enemy_champion else None
+    # the synced matchlist is only used when the query does not page through the matchlist itself,
+    # and is kept per champion so the whole matchlist is never synced
+    self.incremental = (incremental and begin_index == 0 and end_index is None and begin_time is None
+                        and self.champion_id is not None)
   
   def CheckValidRegion(self):
     """
@@ -108,201 +184,455 @@ class Wrapper():
     """
     return self.region in self.regions
 
+  def CheckValidChampions(self):
+    """
+    Validates that champion and enemy_champion, when given, are known to the static data registry. Prevents
+    sending an unfiltered matchlist request for a misspelled champion
+
+    Returns
+      bool value, True if every given champion name was found, else False
+    """
+    return ((self.champion is None or self.champion_id is not None)
+            and (self.enemy_champion is None or self.enemy_champion_id is not None))
+
+  def Request(self, path, method, params=None, retries=3, decode=True):
+    """
+    Sends a GET request to Riot's api with the api key picked by the scheduler and the pooled keep-alive session of the region
+
+    Successful responses are answered from and kept in the response cache for the ttl of their method.
+    429 and 5xx responses are retried with jittered exponential backoff, respecting Retry-After
+
+    Arguments
+    ---------
+    path : str
+      path of the endpoint, eg /lol/match/v4/matches/{gameId}
+    method : str
+      name of the endpoint for method rate limits, eg 'summoner', 'matchlist' or 'match'
+    params : dict
+      query string parameters of the request
+    retries : int
+      number of times a failed request is retried
+    decode : bool
+      parse the json response, False returns the raw body, eg to decode it in another process
+
+    Returns
+      status, json response of the request or None if the request failed
+    """
+    cache_key = CacheKey(self.region, path, params)
+    body = self.cache.Get(method, cache_key)
+    if body is not None:
+      return 200, Loads(body) if decode else body
+
+    # the api key is never sent to a host outside of Riot's regions
+    if not self.CheckValidRegion():
+      return 400, None
+    if self.scheduler is None:
+      self.scheduler = GetScheduler(self.region)
+
+    url = f'{self.base_url}{path}'
+    session = GetSession(self.hostname)
+
+    for attempt in range(retries + 1):
+      key, waited = self.scheduler.Acquire(method, self.priority)
+      metrics.Observe('ratelimit_wait', waited, method=method, priority=self.priority)
+      if waited:
+        logger.debug('Rate limit reached, waited %.2f seconds to continue', waited)
+      self.wait += waited
+
+      start = time.perf_counter()
+      try:
+        response = session.get(url, params=params, headers={'X-Riot-Token': key}, timeout=TIMEOUT)
+      except requests.Timeout:
+        status, retry_after = 504, None
+      except requests.RequestException:
+        status, retry_after = 503, None
+      else:
+        status, retry_after = response.status_code, response.headers.get('Retry-After')
+        self.scheduler.Update(key, response.headers, status, method)
+        logger.debug('Current limit: %s', response.headers.get('X-App-Rate-Limit-Count'))
+
+      metrics.Observe('riot_request', time.perf_counter() - start, method=method)
+      metrics.Increment('riot_requests', method=method, status=status)
+
+      if status == 200:
+        if not decode:
+          self.cache.Put(method, cache_key, response.content)
+          return status, response.content
+        try:
+          data = Loads(response.content)
+        except ValueError:
+          return 502, None
+        self.cache.Put(method, cache_key, response.content)
+        return status, data
+
+      if status not in RETRY_STATUS or attempt == retries:
+        break
+
+      wait = Backoff(attempt, retry_after)
+      logger.warning('Status code: %s, %s... retrying in %.2f seconds', status, self.status_codes.get(status), wait)
+      time.sleep(wait)
+
+    return status, None
+
   def SummonerData(self):
     """
-    endpoint to riot's api, SummonerV4
+    endpoint to riot's api, SummonerV4, answered from the summoner cache when possible
 
     Returns
-      username, account_id, self.status, headers
+      username, account_id, self.status
     """
-    print('Initializing request to SummonerV4...')
+    logger.debug('Initializing request to SummonerV4')
 
     # checcking if region is valid first, return status 400 if true
-    print('Validating region...')
-    if self.CheckValidRegion() == False:
+    with metrics.Timer('region_validation'):
+      valid = self.CheckValidRegion()
+
+    if valid == False:
       self.status = 400
-      print('False region...')
-      print(f'Status code: {self.status}, {self.status_codes.get(self.status)}...')
+      logger.info('False region %s... Status code: %s, %s', self.region, self.status, self.status_codes.get(self.status))
+      return self.status
+
+    # unknown champion names are refused before any request is sent
+    elif not self.CheckValidChampions():
+      self.status = 404
+      logger.info('Unknown champion %s or %s... Status code: %s, %s', self.champion, self.enemy_champion, self.status,
+                  self.status_codes.get(self.status))
       return self.status
 
     # if region is valid continue to attempt request to riot's endpoint
     else: 
-      print('Valid region, attempting request to SummonerV4...')
-
-      url = f'https://{self.hostname}/lol/summoner/v4/summoners/by-name/{self.summoner}?api_key={self.key}'
-      start = time.time()
-      response = requests.get(url)
-      headers = response.headers['X-App-Rate-Limit-Count']
-      headers = headers.replace(',', ' ').replace(':',' ').split(' ')
-      headers = [int(i) for i in headers]
-      passed = time.time() - start
-      self.totalT += passed
-      self.totalT2  += passed
-
-      print(f'Checking Rate Limits...{headers}')
-      if(self.totalT > self.per):
-        print('1 second has passed... here 1')
-      
-      if(self.totalT2 > self.per2):
-        print('120 seconds have passed... here 1')
-      
-      if(headers[0] == self.rate and self.totalT > self.per):
-        self.wait = 5
-        print(f'condition 1 met: Reached request limit, too many requests in {self.per} seconds... setting throttle. Waiting {self.wait} seconds to continue... here 1\n')
-        self.totalT = 0
-        time.sleep(self.wait)
-      
-      if(headers[0] >= self.rate and self.totalT < self.per):
-        self.wait = self.per - self.totalT
-        print(f'condition 2 met: Reached request limit... setting throttle. Waiting {self.wait} seconds to continue... here 1\n')
-        self.totalT = 0
-        time.sleep(self.wait)
-      
-      if(headers[2] == self.rate2 and self.totalT2 > self.per2):
-        self.wait = self.per2 - self.totalT2
-        print(f'condition 3 met: Reached request limit... setting throttle. Waiting {self.wait} seconds to continue... here 1\n')
-        self.totalT2 = 0
-        time.sleep(self.wait)
-      
-      if(headers[2] > self.rate2 and self.totalT2 < self.per2):
-        self.wait = self.per2 - self.totalT2
-        print(f'condition 3 met: Reached request limit... setting throttle. Waiting {self.wait} seconds to continue... here 1\n')
-        self.totalT2 = 0
-        time.sleep(self.wait)
-
-      print('Checking response code to SummonerV4...')
-      if response.status_code != 200:
-        self.status = response.status_code
-        print(f'Status code: {self.status}, {self.status_codes.get(self.status)}...')
+
+      cached = summoner_cache.Get(self.region, self.summoner)
+      if cached is not None:
+        logger.debug('Summoner %s found in cache', self.summoner)
+        status, summoner = cached
+
+      else:
+        # concurrent lookups of the same summoner share one request, prefetch lookups only among themselves
+        key = (self.region, NormalizeName(self.summoner), self.priority == PREFETCH)
+        status, summoner = summoner_flight.Do(key, self.LookupSummoner)
+
+      if status != 200:
+        self.status = status
+        logger.info('SummonerV4 status code: %s, %s', self.status, self.status_codes.get(self.status))
         return self.status
     
       else:
-        print('Sucessful response to SummonerV4!')
-        self.status = response.status_code
-        account_id = response.json()['accountId']
-        username = response.json()['name']
-        headers = response.headers['X-App-Rate-Limit-Count']
-        headers = headers.replace(',', ' ').replace(':',' ').split(' ')
-        headers = [int(i) for i in headers]
-        print(f'Username = {username}, Account Id = {account_id}...')
-        print(f'Current limit: {headers[0]} request(s) / {headers[1]} second | {headers[2]} request(s) / {headers[3]} seconds...')
-        return username, account_id, self.status, headers
+        self.status = status
+        account_id = self.account_id = summoner['accountId']
+        self.sync_key = (self.region, account_id, self.champion_id, self.queue_id)
+        username = summoner['name']
+        logger.debug('Username = %s, Account Id = %s', username, account_id)
+        return username, account_id, self.status
+
+  def LookupSummoner(self):
+    """
+    Requests the summoner from SummonerV4 and caches the result, unknown names are cached for a shorter time
+
+    Returns
+      status, json response of the request or None if the request failed
+    """
+    status, summoner = self.Request(f'/lol/summoner/v4/summoners/by-name/{self.summoner}', 'summoner')
+    summoner_cache.Put(self.region, self.summoner, status, summoner)
+    return status, summoner
 
   def MatchInfo(self):
     """
     Endpoint to MatchV4 to retrieve a list of gameId's filtered by where champion exists
 
     Returns
-      json response containing a 100 game match list filtered by where champion is in the game
+      json response containing the first matchlist page, starting at self.begin_index, filtered by where champion is in the game.
+      Without explicit paging the stored matchlist merged with the games played since is returned, see SyncMatchList()
     """
-    print('Initializing request to MatchV4...')
-    print('Getting summoner information, calling SummonerV4...\nChecking response code before continuing with MatchV4...')
-    start = time.time()
     summoner_info = self.SummonerData()
-    headers = summoner_info[3]
-    passed = time.time() - start
-    self.totalT += passed
-    self.totalT2 += passed
-
-    print(f'Checking Rate Limits...{headers}')
-    if(self.totalT > self.per):
-      print('1 second has passed... here 2')
-    
-    if(self.totalT2 > self.per2):
-      print('120 seconds have passed... here 2')
-    
-    if(headers[0] == self.rate and self.totalT > self.per):
-      self.wait = 5
-      print(f'condition 1 met: Reached request limit, too many requests in {self.per} seconds... setting throttle. Waiting {self.wait} seconds to continue... here 2\n')
-      self.totalT = 0
-      time.sleep(self.wait)
-    
-    if(headers[0] >= self.rate and self.totalT < self.per):
-      self.wait = self.per - self.totalT
-      print(f'condition 2 met: Reached request limit... setting throttle. Waiting {self.wait} seconds to continue... here 2\n')
-      self.totalT = 0
-      time.sleep(self.wait)
-    
-    if(headers[2] == self.rate2 and self.totalT2 > self.per2):
-      self.wait = self.per2 - self.totalT2
-      print(f'condition 3 met: Reached request limit... setting throttle. Waiting {self.wait} seconds to continue... here 2\n')
-      self.totalT2 = 0
-      time.sleep(self.wait)
-    
-    if(headers[2] > self.rate2 and self.totalT2 < self.per2):
-      self.wait = self.per2 - self.totalT2
-      print(f'condition 3 met: Reached request limit... setting throttle. Waiting {self.wait} seconds to continue... here 2\n')
-      self.totalT2 = 0
-      time.sleep(self.wait)
 
     if self.status != 200:
       self.status = summoner_info
       return self.status
 
+    elif self.incremental:
+      return self.SyncMatchList()
+
     else:
-      print('Successful response for SummonerV4...')
-      queue_id = 420
-      username = summoner_info[0]
-      account_id = summoner_info[1]
-      url = f'https://{self.hostname}/lol/match/v4/matchlists/by-account/{account_id}?champion={self.champion_id}&queue={queue_id}&api_key={self.key}'
-      start = time.time()
-      response = requests.get(url)
-      headers = response.headers['X-App-Rate-Limit-Count']
-      headers = headers.replace(',', ' ').replace(':',' ').split(' ')
-      headers = [int(i) for i in headers]
-      passed = time.time() - start
-      self.totalT += passed
-      self.totalT2 += passed
-
-      print(f'Checking Rate Limits...{headers}')
-      if(self.totalT > self.per):
-        print('1 second has passed... here 3')
-      
-      if(self.totalT2 > self.per2):
-        print('120 seconds have passed...here 3')
-      
-      if(headers[0] == self.rate and self.totalT > self.per):
-        self.wait = 5
-        print(f'condition 1 met: Reached request limit, too many requests in {self.per} seconds... setting throttle. Waiting {self.wait} seconds to continue... here 3\n')
-        self.totalT = 0
-        time.sleep(self.wait)
-      
-      if(headers[0] >= self.rate and self.totalT < self.per):
-        self.wait = self.per - self.totalT
-        print(f'condition 2 met: Reached request limit... setting throttle. Waiting {self.wait} seconds to continue... here 3\n')
-        self.totalT = 0
-        time.sleep(self.wait)
-      
-      if(headers[2] == self.rate2 and self.totalT2 > self.per2):
-        self.wait = self.per2 - self.totalT2
-        print(f'condition 3 met: Reached request limit... setting throttle. Waiting {self.wait} seconds to continue... here 3\n')
-        self.totalT2 = 0
-        time.sleep(self.wait)
-      
-      if(headers[2] > self.rate2 and self.totalT2 < self.per2):
-        self.wait = self.per2 - self.totalT2
-        print(f'condition 3 met: Reached request limit... setting throttle. Waiting {self.wait} seconds to continue... here 3\n')
-        self.totalT2 = 0
-        time.sleep(self.wait)
-
-      print('Checking response code to MatchV4...')
-      if response.status_code != 200:
-        self.status = response.status_code
-        print(f'Status code: {self.status}, {self.status_codes.get(self.status)}...')
-        return self.status
+      return self.MatchList(self.begin_index)
+
+  def SyncMatchList(self):
+    """
+    Brings the stored matchlist of (region, account, champion, queue) up to date, asking MatchV4 only for the games
+    played since the newest stored one, and returns the merged matchlist
+
+    Returns
+      matchlist json whose matches are the stored and new gameIds, newest first, status code if a request failed
+    """
+    state = self.sync.Get(self.sync_key)
+
+    if state is None:
+      match_info = self.MatchList(0)
+      if self.status == 200:
+        matches = match_info['matches']
+        self.sync.Save(self.sync_key, [m['gameId'] for m in matches],
+                       max([m.get('timestamp', 0) for m in matches], default=0), len(matches) < MATCHLIST_PAGE)
+      return match_info
+
+    game_ids, last_timestamp, exhausted = state
+    new = []
+
+    # MatchV4 refuses beginTime ranges over a week, older state is merged with the newest page instead
+    if time.time() * 1000 - last_timestamp < SYNC_WINDOW:
+      begin_index = 0
+      while True:
+        match_info = self.MatchList(begin_index, begin_time=last_timestamp + 1)
+        # MatchV4 answers 404 when no game was played since
+        if self.status == 404:
+          self.status = 200
+          break
+        if self.status != 200:
+          return self.status
+        new.extend(match_info['matches'])
+        if len(match_info['matches']) < MATCHLIST_PAGE:
+          break
+        begin_index += MATCHLIST_PAGE
 
+    else:
+      match_info = self.MatchList(0)
+      if self.status != 200:
+        return self.status
+      known = set(game_ids)
+      for match in match_info['matches']:
+        if match['gameId'] in known:
+          break
+        new.append(match)
       else:
-        print('Successful response to MatchV4...')
-        return response.json()
+        # over a page of new games, the stored matchlist no longer follows on from them
+        game_ids = []
+        exhausted = len(new) < MATCHLIST_PAGE
+
+    new_ids = [m['gameId'] for m in new]
+    seen = set(new_ids)
+    game_ids = new_ids + [game_id for game_id in game_ids if game_id not in seen]
+    last_timestamp = max([m.get('timestamp', 0) for m in new], default=last_timestamp)
+    if new:
+      self.sync.Save(self.sync_key, game_ids, last_timestamp, exhausted)
+
+    logger.debug('Synced matchlist, %s new games, %s stored', len(new_ids), len(game_ids))
+    metrics.Increment('matchlist_sync_new_games', len(new_ids))
+    return {'matches': [{'gameId': game_id} for game_id in game_ids], 'startIndex': 0, 'endIndex': len(game_ids),
+            'totalGames': len(game_ids), 'exhausted': exhausted}
+
+  def MatchList(self, begin_index, begin_time=None):
+    """
+    Endpoint to MatchV4 to retrieve one page of the matchlist of the summoner, SummonerData() must have succeeded
+
+    Arguments
+    ---------
+    begin_index : int
+      index of the first game of the page, pages hold at most MATCHLIST_PAGE games
+    begin_time : int
+      epoch milliseconds, only return games played after it, defaults to self.begin_time
+
+    Returns
+      json response of the matchlist page, status code if the request failed
+    """
+    end_index = begin_index + MATCHLIST_PAGE
+    if self.end_index is not None:
+      end_index = min(end_index, self.end_index)
+
+    params = {'queue': self.queue_id, 'beginIndex': begin_index, 'endIndex': end_index}
+    if self.champion_id is not None:
+      params['champion'] = self.champion_id
+    begin_time = self.begin_time if begin_time is None else begin_time
+    if begin_time is not None:
+      params['beginTime'] = begin_time
+
+    status, match_info = self.Request(f'/lol/match/v4/matchlists/by-account/{self.account_id}', 'matchlist', params)
+
+    if status != 200:
+      self.status = status
+      logger.info('MatchV4 matchlist status code: %s, %s', self.status, self.status_codes.get(self.status))
+      return self.status
+
+    else:
+      logger.debug('Successful response to MatchV4, games %s to %s', begin_index, end_index)
+      return match_info
+
+  def MatchDetails(self, match_id):
+    """
+    Endpoint to MatchV4 to retrieve the details of a single game, checking the local match store first
+
+    Arguments
+    ---------
+    match_id : int
+      gameId of the match to retrieve
+
+    Returns
+      status, decoded Match or None if the request failed
+    """
+    with metrics.Timer('store_read'):
+      match = self.store.Get(self.region, match_id)
+    if match is not None:
+      metrics.Increment('match_store_hits')
+      return 200, match
+
+    metrics.Increment('match_store_misses')
+
+    # concurrent wrappers asking for the same game share one request, except that a request led by a prefetch
+    # wrapper waits at prefetch share so other priorities never join it
+    return match_flight.Do((self.region, match_id, self.priority == PREFETCH), self.FetchMatch, match_id)
+
+  def FetchMatch(self, match_id):
+    """
+    Requests a single game from MatchV4 and adds it to the match store and matchup index
+
+    Returns
+      status, decoded Match or None if the request failed
+    """
+    status, match = self.Request(f'/lol/match/v4/matches/{match_id}', 'match')
+    if status == 200:
+      with metrics.Timer('decode'):
+        match = DecodeMatch(match)
+      self.store.Put(self.region, match)
+      self.index.Add(self.region, match)
+    return status, match
+
+  def Candidates(self, match_id_list):
+    """
+    Uses the matchup index to drop the gameIds already known not to contain champion against enemy_champion
+
+    Arguments
+    ---------
+    match_id_list : list
+      gameIds from the matchlist
+
+    Returns
+      list of gameIds that still need to be broken down, in matchlist order
+    """
+    indexed = self.index.Indexed(self.region, match_id_list)
+
+    # matches stored before the index existed are indexed from the store, without a request
+    for match_id in match_id_list:
+      if match_id not in indexed:
+        match = self.store.Get(self.region, match_id)
+        if match is not None:
+          self.index.Add(self.region, match)
+          indexed.add(match_id)
+
+    # the matchlist only holds games of the summoner on champion, the index stores the original accountId
+    # of each player rather than the current one, so the lookup is not narrowed to the account
+    hits = self.index.Lookup(self.region, self.champion_id, self.enemy_champion_id)
+    candidates = [match_id for match_id in match_id_list if match_id not in indexed or match_id in hits]
+    logger.debug('%s of %s matches indexed, %s known matchups for %s vs %s',
+                 len(indexed), len(match_id_list), len(hits), self.champion, self.enemy_champion)
+    metrics.Increment('index_skipped', len(match_id_list) - len(candidates))
+    return candidates
+
+
+  def ParseMatch(self, match):
+    """
+    Checks if champion and enemy_champion played against each other in a match
+
+    Arguments
+    ---------
+    match : Match
+      decoded match from MatchDetails()
+
+    Returns
+      Matchup of the two champions, None if the champions did not face each other
+    """
+    player = match.Find(self.champion_id)
+    enemy = match.Find(self.enemy_champion_id)
+
+    if player is not None and enemy is not None and player.team_id != enemy.team_id:
+      logger.debug('Found %s and %s in gameId %s', self.champion, self.enemy_champion, match.game_id)
+      return Matchup(match, player, enemy)
+
+    return None
+
+  def IterMatchBreakdown(self, match_info):
+    """
+    Yields the breakdown of each match where champion faced enemy_champion as soon as it is decoded
+
+    Match details are fetched by a pool of self.concurrency threads, all held to the shared request scheduler.
+    Further matchlist pages are requested until self.max_scan games were scanned, and no more
+    requests are sent once self.hits matchups were found. If a request fails self.status is set to
+    its status code and the iteration stops
+
+    Arguments
+    ---------
+    match_info : dict
+      json response of MatchInfo()
+
+    Returns
+      generator of Matchup, in matchlist order
+    """
+    self.scanned = 0
+    found = 0
+    begin_index = self.begin_index
+    executor = ThreadPoolExecutor(max_workers=self.concurrency)
+    pending = deque()
+
+    try:
+      while True:
+        matches = match_info['matches']
+        match_id_list = []
+
+        for match_id in matches[:self.max_scan - self.scanned]:
+          match_id_list.append(match_id['gameId'])
+
+        self.scanned += len(match_id_list)
+        match_ids = iter(self.Candidates(match_id_list))
+
+        # only a bounded number of requests is in flight so nothing more is sent once enough hits are found
+        while True:
+          while len(pending) < 2 * self.concurrency:
+            match_id = next(match_ids, None)
+            if match_id is None:
+              break
+            pending.append(executor.submit(self.MatchDetails, match_id))
+
+          if not pending:
+            break
+
+          status, details = pending.popleft().result()
+          if status != 200:
+            self.status = status
+            logger.info('MatchV4 match status code: %s, %s', self.status, self.status_codes.get(self.status))
+            return
+
+          matchup = self.ParseMatch(details)
+          if matchup is not None:
+            found += 1
+            yield matchup
+            if self.hits is not None and found >= self.hits:
+              logger.debug('Found %s matchups, stopping scan', found)
+              return
+
+        begin_index = match_info.get('endIndex', begin_index + len(matches))
+        exhausted = match_info.get('exhausted', len(matches) < MATCHLIST_PAGE)
+        if (self.scanned >= self.max_scan or not matches or exhausted
+            or (self.end_index is not None and begin_index >= self.end_index)):
+          return
+
+        match_info = self.MatchList(begin_index)
+        if self.status != 200:
+          return
+
+        # older pages read past the synced matchlist are kept for the next query
+        if self.incremental:
+          page = [m['gameId'] for m in match_info['matches']]
+          self.sync.Extend(self.sync_key, begin_index, page, len(page) < MATCHLIST_PAGE)
+
+    finally:
+      for future in pending:
+        future.cancel()
+      executor.shutdown(wait=True, cancel_futures=True)
 
   def MatchBreakdown(self):
     """
     Iterates through the MatchInfo id's to check where champion and enemy_champion exist and returns a dict for the rest api to later be used for SpoofBot
 
     Returns
-      dict containing match details where champion and enemy_champion exist in the same game
+      dict containing match details where champion and enemy_champion exist in the same game, in matchlist order
     """
-    print('Creating object for MatchInfo()...')
     match_info = self.MatchInfo()
     match_dict = OrderedDict()
     
@@ -311,152 +641,33 @@ class Wrapper():
       return self.status
     
     else:
-      print('Sucessful response for MatchV4, continuing match breakdown...')
-      match_id_list = []
-
-      for match_id in match_info['matches']:
-        match_id_list.append(match_id['gameId'])
-
-      match_id_list = match_id_list[:50]
-      
-      for match_id in match_id_list:
-        url = f'https://{self.hostname}/lol/match/v4/matches/{match_id}?api_key={self.key}'
-        start = time.time()
-        response = requests.get(url)
-        headers = response.headers['X-App-Rate-Limit-Count']
-        headers = headers.replace(',', ' ').replace(':',' ').split(' ')
-        headers = [int(i) for i in headers]
-        passed = time.time() - start
-        self.totalT += passed
-        self.totalT2 += passed
-
-        print(f'Checking Rate Limits...{headers}')
-        if(self.totalT > self.per):
-          print('1 second has passed... here 4')
-        
-        if(self.totalT2 > self.per2):
-          print('120 seconds have passed... here 4')
-        
-        if(headers[0] == self.rate and self.totalT > self.per):
-          self.wait = 5
-          print(f'condition 1 met: Reached request limit, too many requests in {self.per} seconds... setting throttle. Waiting {self.wait} seconds to continue... here 4\n')
-          self.totalT = 0
-          time.sleep(self.wait)
-        
-        if(headers[0] >= self.rate and self.totalT < self.per):
-          self.wait = self.per - self.totalT
-          print(f'condition 2 met: Reached request limit... setting throttle. Waiting {self.wait} seconds to continue... here 4\n')
-          self.totalT = 0
-          time.sleep(self.wait)
-        
-        if(headers[2] == self.rate2 and self.totalT2 > self.per2):
-          self.wait = self.per2 - self.totalT2
-          print(f'condition 3 met: Reached request limit... setting throttle. Waiting {self.wait} seconds to continue... here 4\n')
-          self.totalT2 = 0
-          time.sleep(self.wait)
-        
-        if(headers[2] > self.rate2 and self.totalT2 < self.per2):
-          self.wait = self.per2 - self.totalT2
-          print(f'condition 3 met: Reached request limit... setting throttle. Waiting {self.wait} seconds to continue... here 4\n')
-          self.totalT2 = 0
-          time.sleep(self.wait)
-
-        game_id = response.json()['gameId']
-        date = response.json()['gameCreation']/1000
-        gameVersion = response.json()['gameVersion']
-
-        if response.status_code != 200:
-          self.status = response.status_code
-          print(f'Status code: {self.status}, {self.status_codes.get(self.status)}...')
-          return self.status
+      for matchup in self.IterMatchBreakdown(match_info):
+        match_dict.update(matchup.ToJson())
 
-        else:
-          champion_dict = {}
-          data = response.json()['participants']
-          usernames = response.json()['participantIdentities']
-
-          for x in response.json()['participants']:
-            info_list = [x['teamId'], x['participantId']]
-            champion_dict.update({x['championId']:info_list})
-
-          if self.champion_id in champion_dict.keys() and self.enemy_champion_id in champion_dict.keys() and champion_dict.get(self.champion_id)[0] != champion_dict.get(self.enemy_champion_id)[0]:
-            print(f'Found {self.champion} and {self.enemy_champion} in gameId {game_id}')
-
-            participants = {participant['championId']:participant for participant in data}
-            participants_identities = {participant['participantId']:participant['player']['summonerName'] for participant in usernames}
-            user1 = participants_identities[participants[self.champion_id]['participantId']]
-            user2 = participants_identities[participants[self.enemy_champion_id]['participantId']]
-
-            champ_d = participants[self.champion_id]['stats']
-            enemy_champ_d = participants[self.enemy_champion_id]['stats']
-
-            match = {
-              game_id: {
-                'gameId': game_id,
-                'date': date,
-                'gameVersion': gameVersion,
-                champions_inv.get(self.champion_id): {
-                  'username': user1,
-                  'teamId': participants[self.champion_id]['teamId'],
-                  'win': champ_d['win'],
-                  'kills': champ_d['kills'],
-                  'deaths': champ_d['deaths'],
-                  'assists': champ_d['assists'],
-                  'championId': self.champion_id,
-                  'spell1': summoners_dict.get(participants[self.champion_id]['spell1Id']),
-                  'spell2': summoners_dict.get(participants[self.champion_id]['spell2Id']),
-                  'item0': items_dict.get(str(champ_d['item0'])),
-                  'item1': items_dict.get(str(champ_d['item1'])),
-                  'item2': items_dict.get(str(champ_d['item2'])),
-                  'item3': items_dict.get(str(champ_d['item3'])),
-                  'item4': items_dict.get(str(champ_d['item4'])),
-                  'item5': items_dict.get(str(champ_d['item5'])),
-                  'item6': items_dict.get(str(champ_d['item6'])),
-                  'perk0': runes_dict.get(str(champ_d['perk0'])),
-                  'perk1': runes_dict.get(str(champ_d['perk1'])),
-                  'perk2': runes_dict.get(str(champ_d['perk2'])),
-                  'perk3': runes_dict.get(str(champ_d['perk3'])),
-                  'perk4': runes_dict.get(str(champ_d['perk4'])),
-                  'perk5': runes_dict.get(str(champ_d['perk5'])),
-                  'statPerk0': perks_dict.get(champ_d['statPerk0']) if 'statPerk0' in champ_d else "",
-                  'statPerk1': perks_dict.get(champ_d['statPerk1']) if 'statPerk1' in champ_d else "",
-                  'statPerk2': perks_dict.get(champ_d['statPerk2']) if 'statPerk2' in champ_d else "",
-                },
-                champions_inv.get(self.enemy_champion_id): {
-                  'username': user2,
-                  'teamId': participants[self.enemy_champion_id]['teamId'],
-                  'win': enemy_champ_d['win'],
-                  'kills': enemy_champ_d['kills'],
-                  'deaths': enemy_champ_d['deaths'],
-                  'assists': enemy_champ_d['assists'],
-                  'championId': self.enemy_champion_id,
-                  'spell1': summoners_dict.get(participants[self.enemy_champion_id]['spell1Id']),
-                  'spell2': summoners_dict.get(participants[self.enemy_champion_id]['spell2Id']),
-                  'item0': items_dict.get(str(enemy_champ_d['item0'])),
-                  'item1': items_dict.get(str(enemy_champ_d['item1'])),
-                  'item2': items_dict.get(str(enemy_champ_d['item2'])),
-                  'item3': items_dict.get(str(enemy_champ_d['item3'])),
-                  'item4': items_dict.get(str(enemy_champ_d['item4'])),
-                  'item5': items_dict.get(str(enemy_champ_d['item5'])),
-                  'item6': items_dict.get(str(enemy_champ_d['item6'])),
-                  'perk0': runes_dict.get(str(enemy_champ_d['perk0'])),
-                  'perk1': runes_dict.get(str(enemy_champ_d['perk1'])),
-                  'perk2': runes_dict.get(str(enemy_champ_d['perk2'])),
-                  'perk3': runes_dict.get(str(enemy_champ_d['perk3'])),
-                  'perk4': runes_dict.get(str(enemy_champ_d['perk4'])),
-                  'perk5': runes_dict.get(str(enemy_champ_d['perk5'])),
-                  'statPerk0': perks_dict.get(enemy_champ_d['statPerk0']) if 'statPerk0' in enemy_champ_d else "",
-                  'statPerk1': perks_dict.get(enemy_champ_d['statPerk1']) if 'statPerk1' in enemy_champ_d else "",
-                  'statPerk2': perks_dict.get(enemy_champ_d['statPerk2']) if 'statPerk2' in enemy_champ_d else "",
-                }
-              }
-            }
-            match_dict.update(match)
-            match_dict.move_to_end(game_id)
-          
-          else:
-            print('Champions in same game not found.')
-            continue
-
-    print(f'Finished requests for {self.summoner}...')
+      if self.status != 200:
+        return self.status
+
+    logger.info('Finished requests for %s, %s matchups in %s games scanned', self.summoner, len(match_dict), self.scanned)
     return match_dict
+
+  def Ingest(self):
+    """
+    Syncs the matchlist of champion and stores and indexes up to self.max_scan of its games not stored yet,
+    so later queries against any enemy champion are answered locally
+
+    Returns
+      number of matchlist games scanned, or the failed status code
+    """
+    match_info = self.MatchInfo()
+    if self.status != 200:
+      return self.status
+
+    # without an enemy champion no game is a matchup, only unindexed games are requested
+    for _ in self.IterMatchBreakdown(match_info):
+      pass
+
+    if self.status != 200:
+      return self.status
+
+    logger.debug('Ingested %s games of %s on %s', self.scanned, self.summoner, self.champion)
+    return self.scanned
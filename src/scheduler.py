@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+import math
+import os
+import threading
+import time
+from collections import deque
+from rate_limiter import GetLimiter, INTERACTIVE, BATCH, PREFETCH
+import metrics
+
+# share of the contended requests interactive and batch requests are granted, prefetch requests only get
+# the capacity neither can use and are never granted while an interactive request waits
+WEIGHTS = {INTERACTIVE: 6, BATCH: 3}
+
+# every priority class, highest first
+PRIORITIES = (INTERACTIVE, BATCH, PREFETCH)
+
+# fraction of each rate limit window prefetch requests may use, the rest is kept for the other classes
+PREFETCH_SHARE = 0.5
+
+# longest a waiting caller sleeps before checking the limiters again, in seconds
+MAX_POLL = 1.0
+
+
+def ApiKeys():
+  """
+  Returns
+    list of the api keys in the comma separated API_KEYS environment variable, or the single API_KEY
+  """
+  keys = [key.strip() for key in os.getenv('API_KEYS', '').split(',') if key.strip()]
+  return keys or [os.getenv('API_KEY')]
+
+
+class _Ticket():
+  __slots__ = ('method', 'share', 'key', 'granted')
+
+  def __init__(self, method, share):
+    self.method = method
+    self.share = share
+    self.key = None
+    self.granted = False
+
+
+class RequestScheduler():
+  """
+  Hands out the requests of one region across every api key, each key keeping its own app and method rate limits
+
+  A granted request goes to the key with the most headroom left for its method. While requests wait, interactive
+  and batch requests are served in proportion to WEIGHTS, first come first served within a class. Prefetch
+  requests are only granted when no interactive request waits and no batch request can be sent, and never use
+  more than PREFETCH_SHARE of a window.
+  The 'scheduler_queued' gauge and 'scheduler_requests' counter are kept in metrics per priority and key
+
+  Functions
+  ---------
+  Acquire()
+    Blocks until a request may be sent and returns the api key to send it with and the seconds waited
+  Update()
+    Synchronizes the limiter of a key with the headers of its response
+  Stats()
+    Returns the queue depth per priority and the requests and window usage per key
+  """
+  def __init__(self, region, keys, weights=WEIGHTS, prefetch_share=PREFETCH_SHARE):
+    """
+    Arguments
+    ---------
+    region : str
+      region the requests are sent to
+    keys : list
+      api keys, each with its own rate limits
+    weights : dict
+      interactive and batch priority class -> share of the contended requests
+    prefetch_share : float
+      fraction of each window prefetch requests may use
+
+    Attributes
+    -----------
+    self.limiters : dict
+      api key -> process wide RateLimiter of the key and region
+    self.labels : dict
+      api key -> 'key0', 'key1'... used in metrics and Stats() so keys are never exposed
+    self.queues : dict
+      priority class -> deque of waiting tickets
+    self.passes : dict
+      weighted priority class -> virtual time of the class, advanced by 1 / weight per granted request
+    self.waited : float
+      total seconds callers spent blocked in Acquire()
+    """
+    self.region = region
+    self.keys = list(keys)
+    self.limiters = {key: GetLimiter(key, region) for key in self.keys}
+    self.labels = {key: f'key{i}' for i, key in enumerate(self.keys)}
+    self.weights = dict(weights)
+    self.prefetch_share = prefetch_share
+    self.queues = {priority: deque() for priority in PRIORITIES}
+    self.passes = {priority: 0.0 for priority in self.weights}
+    self.clock = 0.0
+    self.granted = {key: 0 for key in self.keys}
+    self.waited = 0
+    self.cond = threading.Condition()
+
+  def _TryKeys(self, ticket):
+    """
+    Reserves a request on the key with the most headroom
+
+    Returns
+      float, 0 if reserved on the key set in ticket.key, else seconds until a key may have room
+    """
+    wait = math.inf
+    keys = sorted(self.keys, key=lambda key: self.limiters[key].Headroom(ticket.method), reverse=True)
+    for key in keys:
+      key_wait = self.limiters[key].TryAcquire(ticket.method, ticket.share)
+      if key_wait <= 0:
+        ticket.key = key
+        return 0
+      wait = min(wait, key_wait)
+    return wait
+
+  def _Dispatch(self):
+    """
+    Grants every waiting ticket that can be sent now, weighted classes with the lowest virtual time first and
+    prefetch last
+
+    Returns
+      seconds until a waiting ticket may be granted, inf if none is waiting
+    """
+    while True:
+      wait = math.inf
+      waiting = sorted((p for p in self.weights if self.queues[p]), key=lambda p: self.passes[p])
+      # prefetch only takes what the other classes can not use, and nothing while an interactive request waits
+      if self.queues[PREFETCH] and not self.queues[INTERACTIVE]:
+        waiting.append(PREFETCH)
+      for priority in waiting:
+        ticket = self.queues[priority][0]
+        ticket_wait = self._TryKeys(ticket)
+        if ticket_wait <= 0:
+          break
+        wait = min(wait, ticket_wait)
+      else:
+        return wait
+
+      self.queues[priority].popleft()
+      ticket.granted = True
+      self.granted[ticket.key] += 1
+      if priority in self.weights:
+        self.passes[priority] += 1 / self.weights[priority]
+        self.clock = self.passes[priority]
+      metrics.Gauge('scheduler_queued', len(self.queues[priority]), region=self.region, priority=priority)
+      self.cond.notify_all()
+
+  def Acquire(self, method=None, priority=INTERACTIVE):
+    """
+    Arguments
+    ---------
+    method : str
+      name of the endpoint being called, eg 'match', so method limits are respected
+    priority : str
+      rate_limiter.INTERACTIVE, rate_limiter.BATCH or rate_limiter.PREFETCH
+
+    Returns
+      api key the request must be sent with, seconds spent waiting
+    """
+    ticket = _Ticket(method, self.prefetch_share if priority == PREFETCH else 1.0)
+    start = time.monotonic()
+
+    with self.cond:
+      queue = self.queues[priority]
+      # a class that was idle does not get to catch up on the requests it did not make
+      if not queue and priority in self.passes:
+        self.passes[priority] = max(self.passes[priority], self.clock)
+      queue.append(ticket)
+      metrics.Gauge('scheduler_queued', len(queue), region=self.region, priority=priority)
+
+      try:
+        while not ticket.granted:
+          wait = self._Dispatch()
+          if not ticket.granted:
+            self.cond.wait(min(wait, MAX_POLL))
+      finally:
+        if not ticket.granted:
+          queue.remove(ticket)
+          metrics.Gauge('scheduler_queued', len(queue), region=self.region, priority=priority)
+
+      waited = time.monotonic() - start
+      self.waited += waited
+
+    metrics.Increment('scheduler_requests', region=self.region, key=self.labels[ticket.key], priority=priority)
+    return ticket.key, waited
+
+  def Update(self, key, headers, status=200, method=None):
+    """
+    Arguments
+    ---------
+    key : str
+      api key returned by Acquire() the request was sent with
+    headers, status, method
+      same as RateLimiter.Update()
+    """
+    self.limiters[key].Update(headers, status, method)
+
+  def Stats(self):
+    """
+    Returns
+      dict of the waiting requests per priority class and, per key label, its granted requests, app headroom
+      and rate limit window usage
+    """
+    with self.cond:
+      queued = {priority: len(queue) for priority, queue in self.queues.items()}
+      granted = dict(self.granted)
+      waited = self.waited
+    return {
+      'queued': queued,
+      'waited': waited,
+      'keys': {self.labels[key]: {'requests': granted[key], 'headroom': self.limiters[key].Headroom(),
+                                  'usage': self.limiters[key].Usage()}
+               for key in self.keys},
+    }
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+def GetScheduler(region):
+  """
+  Returns the process wide RequestScheduler of a region, over the keys of ApiKeys()
+  """
+  with _schedulers_lock:
+    scheduler = _schedulers.get(region)
+    if scheduler is None:
+      scheduler = _schedulers[region] = RequestScheduler(region, ApiKeys())
+    return scheduler
+
+def Schedulers():
+  """
+  Returns
+    dict of region -> RequestScheduler for every region used so far
+  """
+  with _schedulers_lock:
+    return dict(_schedulers)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+import threading
+import metrics
+
+class _Call():
+  def __init__(self):
+    self.done = threading.Event()
+    self.result = None
+    self.error = None
+
+
+class SingleFlight():
+  """
+  Coalesces concurrent calls with the same key into one underlying call whose result they all share
+
+  Counters '<name>_calls' and '<name>_coalesced' are kept in metrics
+
+  Functions
+  ---------
+  Do()
+    Runs fn for key unless a call for key is already in flight, in which case its result is awaited
+  """
+  def __init__(self, name):
+    """
+    Arguments
+    ---------
+    name : str
+      prefix of the metrics counters, eg 'match'
+    """
+    self.name = name
+    self.calls = {}
+    self.lock = threading.Lock()
+
+  def Do(self, key, fn, *args, **kwargs):
+    """
+    Arguments
+    ---------
+    key : hashable
+      identifies calls that return the same result
+    fn : callable
+      called with args and kwargs by the first caller of key only
+
+    Returns
+      result of fn, exceptions raised by fn are raised in every caller
+    """
+    with self.lock:
+      call = self.calls.get(key)
+      leader = call is None
+      if leader:
+        call = self.calls[key] = _Call()
+
+    if not leader:
+      metrics.Increment(f'{self.name}_coalesced')
+      call.done.wait()
+      if call.error is not None:
+        raise call.error
+      return call.result
+
+    metrics.Increment(f'{self.name}_calls')
+    try:
+      call.result = fn(*args, **kwargs)
+      return call.result
+    except BaseException as error:
+      call.error = error
+      raise
+    finally:
+      with self.lock:
+        del self.calls[key]
+      call.done.set()
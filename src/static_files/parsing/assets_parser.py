@@ -1,71 +1,163 @@
 #!/usr/bin/env python3
-
+"""
+Build step compiling Data Dragon json files into the per patch lookup tables of static_files/registry.py
+
+Run from src/:
+  python -m static_files.parsing.assets_parser                      # files next to this script
+  python -m static_files.parsing.assets_parser --data-dir path/     # files of another patch
+  python -m static_files.parsing.assets_parser --download 10.10.1   # fetch the files from Data Dragon first
+
+Input files, any missing one falls back to the hand maintained *_dict.py modules
+  items.json     Data Dragon item.json
+  runes.json     Data Dragon runesReforged.json
+  champions.json Data Dragon champion.json, or champion_dict.json of champion_name -> champion_id
+  summoner.json  Data Dragon summoner.json
+"""
+
+import argparse
 import json
-
-# parsing through item data json file to create dictionary of n -> itemName
-item_ids = []
-item_names = []
-
-with open('items.json') as f:
-  data = json.load(f)
-
-for n in data['data']:
-  item_ids.append(n)
-
-for n in item_ids:
-  item_names.append(data['data'][n]['name'])
-
-item_ids = [int(i) for i in item_ids]
-item_dict =  {item_ids[i]: item_names[i] for i in range(len(item_ids))}
-
-with open('items_dict.json', 'w') as f:
-  json.dump(item_dict, f)
-
-# parsing through rune data json file to create dictionary of n -> runeName
-rune_ids = []
-rune_names = []
-
-rune_tree_id = []
-rune_tree_names = []
-
-with open('runes.json') as f:
-  data = json.load(f)
-
-for n in data:
-  rune_tree_id.append(n['id'])
-  rune_tree_names.append(n['key'])
-
-runeTreeDict =  {rune_tree_id[i]: rune_tree_names[i] for i in range(len(rune_tree_id))}
-
-
-for i in range(len(rune_tree_id)):
-  for x in data[i]['slots']:
-    for n in x['runes']:
-      rune_ids.append(n['id'])
-      rune_names.append(n['key'])
-
-print(rune_tree_names)
-print(rune_tree_id)
-
-rune_dict = {rune_ids[i]: rune_names[i] for i in range(len(rune_names))}
-
-with open('rune_dict.json', 'w') as f:
-  json.dump(rune_dict, f)
-
-# parsing through champion data json to create dictionary of champion_name -> champion_id
-champion_names = []
-champion_ids = []
-
-with open('champions.json') as f:
-  data = json.load(f)
-
-for n in data:
-  champion_names.append(n)
-
-for x in champion_names:
-  champion_ids.append(data[x]['id'])
-
-champion_dict = {champion_names[i]: champion_ids[i] for i in range(len(champion_names))}
-
-with open('champion_dict.json', 'w') as f:
-  json.dump(champion_dict, f)
+import os
+import pickle
+
+from static_files.registry import COMPILED_DIR, FallbackTables, MakeTable, NormalizeChampion, PatchOf
+
+PARSING_DIR = os.path.dirname(os.path.abspath(__file__))
+DDRAGON = 'https://ddragon.leagueoflegends.com/cdn/{version}/data/en_US/{name}'
+DDRAGON_FILES = {'items.json': 'item.json', 'runes.json': 'runesReforged.json',
+                 'champions.json': 'champion.json', 'summoner.json': 'summoner.json'}
+
+def Load(data_dir, name):
+  path = os.path.join(data_dir, name)
+  if not os.path.exists(path):
+    return None
+  with open(path) as f:
+    return json.load(f)
+
+def Download(version, data_dir):
+  """
+  Fetches the Data Dragon files of a version into data_dir
+  """
+  import requests
+
+  os.makedirs(data_dir, exist_ok=True)
+  for name, remote in DDRAGON_FILES.items():
+    response = requests.get(DDRAGON.format(version=version, name=remote), timeout=30)
+    response.raise_for_status()
+    with open(os.path.join(data_dir, name), 'wb') as f:
+      f.write(response.content)
+    print(f'Downloaded {remote} for {version}...')
+
+def BuildTables(data_dir):
+  """
+  Parses the input files of data_dir
+
+  Returns
+    version, dict of tables in the form StaticData() takes
+  """
+  tables = FallbackTables()
+  version = None
+
+  # parsing through item data json file to create table of itemId -> itemName
+  data = Load(data_dir, 'items.json')
+  if data is not None:
+    version = data.get('version')
+    items = {n: data['data'][n]['name'] for n in data['data']}
+    items['0'] = 'Empty'
+    tables['items'] = MakeTable(items)
+
+  # parsing through rune data json file to create table of runeId -> runeName
+  data = Load(data_dir, 'runes.json')
+  if data is not None:
+    runes = {}
+    for tree in data:
+      for slot in tree['slots']:
+        for rune in slot['runes']:
+          runes[rune['id']] = rune['key']
+    tables['runes'] = MakeTable(runes)
+
+  # parsing through champion data json to create table of championId -> championName
+  data = Load(data_dir, 'champions.json')
+  if data is not None:
+    version = version or data.get('version')
+    champions = {int(c['key']): c['id'] for c in data['data'].values()}
+    tables['champions'] = MakeTable(champions)
+    # both the id, eg MonkeyKing, and the display name, eg Wukong, resolve to the champion
+    champion_ids = {NormalizeChampion(c['name']): int(c['key']) for c in data['data'].values()}
+    champion_ids.update({NormalizeChampion(c['id']): int(c['key']) for c in data['data'].values()})
+    tables['champion_ids'] = champion_ids
+
+  else:
+    data = Load(data_dir, 'champion_dict.json')
+    if data is not None:
+      tables['champions'] = MakeTable({v: k for k, v in data.items() if isinstance(v, int)})
+      tables['champion_ids'] = {NormalizeChampion(k): v for k, v in data.items() if isinstance(v, int)}
+
+  # parsing through summoner spell data json to create table of spellId -> spellName
+  data = Load(data_dir, 'summoner.json')
+  if data is not None:
+    version = version or data.get('version')
+    tables['summoners'] = MakeTable({s['key']: s['name'] for s in data['data'].values()})
+
+  return version, tables
+
+def CheckChampions(tables):
+  """
+  Compares the champion table with the hand maintained champions_inv, champions released since are not checked
+
+  Returns
+    list of (champion_id, compiled name, expected name) for every champion id whose names disagree
+  """
+  from static_files.champions_dict import champions_inv
+  from static_files.registry import IdTable
+
+  champions = IdTable(*tables['champions'])
+  mismatches = []
+  for champion_id, expected in champions_inv.items():
+    if not isinstance(champion_id, int):
+      continue
+    name = champions.Get(champion_id)
+    if name is None or NormalizeChampion(name) != NormalizeChampion(expected):
+      mismatches.append((champion_id, name, expected))
+  return mismatches
+
+def Compile(tables, patch, directory=COMPILED_DIR):
+  """
+  Writes the tables of a patch where StaticRegistry() loads them from
+
+  Returns
+    path of the compiled file
+  """
+  os.makedirs(directory, exist_ok=True)
+  path = os.path.join(directory, f'{patch[0]}.{patch[1]}.pickle')
+  with open(path, 'wb') as f:
+    pickle.dump(tables, f, protocol=4)
+  return path
+
+def main():
+  parser = argparse.ArgumentParser(description='Compile Data Dragon files into static lookup tables')
+  parser.add_argument('--data-dir', default=PARSING_DIR, help='directory holding the input json files')
+  parser.add_argument('--download', metavar='VERSION', help='Data Dragon version to download into data-dir/VERSION first')
+  parser.add_argument('--patch', help='patch to compile as, eg 10.10, defaults to the version of the files')
+  parser.add_argument('--output', default=COMPILED_DIR, help='directory of the compiled tables')
+  args = parser.parse_args()
+
+  data_dir = args.data_dir
+  if args.download:
+    data_dir = os.path.join(args.data_dir, args.download)
+    Download(args.download, data_dir)
+
+  version, tables = BuildTables(data_dir)
+  patch = PatchOf(args.patch or version)
+  if patch is None:
+    parser.error('could not tell the patch of the files, pass --patch')
+
+  mismatches = CheckChampions(tables)
+  if mismatches:
+    parser.error('champion table disagrees with champions_inv: ' +
+                 ', '.join(f'{champion_id} is {name}, expected {expected}' for champion_id, name, expected in mismatches))
+
+  path = Compile(tables, patch, args.output)
+  print(f'Compiled patch {patch[0]}.{patch[1]} to {path}...')
+
+if __name__ == '__main__':
+  main()
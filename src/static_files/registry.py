@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+import bisect
+import os
+import pickle
+import threading
+
+# compiled tables written by static_files/parsing/assets_parser.py, one <patch>.pickle per game patch
+COMPILED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'compiled')
+
+def PatchOf(game_version):
+  """
+  Returns the (major, minor) patch of a gameVersion, eg '10.10.322.4670' -> (10, 10), None if it can not be parsed
+  """
+  try:
+    major, minor = str(game_version).split('.')[:2]
+    return int(major), int(minor)
+  except ValueError:
+    return None
+
+def NormalizeChampion(name):
+  """
+  Champion names are matched ignoring case, spaces and punctuation, so "kai'sa", 'Kaisa' and 'KaiSa' are the same
+  """
+  return ''.join(c for c in name if c.isalnum()).casefold()
+
+def MakeTable(mapping):
+  """
+  Packs an id -> name mapping into the (offset, names) form of an IdTable, non integer ids are skipped
+  """
+  ids = {}
+  for key, name in mapping.items():
+    try:
+      id_ = int(key)
+    except (TypeError, ValueError):
+      continue
+    # alternate forms, eg 'GnarBig': 150.2, are not ids and must not take the place of the champion
+    if id_ != key and str(id_) != key:
+      continue
+    ids[id_] = name
+  if not ids:
+    return 0, ()
+
+  offset = min(ids)
+  names = [None] * (max(ids) - offset + 1)
+  for key, name in ids.items():
+    names[key - offset] = name
+  return offset, tuple(names)
+
+
+class IdTable():
+  """
+  Array backed id -> name lookup, ids are used as list indexes so no hashing or str() is needed
+  """
+  __slots__ = ('offset', 'names')
+
+  def __init__(self, offset, names):
+    self.offset = offset
+    self.names = names
+
+  def Get(self, key, default=None):
+    if key is None:
+      return default
+    index = key - self.offset
+    if 0 <= index < len(self.names):
+      name = self.names[index]
+      return default if name is None else name
+    return default
+
+
+class StaticData():
+  """
+  Lookup tables of one game patch
+
+  Functions
+  ---------
+  ChampionId()
+    champion name -> champion id, ignoring case, spaces and punctuation
+  ChampionName(), Item(), Rune(), StatPerk(), Summoner()
+    id -> name lookups
+  """
+  __slots__ = ('patch', 'champions', 'items', 'runes', 'perks', 'summoners', 'champion_ids')
+
+  def __init__(self, patch, tables):
+    """
+    Arguments
+    ---------
+    patch : tuple
+      (major, minor) patch of the tables, None for the built in fallback
+    tables : dict
+      'champions', 'items', 'runes', 'perks', 'summoners' -> (offset, names) from MakeTable(),
+      'champion_ids' -> normalized champion name -> id
+    """
+    self.patch = patch
+    self.champions = IdTable(*tables['champions'])
+    self.items = IdTable(*tables['items'])
+    self.runes = IdTable(*tables['runes'])
+    self.perks = IdTable(*tables['perks'])
+    self.summoners = IdTable(*tables['summoners'])
+    self.champion_ids = tables['champion_ids']
+
+  def ChampionId(self, name):
+    return self.champion_ids.get(NormalizeChampion(name))
+
+  def ChampionName(self, champion_id):
+    return self.champions.Get(champion_id)
+
+  def Item(self, item_id):
+    return self.items.Get(item_id)
+
+  def Rune(self, rune_id):
+    return self.runes.Get(rune_id)
+
+  def StatPerk(self, perk_id):
+    return self.perks.Get(perk_id)
+
+  def Summoner(self, spell_id):
+    return self.summoners.Get(spell_id)
+
+
+def FallbackTables():
+  """
+  Builds the tables from the hand maintained *_dict.py modules, used when no patch was compiled
+  """
+  from static_files.champions_dict import champions
+  from static_files.items_dict import items_dict
+  from static_files.runes_dict import runes_dict
+  from static_files.perks_dict import perks_dict
+  from static_files.summoners_dict import summoners_dict
+
+  return {
+    'champions': MakeTable({v: k for k, v in champions.items() if isinstance(v, int)}),
+    'items': MakeTable(items_dict),
+    'runes': MakeTable(runes_dict),
+    'perks': MakeTable(perks_dict),
+    'summoners': MakeTable(summoners_dict),
+    'champion_ids': {NormalizeChampion(k): v for k, v in champions.items() if isinstance(v, int)},
+  }
+
+
+class StaticRegistry():
+  """
+  Lazily loaded, patch aware registry of static data
+
+  Each match resolves against the compiled tables of its own gameVersion, or of the closest older
+  patch if that one was not compiled. Tables are only read from disk the first time a patch is used
+
+  Functions
+  ---------
+  ForVersion()
+    Returns the StaticData for a gameVersion
+  Latest()
+    Returns the StaticData of the newest compiled patch
+  """
+  def __init__(self, directory=COMPILED_DIR):
+    self.directory = directory
+    self.lock = threading.Lock()
+    self.patches = None
+    self.loaded = {}
+
+  def Patches(self):
+    """
+    Returns
+      sorted list of the (major, minor) patches compiled in self.directory
+    """
+    if self.patches is None:
+      patches = []
+      if os.path.isdir(self.directory):
+        for name in os.listdir(self.directory):
+          if name.endswith('.pickle'):
+            patch = PatchOf(name[:-len('.pickle')])
+            if patch is not None:
+              patches.append(patch)
+      self.patches = sorted(patches)
+    return self.patches
+
+  def Resolve(self, patch):
+    """
+    Returns
+      the compiled patch to use for patch, None if nothing was compiled
+    """
+    patches = self.Patches()
+    if not patches:
+      return None
+    if patch is None:
+      return patches[-1]
+    # newest compiled patch not after the requested one, the oldest if the request predates them all
+    index = bisect.bisect_right(patches, patch)
+    return patches[max(index - 1, 0)]
+
+  def Load(self, patch):
+    with self.lock:
+      data = self.loaded.get(patch)
+      if data is None:
+        if patch is None:
+          tables = FallbackTables()
+        else:
+          with open(os.path.join(self.directory, f'{patch[0]}.{patch[1]}.pickle'), 'rb') as f:
+            tables = pickle.load(f)
+        data = self.loaded[patch] = StaticData(patch, tables)
+      return data
+
+  def ForVersion(self, game_version):
+    """
+    Arguments
+    ---------
+    game_version : str
+      gameVersion of a match, eg '10.10.322.4670'
+
+    Returns
+      StaticData
+    """
+    return self.Load(self.Resolve(PatchOf(game_version)))
+
+  def Latest(self):
+    return self.Load(self.Resolve(None))
+
+
+registry = StaticRegistry()
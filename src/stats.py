@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from static_files.registry import registry, PatchOf
+from match_decoder import Matchup
+from match_store import GetMatchStore
+from matchup_index import GetMatchupIndex
+import metrics
+
+# most frequent entries returned per item, rune, stat perk and spell list
+TOP = 5
+
+# per row arrays of MatchupColumns, joined and selected together
+FIELDS = ('versions', 'game_id', 'date', 'patch', 'win', 'kills', 'deaths', 'assists', 'spells', 'items', 'perks', 'stat_perks')
+
+def PatchCode(game_version):
+  """
+  Returns the patch of a gameVersion as one int, eg '10.10.322.4670' -> 1010, -1 if it can not be parsed
+  """
+  patch = PatchOf(game_version)
+  return -1 if patch is None else patch[0] * 100 + patch[1]
+
+
+class MatchupColumns():
+  """
+  Columnar form of the player side of a list of matchups, one row per game
+
+  Attributes
+  ----------
+  game_id, date : np.ndarray
+    int64 gameId and gameCreation in epoch milliseconds
+  patch : np.ndarray
+    int32 major * 100 + minor of the gameVersion, -1 when it can not be parsed
+  win : np.ndarray
+    bool, whether champion won
+  kills, deaths, assists : np.ndarray
+    int32
+  spells, items, perks, stat_perks : np.ndarray
+    int32 (rows, 2), (rows, 7), (rows, 6) and (rows, 3), 0 for an empty slot or a missing stat perk
+  versions : np.ndarray
+    object array of the gameVersion of every row
+
+  Functions
+  ---------
+  Mask()
+    Returns the rows passing the patch and date filters
+  Select()
+    Returns the columns of the rows of a mask
+  Join()
+    Returns the rows of several MatchupColumns one after the other
+  """
+  def __init__(self, matchups=()):
+    """
+    Arguments
+    ---------
+    matchups : list
+      Matchup records, eg from Wrapper().IterMatchBreakdown()
+    """
+    players = [m.player for m in matchups]
+    n = len(players)
+    self.versions = np.array([m.match.game_version for m in matchups], dtype=object).reshape(n)
+    self.game_id = np.fromiter((m.match.game_id for m in matchups), np.int64, n)
+    self.date = np.fromiter((m.match.game_creation for m in matchups), np.int64, n)
+    self.win = np.fromiter((p.win for p in players), np.bool_, n)
+    self.kills = np.fromiter((p.kills for p in players), np.int32, n)
+    self.deaths = np.fromiter((p.deaths for p in players), np.int32, n)
+    self.assists = np.fromiter((p.assists for p in players), np.int32, n)
+    self.spells = np.array([(p.spell1, p.spell2) for p in players], np.int32).reshape(n, 2)
+    self.items = np.array([[i or 0 for i in p.items] for p in players], np.int32).reshape(n, 7)
+    self.perks = np.array([[i or 0 for i in p.perks] for p in players], np.int32).reshape(n, 6)
+    self.stat_perks = np.array([[i or 0 for i in p.stat_perks] for p in players], np.int32).reshape(n, 3)
+
+    # versions repeat a lot, each distinct one is only parsed once
+    unique, inverse = np.unique(self.versions.astype(str), return_inverse=True)
+    codes = np.array([PatchCode(version) for version in unique], np.int32)
+    self.patch = codes[inverse].reshape(n) if n else np.zeros(0, np.int32)
+
+  def __len__(self):
+    return len(self.game_id)
+
+  @classmethod
+  def _FromFields(cls, fields):
+    columns = cls.__new__(cls)
+    for name, values in fields.items():
+      setattr(columns, name, values)
+    return columns
+
+  def Select(self, rows):
+    """
+    Arguments
+    ---------
+    rows : np.ndarray
+      bool mask or indexes of the rows to keep
+
+    Returns
+      MatchupColumns of the selected rows
+    """
+    return self._FromFields({name: getattr(self, name)[rows] for name in FIELDS})
+
+  @classmethod
+  def Join(cls, parts):
+    """
+    Returns
+      MatchupColumns of the rows of every MatchupColumns in parts, in order
+    """
+    return cls._FromFields({name: np.concatenate([getattr(part, name) for part in parts]) for name in FIELDS})
+
+  def Mask(self, patches=None, begin_time=None, end_time=None):
+    """
+    Arguments
+    ---------
+    patches : iterable
+      patches to keep, eg ['10.10', '10.11'], None keeps every patch
+    begin_time, end_time : int
+      epoch milliseconds, only games created in [begin_time, end_time) are kept
+
+    Returns
+      np.ndarray of bool selecting the rows passing the filters
+    """
+    mask = np.ones(len(self), np.bool_)
+    if patches:
+      mask &= np.isin(self.patch, [PatchCode(patch) for patch in patches])
+    if begin_time is not None:
+      mask &= self.date >= begin_time
+    if end_time is not None:
+      mask &= self.date < end_time
+    return mask
+
+
+def _Top(values, games, name, top=TOP):
+  """
+  Returns
+    list of {'id', 'name', 'games', 'rate'} of the most frequent non zero values, each value counted once per game
+  """
+  if values.size == 0:
+    return []
+  values = np.sort(values, axis=1)
+  repeated = np.zeros(values.shape, np.bool_)
+  repeated[:, 1:] = values[:, 1:] == values[:, :-1]
+  ids, counts = np.unique(values[~repeated & (values != 0)], return_counts=True)
+  order = np.argsort(-counts, kind='stable')[:top]
+  return [{'id': int(ids[i]), 'name': name(int(ids[i])), 'games': int(counts[i]), 'rate': float(counts[i] / games)}
+          for i in order]
+
+def _Summary(values):
+  return {'mean': float(values.mean()), 'median': float(np.median(values))}
+
+def MatchupStats(matchups, patches=None, begin_time=None, end_time=None, top=TOP):
+  """
+  Aggregates the player side of matchups with columnar operations
+
+  Arguments
+  ---------
+  matchups : list
+    Matchup records of one champion against one enemy champion, or their MatchupColumns
+  patches : iterable
+    patches to keep, eg ['10.10', '10.11'], None keeps every patch
+  begin_time, end_time : int
+    epoch milliseconds, only games created in [begin_time, end_time) are kept
+  top : int
+    number of most frequent items, runes, stat perks and spells returned
+
+  Returns
+    dict of games, wins, winRate, kills/deaths/assists/kda mean and median, first and last game date,
+    games per patch and the most frequent items, runes per slot, stat perks per slot and summoner spells
+  """
+  columns = matchups if isinstance(matchups, MatchupColumns) else MatchupColumns(matchups)
+  mask = columns.Mask(patches, begin_time, end_time)
+  games = int(mask.sum())
+  stats = {'games': games}
+  if not games:
+    return stats
+
+  win = columns.win[mask]
+  kills, deaths, assists = columns.kills[mask], columns.deaths[mask], columns.assists[mask]
+  date = columns.date[mask]
+  patch_codes, patch_games = np.unique(columns.patch[mask], return_counts=True)
+
+  # names follow the static data of the newest game kept
+  newest = int(np.argmax(np.where(mask, columns.date, np.iinfo(np.int64).min)))
+  static = registry.ForVersion(columns.versions[newest])
+
+  stats.update({
+    'wins': int(win.sum()),
+    'winRate': float(win.mean()),
+    'kills': _Summary(kills),
+    'deaths': _Summary(deaths),
+    'assists': _Summary(assists),
+    'kda': _Summary((kills + assists) / np.maximum(deaths, 1)),
+    'firstGame': int(date.min()) / 1000,
+    'lastGame': int(date.max()) / 1000,
+    'patches': {f'{code // 100}.{code % 100}': int(count) for code, count in zip(patch_codes, patch_games) if code >= 0},
+    'items': _Top(columns.items[mask], games, static.Item, top),
+    'runes': {f'perk{slot}': _Top(columns.perks[mask][:, slot:slot + 1], games, static.Rune, top) for slot in range(6)},
+    'statPerks': {f'statPerk{slot}': _Top(columns.stat_perks[mask][:, slot:slot + 1], games, static.StatPerk, top)
+                  for slot in range(3)},
+    'spells': _Top(columns.spells[mask], games, static.Summoner, top),
+  })
+  return stats
+
+class StoredColumns():
+  """
+  Bounded LRU of the MatchupColumns of stored matchups, per (region, champion, enemy champion)
+
+  Stored matches never change, so the columns of a matchup are only appended to: a lookup decodes the games
+  the matchup index gained since the previous one and reuses the rows already built.
+  Counters 'stats_columns_decoded' and 'stats_columns_reused' are kept in metrics
+
+  Functions
+  ---------
+  Get()
+    Returns the columns of the newest stored games of a matchup
+  """
+  def __init__(self, size=32):
+    """
+    Arguments
+    ---------
+    size : int
+      maximum number of matchups kept, the least recently used is evicted first
+    """
+    self.size = size
+    self.entries = OrderedDict()
+    self.lock = threading.Lock()
+
+  def Get(self, region, champion_id, enemy_champion_id, limit=None):
+    """
+    Arguments
+    ---------
+    region : str
+      region the games were played in
+    champion_id, enemy_champion_id : int
+      champion the statistics are about and the champion it faced
+    limit : int
+      only the newest limit games are returned, None returns every stored game
+
+    Returns
+      MatchupColumns of the games, newest first
+    """
+    key = (region, champion_id, enemy_champion_id)
+    hits = GetMatchupIndex().Lookup(region, champion_id, enemy_champion_id)
+    game_ids = np.array(sorted(hits, reverse=True)[:limit], np.int64)
+
+    with self.lock:
+      cached = self.entries.get(key)
+      if cached is not None:
+        self.entries.move_to_end(key)
+    cached = cached if cached is not None else MatchupColumns()
+
+    missing = game_ids[~np.isin(game_ids, cached.game_id)]
+    metrics.Increment('stats_columns_reused', len(game_ids) - len(missing))
+    if len(missing):
+      metrics.Increment('stats_columns_decoded', len(missing))
+      with metrics.Timer('stats_decode'):
+        added = MatchupColumns(_Matchups(region, champion_id, enemy_champion_id, missing.tolist()))
+      with self.lock:
+        # another request may have added some of the same games meanwhile
+        current = self.entries.get(key, cached)
+        added = added.Select(~np.isin(added.game_id, current.game_id))
+        columns = MatchupColumns.Join([current, added])
+        columns = columns.Select(np.argsort(-columns.game_id, kind='stable'))
+        self.entries[key] = cached = columns
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+          self.entries.popitem(last=False)
+
+    return cached.Select(np.isin(cached.game_id, game_ids))
+
+
+def _Matchups(region, champion_id, enemy_champion_id, game_ids):
+  matchups = []
+  for game_id, match in sorted(GetMatchStore().GetMany(region, game_ids).items(), reverse=True):
+    player, enemy = match.Find(champion_id), match.Find(enemy_champion_id)
+    if player is not None and enemy is not None and player.team_id != enemy.team_id:
+      matchups.append(Matchup(match, player, enemy))
+  return matchups
+
+
+_columns = None
+_columns_lock = threading.Lock()
+
+def GetStoredColumns():
+  """
+  Returns the process wide StoredColumns, the number of matchups it keeps is set by the STATS_CACHE_SIZE environment variable
+  """
+  global _columns
+  with _columns_lock:
+    if _columns is None:
+      _columns = StoredColumns(int(os.getenv('STATS_CACHE_SIZE', 32)))
+    return _columns
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+from collections import OrderedDict
+import metrics
+
+def NormalizeName(name):
+  """
+  Riot ignores case and whitespace in summoner names, so 'Doublelift' and 'double lift' are the same summoner
+  """
+  return ''.join(name.split()).casefold()
+
+
+class SummonerCache():
+  """
+  Bounded LRU cache of summoner name -> SummonerV4 response, per region
+
+  Found summoners are kept for ttl seconds, unknown names (404) for negative_ttl seconds.
+  Counters 'summoner_cache_hits', 'summoner_cache_negative_hits', 'summoner_cache_misses'
+  and 'summoner_cache_evictions' are kept in metrics
+
+  Functions
+  ---------
+  Get()
+    Returns the cached (status, summoner) for a name or None
+  Put()
+    Caches a SummonerV4 result, only 200 and 404 responses are kept
+  """
+  def __init__(self, size=10000, ttl=86400, negative_ttl=300):
+    """
+    Arguments
+    ---------
+    size : int
+      maximum number of names kept, the least recently used is evicted first
+    ttl : int
+      seconds a found summoner is kept
+    negative_ttl : int
+      seconds an unknown name is kept
+    """
+    self.size = size
+    self.ttl = ttl
+    self.negative_ttl = negative_ttl
+    self.entries = OrderedDict()
+    self.lock = threading.Lock()
+
+  def Get(self, region, name):
+    """
+    Returns
+      (status, summoner json) tuple, None if the name is not cached or expired
+    """
+    key = (region, NormalizeName(name))
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is not None and entry[0] < time.monotonic():
+        del self.entries[key]
+        entry = None
+
+      if entry is None:
+        metrics.Increment('summoner_cache_misses')
+        return None
+
+      self.entries.move_to_end(key)
+
+    metrics.Increment('summoner_cache_hits' if entry[1] == 200 else 'summoner_cache_negative_hits')
+    return entry[1], entry[2]
+
+  def Put(self, region, name, status, summoner):
+    if status == 200:
+      expires = time.monotonic() + self.ttl
+    elif status == 404:
+      expires = time.monotonic() + self.negative_ttl
+    else:
+      return
+
+    key = (region, NormalizeName(name))
+    evicted = 0
+    with self.lock:
+      self.entries[key] = (expires, status, summoner)
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.size:
+        self.entries.popitem(last=False)
+        evicted += 1
+
+    if evicted:
+      metrics.Increment('summoner_cache_evictions', evicted)
+
+  def __len__(self):
+    return len(self.entries)
+
+
+summoner_cache = SummonerCache()
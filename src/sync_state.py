@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+class SyncState():
+  """
+  Per (region, account, champion, queue) record of the matchlist already seen, newest game first
+
+  Lets a repeat query ask MatchV4 only for the games played since the newest one seen
+
+  Functions
+  ---------
+  Get()
+    Returns the stored gameIds, newest timestamp and whether the matchlist was read to its end
+  Save()
+    Replaces the stored matchlist of a key
+  Extend()
+    Appends an older matchlist page to the stored matchlist of a key
+  """
+  def __init__(self, path):
+    """
+    Arguments
+    ---------
+    path : str
+      sqlite file the sync state is kept in
+    """
+    self.path = path
+    self.lock = threading.Lock()
+    self.db = sqlite3.connect(path, check_same_thread=False)
+    self.db.execute('PRAGMA journal_mode=WAL')
+    self.db.execute('CREATE TABLE IF NOT EXISTS sync_state ('
+                    'region TEXT NOT NULL, account_id TEXT NOT NULL, champion_id INTEGER NOT NULL, queue INTEGER NOT NULL, '
+                    'game_ids TEXT NOT NULL, last_timestamp INTEGER NOT NULL, exhausted INTEGER NOT NULL, updated REAL NOT NULL, '
+                    'PRIMARY KEY (region, account_id, champion_id, queue)) WITHOUT ROWID')
+    self.db.commit()
+
+  def Get(self, key):
+    """
+    Arguments
+    ---------
+    key : tuple
+      (region, account_id, champion_id, queue)
+
+    Returns
+      (gameIds newest first, newest game timestamp in epoch milliseconds, exhausted), None if never synced
+    """
+    with self.lock:
+      row = self.db.execute('SELECT game_ids, last_timestamp, exhausted FROM sync_state '
+                            'WHERE region = ? AND account_id = ? AND champion_id = ? AND queue = ?', key).fetchone()
+    if row is None:
+      return None
+    return json.loads(row[0]), row[1], bool(row[2])
+
+  def Save(self, key, game_ids, last_timestamp, exhausted):
+    with self.lock:
+      self.db.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                      (*key, json.dumps(game_ids), last_timestamp, int(exhausted), time.time()))
+      self.db.commit()
+
+  def Extend(self, key, begin_index, game_ids, exhausted):
+    """
+    Appends the page of the matchlist starting at begin_index, ignored unless it directly follows the stored gameIds
+    """
+    with self.lock:
+      row = self.db.execute('SELECT game_ids FROM sync_state '
+                            'WHERE region = ? AND account_id = ? AND champion_id = ? AND queue = ?', key).fetchone()
+      if row is None:
+        return
+      stored = json.loads(row[0])
+      if len(stored) != begin_index:
+        return
+      self.db.execute('UPDATE sync_state SET game_ids = ?, exhausted = ?, updated = ? '
+                      'WHERE region = ? AND account_id = ? AND champion_id = ? AND queue = ?',
+                      (json.dumps(stored + game_ids), int(exhausted), time.time(), *key))
+      self.db.commit()
+
+
+_state = None
+_state_lock = threading.Lock()
+
+def GetSyncState():
+  """
+  Returns the process wide SyncState, kept next to the match store in the MATCH_STORE file
+  """
+  global _state
+  with _state_lock:
+    if _state is None:
+      _state = SyncState(os.getenv('MATCH_STORE', 'match_store.db'))
+    return _state
@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import pytest
+
+import columnar_export
+from benchmarks.fake_riot_api import World
+from columnar_export import ColumnarExport, ColumnarWriter, Export
+from match_decoder import DecodeMatch
+from match_store import MatchStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+  """
+  Fresh match store the exports read from
+  """
+  store = MatchStore(str(tmp_path / 'match_store.db'))
+  monkeypatch.setattr(columnar_export, 'GetMatchStore', lambda: store)
+  return store
+
+def Put(store, game_ids, region='na1'):
+  world = World()
+  for game_id in game_ids:
+    store.Put(region, DecodeMatch(world.Match(game_id)))
+
+def Games(export):
+  return sorted(set(export['game_id'].tolist()))
+
+
+def test_export_appends_only_new_games(store, tmp_path):
+  directory = str(tmp_path / 'export')
+  Put(store, range(20))
+  assert Export(directory) == (20, 200)
+
+  Put(store, range(20, 30))
+  assert Export(directory) == (10, 100)
+  assert Export(directory) == (0, 0)
+
+  export = ColumnarExport(directory)
+  assert len(export) == 300 and export.manifest['games'] == 30
+  assert Games(export) == list(range(30))
+  assert export['items'].shape == (300, 7)
+  assert export.Strings('region') == ['na1']
+
+def test_export_reads_back_the_stored_matches(store, tmp_path):
+  directory = str(tmp_path / 'export')
+  Put(store, range(5))
+  Export(directory)
+
+  export = ColumnarExport(directory)
+  match = store.Get('na1', 3)
+  rows = np.flatnonzero(export['game_id'] == 3)
+  assert export['champion_id'][rows].tolist() == [p.champion_id for p in match.participants]
+  assert export['win'][rows].tolist() == [int(bool(p.win)) for p in match.participants]
+  usernames = export.Strings('username')
+  assert [usernames[code] for code in export['username'][rows]] == [p.username for p in match.participants]
+
+def test_interrupted_commit_is_dropped_and_redone(store, tmp_path, monkeypatch):
+  directory = str(tmp_path / 'export')
+  Put(store, range(10))
+  Export(directory)
+  sizes = {name: os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)}
+
+  # columns and strings of the next batch are written but the manifest is never replaced
+  Put(store, range(10, 15), region='euw1')
+  writer = ColumnarWriter(directory)
+  for region, match in store.Iter():
+    writer.Append(region, match)
+  def Crash(src, dst):
+    raise OSError('interrupted')
+  with monkeypatch.context() as patch, pytest.raises(OSError):
+    patch.setattr(columnar_export.os, 'replace', Crash)
+    writer.Commit()
+
+  assert os.path.getsize(os.path.join(directory, 'game_id.bin')) > sizes['game_id.bin']
+  export = ColumnarExport(directory)
+  assert len(export) == 100 and Games(export) == list(range(10))
+  assert export.Strings('region') == ['na1']
+
+  # the writer truncates the bytes past the manifest, the games of the lost batch are exported again
+  ColumnarWriter(directory)
+  for name in ('game_id.bin', 'items.bin', 'region.strings', 'username.strings'):
+    assert os.path.getsize(os.path.join(directory, name)) == sizes[name]
+
+  assert Export(directory) == (5, 50)
+  export = ColumnarExport(directory)
+  assert len(export) == 150 and export.manifest['games'] == 15
+  assert Games(export) == list(range(15))
+  assert export.Strings('region') == ['na1', 'euw1']
+  regions = export['region'][export['game_id'] >= 10]
+  assert set(regions.tolist()) == {1}
@@ -0,0 +1,62 @@
+import json
+import os
+import threading
+
+from prefetch import PrefetchScheduler
+
+
+def test_reload_picks_up_entries_of_another_process(tmp_path):
+  path = str(tmp_path / 'watchlist.json')
+  server = PrefetchScheduler(path)
+  worker = PrefetchScheduler(path)
+
+  server.Watch('na1', 'Alpha', 'Darius')
+  server.Watch('na1', 'Beta', 'Garen')
+  assert worker.Reload()
+  assert sorted(e['summoner'] for e in worker.List()) == ['Alpha', 'Beta']
+
+  # entries still watched keep their schedule
+  worker.entries[('na1', 'alpha', 'darius')]['next_run'] = 123
+  server.Unwatch('na1', 'Beta', 'Garen')
+  os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+  assert worker.Reload()
+  assert [(e['summoner'], e['next_run']) for e in worker.List()] == [('Alpha', 123)]
+  assert not worker.Reload()
+
+def test_saving_does_not_reload_its_own_file(tmp_path):
+  path = str(tmp_path / 'watchlist.json')
+  scheduler = PrefetchScheduler(path)
+  scheduler.Watch('na1', 'Alpha', 'Darius', 600)
+  assert not scheduler.Reload()
+  with open(path) as f:
+    assert json.load(f)[0]['interval'] == 600
+
+def test_concurrent_watches_all_save(tmp_path):
+  path = str(tmp_path / 'watchlist.json')
+  scheduler = PrefetchScheduler(path, max_entries=1000)
+  errors = []
+
+  def Run(thread):
+    for i in range(100):
+      try:
+        scheduler.Watch('na1', f'summoner {thread} {i}', 'Darius')
+      except OSError as error:
+        errors.append(error)
+
+  threads = [threading.Thread(target=Run, args=(thread,)) for thread in range(8)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert errors == []
+  with open(path) as f:
+    assert len(json.load(f)) == 800
+
+def test_watch_list_is_capped(tmp_path):
+  scheduler = PrefetchScheduler(str(tmp_path / 'watchlist.json'), max_entries=2)
+  assert scheduler.Watch('na1', 'Alpha', 'Darius') is not None
+  assert scheduler.Watch('na1', 'Beta', 'Darius') is not None
+  assert scheduler.Watch('na1', 'Gamma', 'Darius') is None
+  # entries already watched may still change their interval
+  assert scheduler.Watch('na1', 'alpha', 'darius', 900)['interval'] == 900
+  assert len(scheduler.List()) == 2
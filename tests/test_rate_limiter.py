@@ -0,0 +1,75 @@
+import threading
+import time
+
+import pytest
+
+from rate_limiter import ParseRateLimitHeader, RateLimiter
+
+
+def test_parse_rate_limit_header():
+  assert ParseRateLimitHeader('20:1,100:120') == [(20, 1), (100, 120)]
+  assert ParseRateLimitHeader(' 5:10 , bad, x:1') == [(5, 10)]
+  assert ParseRateLimitHeader(None) == []
+
+def test_no_over_grant_within_a_window():
+  limiter = RateLimiter(((10, 60),), 0.0)
+  granted = []
+  lock = threading.Lock()
+
+  def Hammer():
+    for _ in range(20):
+      if limiter.TryAcquire('match') <= 0:
+        with lock:
+          granted.append(1)
+
+  threads = [threading.Thread(target=Hammer) for _ in range(8)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert len(granted) == 10
+  assert 59 < limiter.TryAcquire('match') <= 60
+
+def test_every_window_is_respected():
+  limiter = RateLimiter(((3, 0.2), (5, 60)), 0.0)
+  for _ in range(3):
+    assert limiter.TryAcquire() == 0
+  # the short window is full but frees up, the long one then caps the total
+  assert 0 < limiter.TryAcquire() <= 0.2
+  assert limiter.Acquire() > 0
+  assert limiter.TryAcquire() == 0
+  assert limiter.TryAcquire() > 1
+  assert limiter.requests == 5
+
+def test_share_leaves_headroom():
+  limiter = RateLimiter(((10, 60),), 0.0)
+  for _ in range(5):
+    assert limiter.TryAcquire(share=0.5) == 0
+  assert limiter.TryAcquire(share=0.5) > 0
+  assert limiter.TryAcquire() == 0
+  assert limiter.Headroom() == pytest.approx(0.4)
+
+def test_headers_replace_limits_and_sync_counts():
+  limiter = RateLimiter(((20, 1), (100, 120)), 0.0)
+  limiter.Update({'X-App-Rate-Limit': '5:10', 'X-App-Rate-Limit-Count': '4:10',
+                  'X-Method-Rate-Limit': '2:10', 'X-Method-Rate-Limit-Count': '1:10'}, 200, 'match')
+  assert limiter.Usage() == {'app': {10: [4, 5]}, 'match': {10: [1, 2]}}
+  # another process used the key, only one request is left for match and the app
+  assert limiter.TryAcquire('match') == 0
+  assert limiter.TryAcquire('match') > 0
+  assert limiter.TryAcquire('matchlist') > 0
+
+def test_429_blocks_until_retry_after():
+  limiter = RateLimiter(((100, 1),), 0.0)
+  limiter.Update({'Retry-After': '0.2'}, 429)
+  assert limiter.Headroom() == 0
+  assert 0.1 < limiter.TryAcquire() <= 0.2
+  start = time.monotonic()
+  limiter.Acquire()
+  assert time.monotonic() - start >= 0.15
+  assert limiter.Headroom() > 0
+
+def test_429_without_retry_after_blocks_a_second():
+  limiter = RateLimiter(((100, 1),), 0.0)
+  limiter.Update({}, 429)
+  assert 0.9 < limiter.TryAcquire() <= 1
@@ -0,0 +1,24 @@
+import pytest
+
+from static_files.champions_dict import champions_inv
+from static_files.parsing.assets_parser import CheckChampions
+from static_files.registry import FallbackTables, MakeTable, StaticData, registry
+
+
+def test_make_table_skips_non_integer_ids():
+  offset, names = MakeTable({150: 'Gnar', 150.2: 'GnarBig', '1001': 'Boots', 'x': 'Nothing'})
+  assert names[150 - offset] == 'Gnar'
+  assert names[1001 - offset] == 'Boots'
+  assert 'GnarBig' not in names
+
+@pytest.mark.parametrize('data', [registry.Latest(), StaticData(None, FallbackTables())], ids=['compiled', 'fallback'])
+def test_registry_agrees_with_champions_inv(data):
+  for champion_id, name in champions_inv.items():
+    if isinstance(champion_id, int):
+      assert data.ChampionName(champion_id) == name
+      assert data.ChampionId(name) == champion_id
+
+def test_build_check_catches_a_wrong_champion_name():
+  assert CheckChampions(FallbackTables()) == []
+  tables = {**FallbackTables(), 'champions': (150, ('GnarBig',))}
+  assert (150, 'GnarBig', 'Gnar') in CheckChampions(tables)
@@ -0,0 +1,96 @@
+import time
+import types
+
+import pytest
+
+import response_cache
+from response_cache import ResponseCache, CacheKey
+
+
+@pytest.fixture
+def clock(monkeypatch):
+  """
+  Clock of the response cache in seconds, only moved by the test
+  """
+  clock = {'now': 1000.0}
+  monkeypatch.setattr(response_cache, 'time', types.SimpleNamespace(time=lambda: clock['now'], monotonic=time.monotonic))
+  return clock
+
+def Cache(tmp_path, **kwargs):
+  """
+  ResponseCache whose background thread never flushes on its own, writes stay pending until Flush()
+  """
+  return ResponseCache(str(tmp_path / 'response_cache.db'), ttls={'summoner': 100, 'matchlist': 10},
+                       flush_interval=3600, **kwargs)
+
+
+def test_cache_key_sorts_params():
+  assert CacheKey('na1', '/path', {'b': 2, 'a': 1}) == 'na1/path?a=1&b=2'
+  assert CacheKey('na1', '/path') == 'na1/path'
+
+def test_methods_without_ttl_are_not_cached(tmp_path, clock):
+  cache = Cache(tmp_path)
+  cache.Put('match', 'key', b'body')
+  assert cache.Get('match', 'key') is None
+  assert cache.Stats()['pending'] == 0
+
+def test_entries_expire_after_their_ttl(tmp_path, clock):
+  cache = Cache(tmp_path)
+  cache.Put('matchlist', 'list', b'list')
+  cache.Put('summoner', 'summoner', b'summoner')
+  cache.Flush()
+
+  clock['now'] += 9
+  assert cache.Get('matchlist', 'list') == b'list'
+  clock['now'] += 1
+  assert cache.Get('matchlist', 'list') is None
+  assert cache.Get('summoner', 'summoner') == b'summoner'
+
+  # expired on disk as well
+  cache.entries.clear()
+  assert cache.Get('matchlist', 'list') is None
+  assert cache.Get('summoner', 'summoner') == b'summoner'
+
+def test_pending_writes_are_read_before_their_flush(tmp_path, clock):
+  cache = Cache(tmp_path, size=1)
+  cache.Put('summoner', 'a', b'a')
+  cache.Put('summoner', 'b', b'b')
+  assert 'a' not in cache.entries and cache.Stats()['pending'] == 2
+  assert cache.Get('summoner', 'a') == b'a'
+  assert cache.Stats()['disk'] == 0
+
+  assert cache.Flush() == 2
+  cache.entries.clear()
+  assert cache.Get('summoner', 'a') == b'a'
+  assert cache.Stats()['disk_hits'] == 1
+  # a disk hit is kept in memory
+  assert cache.Get('summoner', 'a') == b'a'
+  assert cache.Stats()['disk_hits'] == 1
+
+def test_disk_tier_survives_a_restart(tmp_path, clock):
+  cache = Cache(tmp_path)
+  cache.Put('summoner', 'key', b'body')
+  cache.Flush()
+  assert Cache(tmp_path).Get('summoner', 'key') == b'body'
+
+def test_compact_deletes_expired_rows(tmp_path, clock):
+  cache = Cache(tmp_path)
+  cache.Put('matchlist', 'list', b'list')
+  cache.Put('summoner', 'summoner', b'summoner')
+  cache.Flush()
+  assert cache.Compact() == 0
+
+  clock['now'] += 10
+  assert cache.Compact() == 1
+  assert cache.Stats()['disk'] == 1 and cache.Stats()['compacted'] == 1
+
+def test_compact_keeps_the_rows_expiring_last(tmp_path, clock):
+  cache = Cache(tmp_path, max_rows=3)
+  for i in range(5):
+    cache.Put('summoner', f'key{i}', b'body')
+    clock['now'] += 1
+  cache.Flush()
+  assert cache.Compact() == 2
+
+  cache.entries.clear()
+  assert [cache.Get('summoner', f'key{i}') is not None for i in range(5)] == [False, False, True, True, True]
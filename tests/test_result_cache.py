@@ -0,0 +1,103 @@
+import gzip
+import json
+import zlib
+
+from result_cache import AcceptedEncoding, ETagMatches, CachedResult, ResultCache
+
+
+def Result(game_ids):
+  """
+  Returns a result as MatchBreakdown() builds them, one padded entry per gameId
+  """
+  return {game_id: {'gameId': game_id, 'notes': 'x' * 100} for game_id in game_ids}
+
+
+def test_accepted_encoding_follows_q_values():
+  assert AcceptedEncoding('gzip, deflate') == 'gzip'
+  assert AcceptedEncoding('deflate, gzip') == 'gzip'
+  assert AcceptedEncoding('gzip;q=0.5, deflate') == 'deflate'
+  assert AcceptedEncoding('GZIP;q=0.8, deflate;q=0.2') == 'gzip'
+  assert AcceptedEncoding('br') is None
+  assert AcceptedEncoding('') is None
+  assert AcceptedEncoding(None) is None
+
+def test_accepted_encoding_refuses_q_zero():
+  assert AcceptedEncoding('gzip;q=0') is None
+  assert AcceptedEncoding('gzip;q=0, deflate') == 'deflate'
+  assert AcceptedEncoding('gzip;q=bad') is None
+
+def test_accepted_encoding_wildcard():
+  assert AcceptedEncoding('*') == 'gzip'
+  assert AcceptedEncoding('gzip;q=0, *') == 'deflate'
+  assert AcceptedEncoding('*;q=0, deflate;q=0.1') == 'deflate'
+  assert AcceptedEncoding('*;q=0') is None
+
+
+def test_etag_matches():
+  entry = CachedResult([1, 2], b'{}')
+  etags = entry.ETags()
+  assert ETagMatches(entry.ETag(), etags)
+  assert ETagMatches(entry.ETag('gzip'), etags)
+  assert ETagMatches('*', etags)
+  assert ETagMatches(f'"other", {entry.ETag("deflate")}', etags)
+  # weak tags compare equal to the strong ones
+  assert ETagMatches(f'W/{entry.ETag()}', etags)
+  assert not ETagMatches('"other"', etags)
+  assert not ETagMatches('', etags)
+  assert not ETagMatches(None, etags)
+
+def test_etags_only_depend_on_the_game_ids():
+  assert CachedResult([2, 1], b'a').ETags() == CachedResult({1, 2}, b'b').ETags()
+  assert CachedResult([1, 2], b'a').ETag() != CachedResult([1, 3], b'a').ETag()
+  tags = CachedResult([1], b'a').ETags()
+  assert len(set(tags)) == len(tags)
+
+
+def test_put_reuses_the_entry_of_the_same_game_ids():
+  cache = ResultCache()
+  first = cache.Put('query', Result([1, 2]))
+  assert cache.Put('query', Result([2, 1])) is first
+  assert cache.Get('query') is first
+  assert cache.Stats() == {'entries': 1, 'hits': 1, 'misses': 1, 'invalidations': 0, 'evictions': 0}
+
+def test_put_invalidates_on_new_game_ids():
+  cache = ResultCache()
+  first = cache.Put('query', Result([1, 2]))
+  second = cache.Put('query', Result([1, 2, 3]))
+  assert second is not first and second.ETag() != first.ETag()
+  assert cache.Get('query') is second
+  assert json.loads(second.body) == json.loads(json.dumps(Result([1, 2, 3])))
+  assert cache.Stats()['invalidations'] == 1
+
+def test_put_evicts_the_least_recently_used():
+  cache = ResultCache(size=2)
+  cache.Put('a', Result([1]))
+  cache.Put('b', Result([2]))
+  cache.Get('a')
+  cache.Put('c', Result([3]))
+  assert cache.Get('b') is None
+  assert cache.Get('a') is not None and cache.Get('c') is not None
+  assert cache.Stats()['evictions'] == 1
+
+
+def test_gzip_bytes_are_stable():
+  body = json.dumps(Result(range(50))).encode()
+  first = CachedResult(range(50), body).Encoded('gzip')
+  second = CachedResult(range(50), body).Encoded('gzip')
+  assert first == second
+  assert gzip.decompress(first) == body
+
+def test_encoded_bodies_are_built_once():
+  entry = ResultCache().Put('query', Result(range(50)))
+  gzipped = entry.Encoded('gzip')
+  assert entry.Encoded('gzip') is gzipped
+  assert zlib.decompress(entry.Encoded('deflate')) == entry.body
+  assert entry.Encoded(None) is entry.body
+
+def test_small_bodies_are_not_compressed():
+  cache = ResultCache(min_compress=1024)
+  small = cache.Put('small', Result([1]))
+  large = cache.Put('large', Result(range(50)))
+  assert cache.Encoding(small, 'gzip') is None
+  assert cache.Encoding(large, 'gzip') == 'gzip'
+  assert cache.Encoding(large, 'identity') is None
@@ -0,0 +1,39 @@
+from match_decoder import DecodeMatch
+from match_store import MatchStore
+from matchup_index import MatchupIndex
+from riot_endpoints import Wrapper
+from scheduler import Schedulers
+
+
+def Match(game_id, lineup):
+  """
+  Returns a decoded match whose participants are the (champion id, team id, account id) of lineup
+  """
+  return DecodeMatch({
+    'gameId': game_id, 'gameCreation': 0, 'gameVersion': '10.10.1',
+    'participants': [{'participantId': i, 'teamId': team_id, 'championId': champion_id, 'spell1Id': 4, 'spell2Id': 14,
+                      'stats': {'win': team_id == 100, 'kills': 0, 'deaths': 0, 'assists': 0}}
+                     for i, (champion_id, team_id, _) in enumerate(lineup, 1)],
+    'participantIdentities': [{'participantId': i, 'player': {'accountId': account_id}}
+                              for i, (_, _, account_id) in enumerate(lineup, 1)]})
+
+
+def test_candidates_keep_matchups_stored_under_an_older_account_id(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  info = Wrapper('na1', 'someone', 'Darius', 'Garen')
+  info.store = MatchStore(str(tmp_path / 'match_store.db'))
+  info.index = MatchupIndex(str(tmp_path / 'match_store.db'))
+  info.index.Add('na1', Match(3, [(info.champion_id, 100, 'original account'),
+                                  (info.enemy_champion_id, 200, 'enemy account')]))
+  info.index.Add('na1', Match(4, []))
+
+  # the summoner's account has changed since the game was stored
+  info.account_id = 'current account'
+  assert info.Candidates([3, 4, 99]) == [3, 99]
+
+def test_invalid_region_creates_no_scheduler(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  info = Wrapper('zz', 'someone', 'Darius', 'Garen')
+  assert info.SummonerData() == 400
+  assert info.Request('/lol/summoner/v4/summoners/by-name/someone', 'summoner') == (400, None)
+  assert 'zz' not in Schedulers()
@@ -0,0 +1,75 @@
+import threading
+import time
+
+from rate_limiter import RateLimiter, INTERACTIVE, BATCH, PREFETCH
+from scheduler import RequestScheduler
+
+
+def Scheduler(limit, seconds):
+  """
+  RequestScheduler over one key whose limiter is blocked for 0.3 seconds, so every ticket is queued before the first grant
+  """
+  scheduler = RequestScheduler('test', ['key'])
+  limiter = scheduler.limiters['key'] = RateLimiter(((limit, seconds),), 0.0)
+  limiter.Update({'Retry-After': '0.3'}, 429)
+  return scheduler
+
+def Grants(scheduler, priorities, stagger=0.005):
+  """
+  Returns the priority of every ticket in the order they were granted
+  """
+  grants = []
+  lock = threading.Lock()
+
+  def Run(priority):
+    scheduler.Acquire('match', priority)
+    with lock:
+      grants.append(priority)
+
+  threads = []
+  for priority in priorities:
+    thread = threading.Thread(target=Run, args=(priority,))
+    thread.start()
+    threads.append(thread)
+    time.sleep(stagger)
+  for thread in threads:
+    thread.join(10)
+  return grants
+
+
+def test_prefetch_never_granted_while_interactive_waits():
+  scheduler = Scheduler(1, 0.03)
+  grants = Grants(scheduler, [PREFETCH] * 3 + [INTERACTIVE] * 6)
+  assert grants == [INTERACTIVE] * 6 + [PREFETCH] * 3
+
+def test_interactive_and_batch_share_by_weight():
+  scheduler = Scheduler(1, 0.03)
+  grants = Grants(scheduler, [BATCH] * 9 + [INTERACTIVE] * 9)
+  assert grants[:9].count(INTERACTIVE) == 6
+  assert sorted(grants) == sorted([BATCH] * 9 + [INTERACTIVE] * 9)
+
+def test_prefetch_uses_idle_capacity():
+  scheduler = RequestScheduler('test', ['key'])
+  scheduler.limiters['key'] = RateLimiter(((10, 1),), 0.0)
+  for _ in range(5):
+    key, waited = scheduler.Acquire('match', PREFETCH)
+    assert key == 'key'
+  assert scheduler.Stats()['keys']['key0']['requests'] == 5
+
+def test_prefetch_share_leaves_headroom():
+  scheduler = RequestScheduler('test', ['key'])
+  limiter = scheduler.limiters['key'] = RateLimiter(((10, 60),), 0.0)
+  for _ in range(5):
+    scheduler.Acquire('match', PREFETCH)
+  # the prefetch half of the window is used up, interactive requests still get the other half
+  assert limiter.TryAcquire('match', 0.5) > 0
+  for _ in range(5):
+    scheduler.Acquire('match', INTERACTIVE)
+  assert limiter.TryAcquire('match') > 0
+
+def test_requests_spread_over_keys():
+  scheduler = RequestScheduler('test', ['a', 'b'])
+  for key in ('a', 'b'):
+    scheduler.limiters[key] = RateLimiter(((3, 60),), 0.0)
+  keys = [scheduler.Acquire('match', BATCH)[0] for _ in range(6)]
+  assert sorted(keys) == ['a'] * 3 + ['b'] * 3
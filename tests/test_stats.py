@@ -0,0 +1,63 @@
+import pytest
+
+import stats
+from benchmarks.fake_riot_api import World
+from match_decoder import DecodeMatch
+from match_store import MatchStore
+from matchup_index import MatchupIndex
+
+
+@pytest.fixture
+def stored(tmp_path, monkeypatch):
+  """
+  Returns a function storing the synthetic games of the given gameIds in a fresh match store and index
+  """
+  store = MatchStore(str(tmp_path / 'match_store.db'))
+  index = MatchupIndex(str(tmp_path / 'match_store.db'))
+  monkeypatch.setattr(stats, 'GetMatchStore', lambda: store)
+  monkeypatch.setattr(stats, 'GetMatchupIndex', lambda: index)
+  world = World()
+
+  def Store(game_ids):
+    for game_id in game_ids:
+      match = DecodeMatch(world.Match(game_id))
+      store.Put('na1', match)
+      index.Add('na1', match)
+    return store, index
+  return Store
+
+def Pair(match):
+  player = match.participants[0]
+  enemy = next(p for p in match.participants if p.team_id != player.team_id)
+  return player.champion_id, enemy.champion_id
+
+def test_stored_columns_only_decode_new_games(stored, monkeypatch):
+  store, index = stored(range(150))
+  champion_id, enemy_champion_id = Pair(store.Get('na1', 0))
+  columns = stats.StoredColumns()
+
+  first = columns.Get('na1', champion_id, enemy_champion_id)
+  game_ids = sorted(index.Lookup('na1', champion_id, enemy_champion_id), reverse=True)
+  assert first.game_id.tolist() == game_ids
+  expected = stats.MatchupStats(stats._Matchups('na1', champion_id, enemy_champion_id, game_ids))
+  assert stats.MatchupStats(first) == expected
+
+  stored(range(150, 300))
+  decoded = []
+  matchups = stats._Matchups
+  def Matchups(region, champion_id, enemy_champion_id, game_ids):
+    decoded.extend(game_ids)
+    return matchups(region, champion_id, enemy_champion_id, game_ids)
+  monkeypatch.setattr(stats, '_Matchups', Matchups)
+  second = columns.Get('na1', champion_id, enemy_champion_id)
+
+  game_ids = sorted(index.Lookup('na1', champion_id, enemy_champion_id), reverse=True)
+  assert second.game_id.tolist() == game_ids
+  assert decoded and all(game_id >= 150 for game_id in decoded)
+  assert columns.Get('na1', champion_id, enemy_champion_id, limit=3).game_id.tolist() == game_ids[:3]
+
+def test_stored_columns_of_an_unknown_matchup_are_empty(stored):
+  stored(range(10))
+  columns = stats.StoredColumns().Get('na1', 1, 2)
+  assert len(columns) == 0
+  assert stats.MatchupStats(columns) == {'games': 0}
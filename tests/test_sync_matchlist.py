@@ -0,0 +1,172 @@
+import time
+import types
+
+import pytest
+
+import riot_endpoints
+from benchmarks.fake_riot_api import Serve, World, FIRST_GAME, GAME_SPACING
+from match_store import MatchStore
+from matchup_index import MatchupIndex
+from rate_limiter import RateLimiter
+from response_cache import ResponseCache
+from riot_endpoints import Wrapper, MATCHLIST_PAGE
+from scheduler import RequestScheduler
+from sync_state import SyncState
+
+SUMMONER = 'sync tester'
+DARIUS = 122
+DAY = 24 * 3600 * 1000
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+  """
+  Fake Riot api over a world whose games can be extended, a fresh sync state and a clock set in epoch milliseconds
+  """
+  monkeypatch.chdir(tmp_path)
+  world = World(games=1000)
+  server, base = Serve(world=world, app_limits='100000:10', method_limits='100000:10')
+  monkeypatch.setenv('RIOT_API_BASE', base)
+  sync = SyncState(str(tmp_path / 'sync.db'))
+  store = MatchStore(str(tmp_path / 'match_store.db'))
+  index = MatchupIndex(str(tmp_path / 'match_store.db'))
+  clock = {'now': 0}
+  monkeypatch.setattr(riot_endpoints, 'time', types.SimpleNamespace(
+    time=lambda: clock['now'] / 1000, sleep=time.sleep, perf_counter=time.perf_counter, monotonic=time.monotonic))
+
+  def Query():
+    info = Wrapper('na1', SUMMONER, 'Darius', 'Garen')
+    info.sync, info.store, info.index = sync, store, index
+    # the matchlists of every sync are requested, never answered from the response cache
+    info.cache = ResponseCache(None, ttls={})
+    info.scheduler = RequestScheduler('na1', ['test'])
+    info.scheduler.limiters['test'] = RateLimiter(((100000, 1),), 0.0)
+    return info
+
+  yield types.SimpleNamespace(world=world, server=server, sync=sync, clock=clock, Query=Query)
+  server.shutdown()
+
+def Newest(world):
+  """
+  Returns the timestamp of the newest game of the world
+  """
+  return FIRST_GAME + (world.games - 1) * GAME_SPACING
+
+def Expected(world, account_id):
+  """
+  Returns every gameId of the Darius matchlist of account_id, newest first
+  """
+  game_ids = []
+  while True:
+    page = world.Matchlist(account_id, DARIUS, len(game_ids))['matches']
+    game_ids.extend(m['gameId'] for m in page)
+    if len(page) < MATCHLIST_PAGE:
+      return game_ids
+
+def Sync(api):
+  info = api.Query()
+  match_info = info.MatchInfo()
+  assert info.status == 200
+  return info, [m['gameId'] for m in match_info['matches']]
+
+def Requests(api):
+  return api.server.requests.get('matchlist', 0)
+
+
+def test_first_sync_stores_the_first_page(api):
+  api.clock['now'] = Newest(api.world) + DAY
+  info, game_ids = Sync(api)
+  expected = Expected(api.world, info.account_id)
+  assert game_ids == expected[:MATCHLIST_PAGE]
+
+  stored, last_timestamp, exhausted = api.sync.Get(info.sync_key)
+  assert stored == game_ids
+  assert last_timestamp == FIRST_GAME + (game_ids[0] % 100000) * GAME_SPACING
+  assert exhausted == (len(expected) < MATCHLIST_PAGE)
+
+def test_new_games_inside_the_window_are_asked_with_begin_time(api):
+  api.clock['now'] = Newest(api.world) + DAY
+  info, first = Sync(api)
+
+  # nothing played since, one request answered with an empty page
+  requests = Requests(api)
+  assert Sync(api)[1] == first
+  assert Requests(api) == requests + 1
+
+  api.world.games += 100
+  api.clock['now'] = api.sync.Get(info.sync_key)[1] + DAY
+  requests = Requests(api)
+  info, game_ids = Sync(api)
+  expected = Expected(api.world, info.account_id)
+  new = [game_id for game_id in expected if game_id not in first]
+  assert new and game_ids == new + first
+  assert Requests(api) == requests + 1
+  assert api.sync.Get(info.sync_key)[0] == game_ids
+
+def test_more_than_a_page_of_new_games_inside_the_window_is_paged(api):
+  api.clock['now'] = Newest(api.world) + DAY
+  info, first = Sync(api)
+
+  api.world.games += 3000
+  api.clock['now'] = api.sync.Get(info.sync_key)[1] + DAY
+  requests = Requests(api)
+  info, game_ids = Sync(api)
+  expected = Expected(api.world, info.account_id)
+  new = [game_id for game_id in expected if game_id not in first]
+  assert len(new) > MATCHLIST_PAGE
+  assert game_ids == new + first
+  assert Requests(api) == requests + 2
+
+def test_new_games_after_the_window_are_merged_with_the_newest_page(api):
+  api.clock['now'] = Newest(api.world) + DAY
+  info, first = Sync(api)
+
+  api.world.games += 200
+  api.clock['now'] = Newest(api.world) + 30 * DAY
+  info, game_ids = Sync(api)
+  expected = Expected(api.world, info.account_id)
+  new = [game_id for game_id in expected if game_id not in first]
+  assert new and game_ids == new + first
+
+def test_more_than_a_page_of_new_games_after_the_window_resets_the_stored_matchlist(api):
+  api.clock['now'] = Newest(api.world) + DAY
+  info, first = Sync(api)
+
+  api.world.games += 3000
+  api.clock['now'] = Newest(api.world) + 30 * DAY
+  info, game_ids = Sync(api)
+  expected = Expected(api.world, info.account_id)
+  # the stored games no longer follow on from the newest page, they are dropped
+  assert game_ids == expected[:MATCHLIST_PAGE]
+  stored, _, exhausted = api.sync.Get(info.sync_key)
+  assert stored == game_ids and not exhausted
+
+def test_scanning_past_the_stored_matchlist_extends_it(api):
+  api.world.games = 6000
+  api.clock['now'] = Newest(api.world) + DAY
+  info, first = Sync(api)
+  assert len(first) == MATCHLIST_PAGE
+
+  info = api.Query()
+  info.max_scan = 150
+  for _ in info.IterMatchBreakdown(info.MatchInfo()):
+    pass
+  assert info.status == 200 and info.scanned == 150
+
+  expected = Expected(api.world, info.account_id)
+  assert api.sync.Get(info.sync_key)[0] == expected[:2 * MATCHLIST_PAGE]
+
+
+def test_extend_only_appends_contiguous_pages(tmp_path):
+  sync = SyncState(str(tmp_path / 'sync.db'))
+  key = ('na1', 'account', DARIUS, 420)
+  sync.Extend(key, 0, [1, 2], False)
+  assert sync.Get(key) is None
+
+  sync.Save(key, [9, 8, 7], 1000, False)
+  sync.Extend(key, 2, [6, 5], False)
+  sync.Extend(key, 4, [6, 5], True)
+  assert sync.Get(key) == ([9, 8, 7], 1000, False)
+
+  sync.Extend(key, 3, [6, 5], True)
+  assert sync.Get(key) == ([9, 8, 7, 6, 5], 1000, True)